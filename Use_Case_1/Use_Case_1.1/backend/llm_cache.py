@@ -0,0 +1,214 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = "./Use_Case_1/Use_Case_1.1/backend/llm_cache"  # Eine JSON-Datei pro Antwort, None = nur im Speicher
+CACHE_MAX_ENTRIES = 1000  # Antworten im Speicher, darüber wird die am längsten ungenutzte verdrängt
+CACHE_MAX_DISK_ENTRIES = 20000  # Antworten auf der Festplatte
+CACHE_TTL = 7 * 24 * 3600  # Sekunden, nach denen eine Antwort nicht mehr verwendet wird
+DISK_PRUNE_INTERVAL = 100  # Nach so vielen neuen Antworten wird der Festplatten-Cache aufgeräumt
+
+# Anfrageparameter, die die Antwort nicht verändern und daher nicht zum Schlüssel gehören
+IGNORED_PARAMETERS = {"stream", "cache_prompt", "prompt_cache_key", "id_slot"}
+
+
+def cache_key(payload):
+    """
+    Returns the content address of a request.
+
+    The key covers model, system prompt, user prompt and all sampling parameters;
+    transport options such as streaming and prefix cache hints are left out.
+
+    Args:
+        payload (dict): The Chat Completions payload, optionally with further fields
+            that distinguish the answer (e.g. the verdict mode).
+
+    Returns:
+        str: The SHA-256 hash of the canonical JSON of the payload.
+    """
+    relevant = {key: value for key, value in payload.items() if key not in IGNORED_PARAMETERS}
+    canonical = json.dumps(relevant, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """In-memory LRU cache of LLM answers backed by one JSON file per answer."""
+
+    def __init__(self, directory=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES, max_disk_entries=CACHE_MAX_DISK_ENTRIES,
+                 ttl=CACHE_TTL):
+        """
+        Initializes an empty memory cache on top of the disk cache.
+
+        Args:
+            directory (str, optional): The directory of the disk cache, None to keep answers in memory only.
+                Defaults to CACHE_DIR.
+            max_entries (int, optional): The number of answers kept in memory. Defaults to CACHE_MAX_ENTRIES.
+            max_disk_entries (int, optional): The number of answers kept on disk. Defaults to CACHE_MAX_DISK_ENTRIES.
+            ttl (float, optional): Seconds an answer stays valid, None for no expiry. Defaults to CACHE_TTL.
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # Schlüssel -> (Zeitpunkt, Antwort), zuletzt genutzt am Ende
+        self.lock = threading.Lock()
+        self.puts_since_prune = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0, "stores": 0}
+
+    def get(self, key):
+        """
+        Returns a cached answer.
+
+        Args:
+            key (str): The key returned by cache_key.
+
+        Returns:
+            The cached answer, or None if there is no valid one.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if self._valid(entry[0]):
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry[1]
+                del self.entries[key]
+                if not self.directory:
+                    self.stats["expired"] += 1  # Sonst zählt _read den Eintrag und löscht die Datei
+        entry = self._read(key)
+        with self.lock:
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self.stats["disk_hits"] += 1
+            self._remember(key, entry)
+        return entry[1]
+
+    def put(self, key, value):
+        """
+        Stores an answer in memory and on disk.
+
+        Args:
+            key (str): The key returned by cache_key.
+            value: The JSON-serialisable answer.
+        """
+        entry = (time.time(), value)
+        with self.lock:
+            self._remember(key, entry)
+            self.stats["stores"] += 1
+            self.puts_since_prune += 1
+            prune = self.puts_since_prune >= DISK_PRUNE_INTERVAL
+            if prune:
+                self.puts_since_prune = 0
+        self._write(key, entry)
+        if prune:
+            self._prune_disk()
+
+    def clear(self):
+        """Removes all answers from memory and disk."""
+        with self.lock:
+            self.entries.clear()
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.directory, name))
+
+    def snapshot(self):
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            dict: Hits, disk hits, misses, expired entries, evictions, stores and the number of entries in memory.
+        """
+        with self.lock:
+            return {**self.stats, "entries": len(self.entries)}
+
+    def _valid(self, created):
+        """Checks the TTL of an entry."""
+        return self.ttl is None or time.time() - created < self.ttl
+
+    def _remember(self, key, entry):
+        """Inserts an entry into the memory cache and evicts the least recently used ones; the lock must be held."""
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read(self, key):
+        """Reads a valid entry from disk, or None."""
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            created, value = data["created"], data["value"]
+            valid = self._valid(created)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Cache-Eintrag {key} konnte nicht gelesen werden: {e}")
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            # Beschädigte oder unvollständige Datei, der Aufruf geht stattdessen an das Modell
+            logger.warning(f"Cache-Eintrag {key} ist ungültig und wird entfernt: {e!r}")
+            self._remove(path)
+            return None
+        if not valid:
+            with self.lock:
+                self.stats["expired"] += 1
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)  # Änderungszeit dient als Zeitpunkt der letzten Nutzung
+        except OSError:
+            pass  # Zwischenzeitlich von einem anderen Prozess entfernt, der gelesene Eintrag bleibt gültig
+        return created, value
+
+    def _write(self, key, entry):
+        """Writes an entry to disk atomically."""
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"created": entry[0], "value": entry[1]}, f, ensure_ascii=False)
+            os.replace(temp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"Cache-Eintrag {key} konnte nicht gespeichert werden: {e}")
+
+    def _prune_disk(self):
+        """Deletes the least recently used files beyond max_disk_entries."""
+        try:
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".json")]
+            excess = len(paths) - self.max_disk_entries
+            if excess <= 0:
+                return
+            paths.sort(key=os.path.getmtime)
+            for path in paths[:excess]:
+                self._remove(path)
+            with self.lock:
+                self.stats["evictions"] += excess
+            logger.debug(f"{excess} Einträge aus dem Festplatten-Cache entfernt.")
+        except OSError as e:
+            logger.warning(f"Festplatten-Cache konnte nicht aufgeräumt werden: {e}")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,11 +1,16 @@
 import json
 import os
 from flask import Flask, request, jsonify
-from chromadb import PersistentClient
 import logging
+import threading
+import time
 from agent import AgentSystem
-from chatAgent import ChatAgent
-from duckduckgo import DuckDuckGoSearch
+from chatAgent import DEFAULT_CHAT_SESSION, ChatAgent
+from duckduckgo import search as web_search
+from checkpoints import list_checkpoints, load_checkpoint
+from jobs import JobManager
+from ollama import get_llm_client
+from storage import delete_session, get_vectorstore, list_sessions, storage_ready
 
 
 
@@ -16,52 +21,159 @@ logging.basicConfig(
     encoding='utf-8'
 )
 
-# Initialisiere Chroma mit persistentem Speicher
-client = PersistentClient(path="./Use_Case_1/Use_Case_1.2/backend/chroma_storage")
-
-# Erstelle oder erhalte eine Sammlung (Collection)
-vectorstore = client.get_or_create_collection(
-    name="conversation_context"
-)
 logger = logging.getLogger(__name__)
 
 # Flask-Setup
 app = Flask(__name__)
 
+# Buch-Generierungen laufen als Hintergrund-Jobs, die Anfrage kehrt sofort zurück
+jobs = JobManager()
+
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """
+    Readiness probe of the backend.
+
+    The backend answers as soon as the server accepts requests; the vector store is
+    opened in the background or on first use and its state is reported separately.
+
+    Returns:
+        JSON: {"status": "ok", "storage": "ready" | "loading"} with status code 200.
+    """
+    return jsonify({"status": "ok", "storage": "ready" if storage_ready() else "loading"}), 200
+
 
 @app.route('/api/generate', methods=['POST'])
 def generate():
     """
     Handle a request to generate a response based on user input.
     This function processes a JSON request containing user input and optional
-    parameters for minimum chapter and subchapter. It logs the received request,
-    passes the input to the AgentSystem to generate a response, and returns the
-    result as a JSON response. If an error occurs during processing, it logs the
-    error and returns a JSON error message with a 500 status code.
+    parameters for minimum chapter and subchapter and the evaluation mode. It logs the received request,
+    submits the AgentSystem pipeline as a background job, and returns the job ID
+    with a 202 status code. Progress and result can be polled at /api/jobs/<job_id>.
+    If the job cannot be submitted, it logs the error and returns a JSON error
+    message with a 500 status code.
     Returns:
-        Response: A JSON response containing the result or an error message.
-    Raises:
-        ValueError: If the response structure from the AgentSystem is incomplete.
+        Response: A JSON response containing the job ID or an error message.
     """
     try:
         data = request.get_json()
         user_input = data.get("user_input", "")
         min_chapter = data.get("min_chapter", 0)  # min_chapter erfassen
         min_subchapter = data.get("min_subchapter", 0)  # min_subchapter erfassen
+        evaluation_mode = data.get("evaluation_mode")  # "separate", "combined" oder "chunked", sonst Standard
         logger.info(f"Received request: user_input={user_input}, min_chapter={min_chapter}")
         
-        # min_chapter an run_agents übergeben
-        agent_system = AgentSystem()
-        result = agent_system.run_agents(user_input, min_chapter=min_chapter, min_subchapter=min_subchapter)
-        if not result:
-            raise ValueError("Die Antwortstruktur ist unvollständig.")
-        
-        logger.info(f"Result: {result}")
-        return jsonify(result)
+        # Pipeline im Hintergrund starten, min_chapter an run_agents übergeben
+        job_id = jobs.submit(
+            AgentSystem().run_agents,
+            user_input,
+            min_chapter=min_chapter,
+            min_subchapter=min_subchapter,
+            evaluation_mode=evaluation_mode
+        )
+        logger.info(f"Job erstellt: {job_id}")
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
     except Exception as e:
         logger.error(f"Error during request processing: {e}")
         return jsonify({"error": f"Fehler: {str(e)}"}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Returns the state of a book generation job.
+    The response contains the status ("queued", "running", "completed" or "failed"),
+    the current phase of the pipeline, its progress details, and the result or error
+    once the job has finished.
+    Args:
+        job_id (str): The ID returned by /api/generate.
+    Returns:
+        JSON: The job state, or an error message with status code 404 if the job is unknown.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} nicht gefunden."}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """
+    Lists all known jobs without their results.
+    Returns:
+        JSON: A list of job states.
+    """
+    return jsonify(jobs.list())
+
+@app.route('/api/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """
+    Resumes an interrupted book generation from its checkpoint.
+    Completed steps (synopsis, chapter structure, written subchapters, summary and
+    evaluations) are taken from the checkpoint, only the missing ones are run again.
+    Args:
+        job_id (str): The ID of the interrupted job.
+    Returns:
+        JSON: The job ID with status code 202, or an error message with status code 404 if the
+        job has no checkpoint or 409 if it is still running.
+    """
+    if load_checkpoint(job_id) is None:
+        return jsonify({"error": f"Kein Checkpoint für Job {job_id} gefunden."}), 404
+    try:
+        jobs.submit(AgentSystem().resume_agents, job_id=job_id)
+    except ValueError as e:
+        return jsonify({"error": f"Fehler: {str(e)}"}), 409
+    logger.info(f"Job fortgesetzt: {job_id}")
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@app.route('/api/checkpoints', methods=['GET'])
+def checkpoints():
+    """
+    Lists the saved checkpoints, e.g. to find jobs interrupted by a restart.
+    Returns:
+        JSON: One entry per job with status, parameters, completed phases and last update.
+    """
+    return jsonify(list_checkpoints())
+
+@app.route('/api/llm_stats', methods=['GET'])
+def llm_stats():
+    """
+    Returns the load of the LLM scheduler and the counters of the response cache.
+    Returns:
+        JSON: "scheduler" with active and waiting calls, "cache" with hits, misses and evictions
+        (None if caching is disabled).
+    """
+    client = get_llm_client()
+    cache = client.response_cache.snapshot() if client.response_cache else None
+    return jsonify({"scheduler": client.scheduler.snapshot(), "cache": cache})
+
+@app.route('/api/sessions', methods=['GET'])
+def sessions():
+    """
+    Lists the sessions stored in the vector store.
+
+    Returns:
+        JSON: One entry per session with session ID, job ID, number of documents and last update.
+    """
+    return jsonify(list_sessions())
+
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+def remove_session(session_id):
+    """
+    Deletes all documents of a session, e.g. of a finished book or a chat.
+
+    Args:
+        session_id (str): The session to delete.
+
+    Returns:
+        JSON: The number of deleted documents, or an error with status code 404 if the session is unknown.
+    """
+    deleted = delete_session(session_id)
+    if not deleted:
+        return jsonify({"error": f"Sitzung {session_id} nicht gefunden."}), 404
+    return jsonify({"session_id": session_id, "deleted": deleted})
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """
@@ -75,16 +187,20 @@ def chat():
     6. Checks if the response is valid and contains the expected structure.
     7. Logs the result and returns it as a JSON response.
     8. Handles any exceptions that occur during the process, logs the error, and returns an error response.
+    The optional fields session_id and job_id select the chat session and the book
+    whose documents are used as context.
     Returns:
         Response: A JSON response containing the chat result or an error message.
     """
     try:
         data = request.get_json()
         user_input = data.get("user_input", "")
-        logger.info(f"Received chat request: user_input={user_input}")
+        session_id = data.get("session_id") or DEFAULT_CHAT_SESSION  # Chatverlauf dieses Clients
+        job_id = data.get("job_id")  # Buch, über das gesprochen wird
+        logger.info(f"Received chat request: user_input={user_input}, session_id={session_id}, job_id={job_id}")
         
         # Chat-Agent erstellen
-        chat_agent = ChatAgent(vectorstore)
+        chat_agent = ChatAgent(get_vectorstore(), session_id=session_id, job_id=job_id)
         result = chat_agent.chat(user_input)
 
         if not result or "final_response" not in result:
@@ -118,23 +234,11 @@ def search():
     try:
         # Anfrage-Daten verarbeiten
         data = request.get_json()
-        request_input = data.get("request_input", "").strip()
-        if not request_input:
-            raise ValueError("Die Suchanfrage ist leer. Bitte einen gültigen Suchbegriff angeben.")
-
-        request_input = request_input.replace('"', '').replace("'", "").strip()
-
+        request_input = data.get("request_input", "")
         logger.info(f"Received search request: request_input={request_input}")
 
-        # DuckDuckGo-Suche durchführen
-        search_agent = DuckDuckGoSearch()
-        result = search_agent.perform_search(query=request_input)
-
-        # Überprüfen, ob Ergebnisse vorhanden sind
-        if not result or not result.get("results"):
-            logger.warning("Keine relevanten Ergebnisse gefunden.")
-            return jsonify({"results": [], "message": "Keine relevanten Ergebnisse gefunden."})
-
+        # DuckDuckGo-Suche über denselben Dienst wie die Agenten durchführen
+        result = web_search(request_input)
         logger.info(f"Search Result: {result}")
         return jsonify(result)
 
@@ -203,5 +307,16 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+def warm_up():
+    """Opens the vector store in the background, so the first request does not have to wait for it."""
+    start = time.monotonic()
+    try:
+        get_vectorstore()
+        logger.info(f"Vektorspeicher in {time.monotonic() - start:.2f} s geöffnet.")
+    except Exception as e:
+        logger.error(f"Fehler beim Öffnen des Vektorspeichers: {e}")
+
+
 if __name__ == "__main__":
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
     app.run(host="0.0.0.0", port=5000)
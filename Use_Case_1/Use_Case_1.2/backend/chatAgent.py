@@ -1,9 +1,9 @@
 from datetime import datetime
 import logging
 
-from chromadb import PersistentClient
-
+from context_builder import CHAT_KIND_PRIORITIES, CONTEXT_TOKEN_BUDGET, build_context, estimate_tokens, kind_for_label
 from ollama import OllamaLLM
+from storage import get_vectorstore, next_document_id
 
 
 logging.basicConfig(
@@ -13,24 +13,26 @@ logging.basicConfig(
     encoding='utf-8'
 )
 
-# Initialisiere Chroma mit persistentem Speicher
-client = PersistentClient(path="./Use_Case_1/Use_Case_1.2/backend/chroma_storage")
-
-# Erstelle oder erhalte eine Sammlung (Collection)
-vectorstore = client.get_or_create_collection(
-    name="conversation_context"
-)
 logger = logging.getLogger(__name__)
 
+DEFAULT_CHAT_SESSION = "chat"  # Sitzung des Chats, wenn der Client keine eigene angibt
+
 class ChatAgent:
-    def __init__(self, vectorstore):
+    def __init__(self, vectorstore=None, session_id=DEFAULT_CHAT_SESSION, job_id=None):
         """
         Initializes the ChatAgent with a given vector store.
 
         Args:
-            vectorstore: The vector store to be used by the ChatAgent.
+            vectorstore (BufferedCollection, optional): The vector store to be used by the ChatAgent.
+                Defaults to the shared collection of storage.py.
+            session_id (str, optional): The chat session whose messages are stored and read.
+                Defaults to DEFAULT_CHAT_SESSION.
+            job_id (str, optional): The book job the chat is about; its documents are added to the context.
+                Defaults to None.
         """
-        self.vectorstore = vectorstore
+        self.vectorstore = vectorstore if vectorstore is not None else get_vectorstore()
+        self.session_id = session_id
+        self.job_id = job_id
 
     def chat(self, user_input):
         """
@@ -93,30 +95,24 @@ class ChatAgent:
 
     def get_next_document_id(self):
         """
-        Determines the next document ID based on the number of stored documents.
+        Allocates the next document ID without reading the collection.
 
-        This method retrieves all stored data from the vector store and calculates
-        the next document ID by counting the existing IDs. If an error occurs during
-        data retrieval, it logs the error and returns "1" as a fallback ID.
+        The IDs come from the process-wide allocator in storage.py, so concurrent
+        stores never receive the same ID and cannot overwrite each other.
 
         Returns:
             str: The next document ID as a string.
         """
-        """Ermittelt die nächste ID basierend auf der Anzahl der gespeicherten Dokumente."""
-        try:
-            all_data = self.vectorstore.get()  # Alle Daten abrufen
-            existing_ids = all_data.get("ids", [])
-            return str(len(existing_ids) + 1)
-        except Exception as e:
-            logger.error(f"Fehler beim Abrufen der nächsten ID: {e}")
-            return "1"  # Fallback auf ID "1", falls ein Fehler auftritt
+        return next_document_id()
 
-    def store_context(self, label, data):
+    def store_context(self, label, data, kind=None, **extra_metadata):
         """
         Stores the context in ChromaDB with a sequential ID.
         Args:
             label (str): The label associated with the context data.
             data (str): The context data to be stored.
+            kind (str, optional): The kind of entry used to prioritise it in the context. Derived from the label if not given.
+            **extra_metadata: Additional metadata stored with the entry.
         Raises:
             Exception: If there is an error while storing the context.
         Logs:
@@ -126,58 +122,84 @@ class ChatAgent:
         """
         try:
             doc_id = self.get_next_document_id()  # Zugriff auf die Instanzmethode
-            metadata = {"timestamp": datetime.now().isoformat()}
+            metadata = {
+                "timestamp": datetime.now().isoformat(),
+                "kind": kind or kind_for_label(label),
+                "session_id": self.session_id,
+                **{key: str(value) for key, value in extra_metadata.items()}
+            }
             logger.info(f"Speichere Kontext: {label} -> {data} (ID: {doc_id})")  # Nur die ersten 100 Zeichen loggen
 
-            # Dokument speichern
-            self.vectorstore.upsert(
+            # Dokument speichern; Chatverläufe werden nur nach Metadaten gelesen und brauchen kein Embedding
+            self.vectorstore.add(
                 documents=[f"{label}: {data}"],
                 ids=[doc_id],
-                metadatas=[metadata]
+                metadatas=[metadata],
+                embed=False
             )
             logger.debug("Speichern erfolgreich.")
         except Exception as e:
             logger.error(f"Fehler beim Speichern des Kontexts: {e}")
 
-    def get_context(self):
+    def context_where(self):
         """
-        Retrieves the stored context from ChromaDB.
+        Returns the metadata filter of the chat context.
 
-        This method queries all documents from the collection in the vector store.
-        If successful, it returns the concatenated documents as a single string.
-        If an error occurs, it logs the error and returns a default context message.
+        Returns:
+            dict: The where clause selecting the messages of this chat session and, if a job
+                is given, the documents of its book.
+        """
+        session_filter = {"session_id": self.session_id}
+        return {"$or": [session_filter, {"job_id": self.job_id}]} if self.job_id else session_filter
+
+    def get_context(self, max_tokens=CONTEXT_TOKEN_BUDGET):
+        """
+        Retrieves the stored context from ChromaDB within a token budget.
+
+        The entries are prioritised (previous chat messages, synopsis, chapter outline,
+        summaries, search results) and added until the budget is used up, so the prompt
+        size stays bounded regardless of the size of the collection.
+
+        Args:
+            max_tokens (int, optional): The token budget of the context. Defaults to CONTEXT_TOKEN_BUDGET.
 
         Returns:
-            str: The concatenated documents or a default context message if an error occurs.
+            str: The selected documents separated by newlines or a default context message if an error occurs.
         """
         try:
             logger.debug("Abfrage aller Dokumente aus der Collection.")
-            results = self.vectorstore.get()  # Alle Dokumente abrufen
+            results = self.vectorstore.get(where=self.context_where(), include=["documents", "metadatas"])  # Dokumente samt Art abrufen
             documents = results.get("documents", [])
-            logger.info(f"Kontext erfolgreich abgerufen: {len(documents)} Dokument(e) gefunden.")
-            return "\n".join(documents)
+            context = build_context(documents, results.get("metadatas"), max_tokens, priorities=CHAT_KIND_PRIORITIES)
+            logger.info(f"Kontext erfolgreich abgerufen: {len(documents)} Dokument(e) gefunden, {estimate_tokens(context)} Tokens verwendet.")
+            return context
         except Exception as e:
             logger.error(f"Fehler beim Abrufen des Kontexts: {e}")
             return "Standardkontext: Keine vorherigen Daten gefunden."
 
-    def get_context_all(self):
+    def get_context_all(self, max_tokens=CONTEXT_TOKEN_BUDGET):
         """
-        Retrieves all documents from the vector store.
-        This method attempts to fetch all documents stored in the vector store collection.
-        If no documents are found, it logs a warning and returns a message indicating that no documents are available.
-        If documents are successfully retrieved, it logs the number of documents and returns them as a single string, 
-        with each document separated by a newline character.
+        Retrieves the prioritised documents from the vector store within a token budget.
+
+        If no documents are found, a warning is logged and a message indicating
+        the absence of documents is returned.
+
+        Args:
+            max_tokens (int, optional): The token budget of the context. Defaults to CONTEXT_TOKEN_BUDGET.
+
         Returns:
-            str: A string containing all documents separated by newlines, or a message indicating no documents are available.
+            str: The selected documents separated by newlines, or a message indicating that
+                 no documents are available or an error occurred.
         """
         try:
-            results = self.vectorstore.get()  # Alle Daten aus der Collection abrufen
+            results = self.vectorstore.get(where=self.context_where(), include=["documents", "metadatas"])  # Chat und Buch abrufen
             documents = results.get("documents", [])
             if not documents:
                 logger.warning("Keine gespeicherten Dokumente gefunden.")
                 return "Keine gespeicherten Dokumente verfügbar."
-            logger.info(f"{len(documents)} Dokument(e) erfolgreich abgerufen.")
-            return "\n".join(documents)
+            context = build_context(documents, results.get("metadatas"), max_tokens, priorities=CHAT_KIND_PRIORITIES)
+            logger.info(f"{len(documents)} Dokument(e) erfolgreich abgerufen, {estimate_tokens(context)} Tokens verwendet.")
+            return context
         except Exception as e:
             logger.error(f"Fehler beim Abrufen aller Dokumente: {e}")
             return "Standardkontext: Keine Dokumente gefunden."
@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import copy
+from datetime import datetime
+import logging
+import threading
+import uuid
+
+from scheduler import PRIORITY_BATCH, request_context
+
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_JOBS = 4  # Gleichzeitig laufende Buch-Generierungen, ihre LLM-Aufrufe teilt der Scheduler fair auf
+MAX_FINISHED_JOBS = 100  # Abgeschlossene Jobs, die noch abgefragt werden können
+
+
+class JobManager:
+    """Runs long pipelines as background jobs and keeps their state for polling."""
+
+    def __init__(self, max_workers=MAX_CONCURRENT_JOBS, max_finished=MAX_FINISHED_JOBS):
+        """
+        Initializes the manager with its own worker pool.
+
+        Args:
+            max_workers (int): The number of jobs running at the same time; further jobs wait in the queue.
+            max_finished (int): The number of finished jobs kept for polling, older ones are dropped.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.max_finished = max_finished
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, function, *args, job_id=None, **kwargs):
+        """
+        Queues a job and returns immediately.
+
+        The function is called with the additional keyword arguments `job_id` and `progress`,
+        a callback `progress(phase, **details)` that updates the phase and progress of the job.
+        Its LLM calls are queued by the scheduler as batch calls of this job.
+
+        Args:
+            function (callable): The pipeline to run, e.g. AgentSystem().run_agents.
+            *args: Positional arguments for the function.
+            job_id (str, optional): The ID to run the job under, e.g. to resume an earlier job. Defaults to a new ID.
+            **kwargs: Keyword arguments for the function.
+
+        Returns:
+            str: The ID of the job.
+
+        Raises:
+            ValueError: If a job with the given ID is still queued or running.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        with self.lock:
+            if self.jobs.get(job_id, {}).get("status") in ("queued", "running"):
+                raise ValueError(f"Job {job_id} läuft bereits.")
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "phase": None,
+                "progress": {},
+                "result": None,
+                "error": None,
+                "created_at": datetime.now().isoformat(),
+                "started_at": None,
+                "finished_at": None
+            }
+        self.executor.submit(contextvars.copy_context().run, self._run, job_id, function, args, kwargs)
+        logger.info(f"Job {job_id} eingereiht.")
+        return job_id
+
+    def _run(self, job_id, function, args, kwargs):
+        """Runs a job in the worker pool and records its outcome."""
+        self._update(job_id, status="running", started_at=datetime.now().isoformat())
+
+        def progress(phase, **details):
+            self._update(job_id, phase=phase, progress=details)
+
+        try:
+            with request_context(job_id, PRIORITY_BATCH):
+                result = function(*args, job_id=job_id, progress=progress, **kwargs)
+            self._update(job_id, status="completed", result=result, finished_at=datetime.now().isoformat())
+            logger.info(f"Job {job_id} abgeschlossen.")
+        except Exception as e:
+            logger.error(f"Job {job_id} fehlgeschlagen: {e}")
+            self._update(job_id, status="failed", error=f"Fehler: {str(e)}", finished_at=datetime.now().isoformat())
+        self._prune()
+
+    def _update(self, job_id, **fields):
+        """Updates the stored state of a job."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _prune(self):
+        """Drops the oldest finished jobs beyond max_finished."""
+        with self.lock:
+            finished = [job for job in self.jobs.values() if job["finished_at"]]
+            finished.sort(key=lambda job: job["finished_at"])
+            for job in finished[:max(0, len(finished) - self.max_finished)]:
+                del self.jobs[job["job_id"]]
+
+    def get(self, job_id):
+        """
+        Returns a snapshot of a job.
+
+        Args:
+            job_id (str): The ID returned by submit.
+
+        Returns:
+            dict: A copy of the job state, or None if the job is unknown.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return copy.deepcopy(job) if job is not None else None
+
+    def list(self):
+        """
+        Returns an overview of all known jobs without their results.
+
+        Returns:
+            list: One dictionary per job with ID, status, phase, progress and timestamps.
+        """
+        with self.lock:
+            return [
+                {key: copy.deepcopy(value) for key, value in job.items() if key != "result"}
+                for job in self.jobs.values()
+            ]
@@ -5,9 +5,15 @@ import shutil
 import psutil
 import sys
 import time
+import uuid
 from subprocess import Popen
 
 BASE_URL = "http://localhost:5000/api"
+REQUEST_TIMEOUT = 30  # Sekunden für einzelne Anfragen an das Backend
+JOB_POLL_INTERVAL = 5  # Sekunden zwischen zwei Statusabfragen eines Jobs
+BACKEND_START_TIMEOUT = 60  # Sekunden, die auf die Bereitschaft des Backends gewartet wird
+HEALTH_POLL_INITIAL = 0.1  # Erste Wartezeit zwischen zwei Bereitschaftsabfragen in Sekunden
+HEALTH_POLL_MAX = 2.0  # Längste Wartezeit zwischen zwei Bereitschaftsabfragen in Sekunden
 
 def stop_backend():
     """
@@ -62,13 +68,37 @@ def wait_until_backend_stopped():
             print("Backend erfolgreich gestoppt.")
             break
 
+def wait_for_backend(process=None, timeout=BACKEND_START_TIMEOUT):
+    """
+    Polls the /api/health endpoint until the backend is ready.
+    The interval between two polls starts at HEALTH_POLL_INITIAL and doubles up to HEALTH_POLL_MAX,
+    so a fast start is detected at once without flooding a slow one with requests.
+    Args:
+        process (Popen, optional): The started backend process; polling stops as soon as it exits.
+        timeout (float, optional): Seconds to wait for the backend. Defaults to BACKEND_START_TIMEOUT.
+    Returns:
+        bool: True if the backend is ready, False if it exited or did not answer in time.
+    """
+    delay = HEALTH_POLL_INITIAL
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            return False  # Backend wurde beim Start beendet
+        try:
+            if requests.get(f"{BASE_URL}/health", timeout=2).ok:
+                return True
+        except requests.RequestException:
+            pass  # Server nimmt noch keine Verbindungen an
+        time.sleep(min(delay, max(0, deadline - time.monotonic())))
+        delay = min(delay * 2, HEALTH_POLL_MAX)
+    return False
+
 def start_backend():
     """
     Starts the backend server by executing the backend.py script.
     This function attempts to start the backend server by running the backend.py script
-    located at the specified path. It waits for a short period to allow the server to
-    initialize and then checks if the server is running by sending a request to the
-    BASE_URL.
+    located at the specified path. It then polls the /api/health endpoint with
+    increasing intervals until the server is ready or the start has failed.
     Raises:
         Exception: If there is an error while starting the backend.
     Prints:
@@ -81,24 +111,53 @@ def start_backend():
     print("Backend wird gestartet...")
     backend_path = "./Use_Case_1/Use_Case_1.2/backend/backend.py"
     try:
-        Popen(["python", backend_path], stdout=sys.stdout, stderr=sys.stderr)
-        time.sleep(3)  # Kurz warten, bis das Backend hochgefahren ist
+        process = Popen(["python", backend_path], stdout=sys.stdout, stderr=sys.stderr)
 
-        # Überprüfung, ob der Server läuft
-        try:
-            requests.get(BASE_URL, timeout=5)
+        # Bereitschaft abfragen statt eine feste Zeit zu warten
+        if wait_for_backend(process):
             print("Backend erfolgreich gestartet.")
-        except requests.ConnectionError:
+        else:
             print("Fehler: Backend konnte nicht gestartet werden.")
     except Exception as e:
         print(f"Fehler beim Starten des Backends: {e}")
 
+def wait_for_job(job_id, poll_interval=JOB_POLL_INTERVAL):
+    """
+    Polls the state of a background job until it has finished.
+    Every change of the pipeline phase or of the writing progress is printed.
+    Args:
+        job_id (str): The ID returned by /api/generate.
+        poll_interval (float, optional): Seconds between two polls. Defaults to JOB_POLL_INTERVAL.
+    Returns:
+        dict: The final job state including "result" or "error".
+    Raises:
+        requests.RequestException: If the backend cannot be reached.
+    """
+    last_state = None
+    while True:
+        response = requests.get(f"{BASE_URL}/jobs/{job_id}", timeout=REQUEST_TIMEOUT)
+        job = response.json()
+        if response.status_code != 200:
+            return job
+        state = (job.get("status"), job.get("phase"), json.dumps(job.get("progress"), sort_keys=True))
+        if state != last_state:
+            progress = job.get("progress") or {}
+            step = f" ({progress['step']}/{progress['total_steps']})" if "step" in progress else ""
+            written = (f", {progress['subchapters_done']}/{progress['subchapters_total']} Unterkapitel"
+                       if "subchapters_total" in progress else "")
+            print(f"Status: {job.get('status')}, Phase: {job.get('phase') or '-'}{step}{written}")
+            last_state = state
+        if job.get("status") in ("completed", "failed"):
+            return job
+        time.sleep(poll_interval)
+
 def show_commands():
     """
     Displays a list of available commands for the chat application.
     Commands:
         - Normal inputs for the chat
         - `/book` for book generation (requires min_chapter and min_subchapter)
+        - `/resume` to resume an interrupted book generation from its checkpoint
         - `/search` for a search
         - `/save` to save the entire chat
         - `/clear` to stop the backend, delete files, and restart
@@ -108,6 +167,7 @@ def show_commands():
     print("\nVerfügbare Befehle:")
     print("  - Normale Eingaben für den Chat")
     print("  - `/book` für Buch-Generierung (min_chapter und min_subchapter)")
+    print("  - `/resume` setzt eine abgebrochene Buch-Generierung am letzten Checkpoint fort")
     print("  - `/search` für eine Suche")
     print("  - `/save` um den gesamten Chat zu speichern")
     print("  - `/clear` um Backend zu stoppen, Dateien zu löschen und neu zu starten")
@@ -124,6 +184,7 @@ def chat():
     - Enters a loop to process user inputs and commands.
     Commands:
     - /book: Starts book generation with user-defined parameters.
+    - /resume: Resumes an interrupted book generation from its checkpoint.
     - /search: Initiates a search with a user-provided query.
     - /save: Saves the chat history to a specified JSON file.
     - /clear: Stops the backend, clears logs, storage, and chat history, then restarts the backend.
@@ -155,6 +216,8 @@ def chat():
     show_commands()
 
     chat_history = []  # Liste zum Speichern des Chatverlaufs
+    chat_session = uuid.uuid4().hex  # Eigene Sitzung für die Chatnachrichten
+    book_job_id = None  # Zuletzt erzeugtes Buch, über das im Chat gesprochen wird
 
     while True:
         user_input = input("Du: ")
@@ -169,13 +232,45 @@ def chat():
                 "min_subchapter": int(min_subchapter)
             }
             try:
-                response = requests.post(f"{BASE_URL}/generate", json=payload)
-                result = response.json()
+                response = requests.post(f"{BASE_URL}/generate", json=payload, timeout=REQUEST_TIMEOUT)
+                job = response.json()
+                if "job_id" in job:
+                    # Generierung läuft im Backend, Fortschritt abfragen
+                    print(f"Job {job['job_id']} gestartet.")
+                    job = wait_for_job(job["job_id"])
+                    if job.get("status") == "completed":
+                        book_job_id = job["job_id"]
+                result = job.get("result") or {"error": job.get("error", "Unbekannter Fehler")}
                 print(f"KI: {json.dumps(result, indent=4, ensure_ascii=False)}")
                 chat_history.append({"user": prompt, "bot": result})  # Chatverlauf speichern
             except Exception as e:
                 print(f"Fehler bei der Anfrage: {e}")
 
+        elif user_input.startswith("/resume"):
+            try:
+                response = requests.get(f"{BASE_URL}/checkpoints", timeout=REQUEST_TIMEOUT)
+                unfinished = [c for c in response.json() if c.get("status") != "completed"]
+                if not unfinished:
+                    print("Keine abgebrochene Buch-Generierung gefunden.")
+                    continue
+                for checkpoint in unfinished:
+                    print(f"  {checkpoint['job_id']}  {checkpoint['updated_at']}  "
+                          f"Schritte: {', '.join(checkpoint['phases']) or '-'}  "
+                          f"Prompt: {checkpoint['params'].get('user_input', '')[:60]}")
+                job_id = input("Welcher Job soll fortgesetzt werden: ").strip()
+                response = requests.post(f"{BASE_URL}/jobs/{job_id}/resume", timeout=REQUEST_TIMEOUT)
+                job = response.json()
+                if "job_id" in job:
+                    print(f"Job {job_id} wird fortgesetzt.")
+                    job = wait_for_job(job_id)
+                    if job.get("status") == "completed":
+                        book_job_id = job_id
+                result = job.get("result") or {"error": job.get("error", "Unbekannter Fehler")}
+                print(f"KI: {json.dumps(result, indent=4, ensure_ascii=False)}")
+                chat_history.append({"user": f"/resume {job_id}", "bot": result})  # Chatverlauf speichern
+            except Exception as e:
+                print(f"Fehler beim Fortsetzen: {e}")
+
         elif user_input.startswith("/search"):
             print("Suche gestartet.")
             query = input("Gib deinen Suchbegriff ein: ")
@@ -224,6 +319,8 @@ def chat():
                 
                 # `chat_history` zurücksetzen
                 chat_history.clear()
+                chat_session = uuid.uuid4().hex
+                book_job_id = None
                 print("Chat-Verlauf wurde geleert.")
 
                 # Backend neu starten
@@ -259,7 +356,7 @@ def chat():
             show_commands()
 
         else:
-            payload = {"user_input": user_input}
+            payload = {"user_input": user_input, "session_id": chat_session, "job_id": book_job_id}
             try:
                 response = requests.post(f"{BASE_URL}/chat", json=payload)
                 result = response.json()
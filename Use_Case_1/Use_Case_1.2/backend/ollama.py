@@ -1,14 +1,474 @@
+from contextlib import contextmanager
+import json
+import re
+import threading
+import zlib
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from llm_cache import ResponseCache, cache_key
+from scheduler import LLMScheduler, remaining_time
+
+
+# Verbindungseinstellungen für den LM Studio Server
+LM_STUDIO_URL = "http://127.0.0.1:1234/v1/chat/completions"  # API-Endpunkt
+MODEL_NAME = "dolphin3.0-llama3.1-8b"  # Modellname
+SYSTEM_PROMPT = "Gebe eine Antwort zu dem Prompt von dem User ohne weitere Hinweise, Informationen, Kontext oder sonstiges sondern nur zu dem Prompt antworten"
+CONNECT_TIMEOUT = 10  # Timeout für den Verbindungsaufbau in Sekunden
+READ_TIMEOUT = 900  # Timeout für die Antwort in Sekunden
+MAX_PARALLEL_REQUESTS = 4  # Sollte den parallelen Slots des LLM-Servers entsprechen, begrenzt auch den Scheduler
+VERDICT_PREFIX_CHARS = 200  # Spätestens nach so vielen Zeichen muss "Ja"/"Nein" erkennbar sein
+VERDICT_MAX_TOKENS = 4  # Token-Limit, wenn nur "Ja"/"Nein" benötigt wird
+VERDICT_REASON_MAX_TOKENS = 300  # Token-Limit, wenn zusätzlich eine Begründung benötigt wird
+VERDICT_JSON_MAX_TOKENS = 32  # Token-Limit für ein JSON-Urteil ohne Begründung
+VERDICT_STOP = ["\n"]  # Stoppsequenz, wenn nur "Ja"/"Nein" benötigt wird
+PREFIX_CACHE_SLOTS = None  # Anzahl der Server-Slots für id_slot-Hinweise, None = Slot wählt der Server
+CACHE_RESPONSES = True  # Deterministische Antworten (temperature 0) im Antwort-Cache speichern
+
+# JSON-Schema für den strukturierten Urteilsmodus (Grammatik-beschränkte Ausgabe)
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "urteil": {"type": "string", "enum": ["Ja", "Nein"]},
+        "begruendung": {"type": "string"}
+    },
+    "required": ["urteil", "begruendung"]
+}
+
+# "Ja"/"Nein" am Anfang einer Antwort, auch mit Aufzählungszeichen, Anführungszeichen oder Markdown davor
+VERDICT_PATTERN = re.compile(r'^[\s"\'*#>\-\d.):]*(?:antwort:\s*)?[\s"\'*]*(ja|nein)(?![a-zäöüß])', re.IGNORECASE)
+
+
+class LLMClient:
+    """Process-wide HTTP client for the LM Studio Chat Completions endpoint."""
+
+    def __init__(self, url=LM_STUDIO_URL, model=MODEL_NAME, system_prompt=SYSTEM_PROMPT,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 pool_size=MAX_PARALLEL_REQUESTS, prefix_cache_slots=PREFIX_CACHE_SLOTS, scheduler=None,
+                 cache_responses=CACHE_RESPONSES, response_cache=None):
+        """
+        Initializes the client with a pooled keep-alive session and a scheduler for its calls.
+
+        Args:
+            url (str): The Chat Completions endpoint of the LLM server.
+            model (str): The model name sent with every request.
+            system_prompt (str): The system message prepended to every prompt.
+            connect_timeout (float): Timeout in seconds for establishing a connection.
+            read_timeout (float): Timeout in seconds for waiting on the response.
+            pool_size (int): Maximum number of kept-alive connections to the server.
+            prefix_cache_slots (int): Number of server slots used to pin requests with the same
+                cache key to one slot, None to leave the slot choice to the server.
+            scheduler (LLMScheduler, optional): Queues the calls of all jobs; defaults to a scheduler
+                allowing pool_size concurrent calls.
+            cache_responses (bool): Whether answers are cached at all.
+            response_cache (ResponseCache, optional): The cache for answers; defaults to a ResponseCache
+                in CACHE_DIR of llm_cache.py.
+        """
+        self.url = url
+        self.model = model
+        self.system_prompt = system_prompt
+        self.timeout = (connect_timeout, read_timeout)
+        self.prefix_cache_slots = prefix_cache_slots
+        self.scheduler = scheduler or LLMScheduler(pool_size)
+        self.response_cache = (response_cache or ResponseCache()) if cache_responses else None
+        self.session = requests.Session()
+        # Ein Pool pro Host reicht, da immer derselbe Server angesprochen wird
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def build_payload(self, prompt, max_tokens=-1, stream=False, **options):
+        """
+        Builds the JSON payload for a Chat Completions request.
+
+        Args:
+            prompt (str): The user's input prompt to be sent to the model.
+            max_tokens (int, optional): Token limit of the completion, -1 for no limit. Defaults to -1.
+            stream (bool, optional): Whether the server should stream the answer. Defaults to False.
+            **options: Further request parameters such as temperature, stop or response_format.
+
+        Returns:
+            dict: The request payload.
+        """
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.system_prompt},  # Systemrolle mit Anweisung
+                {"role": "user", "content": prompt}  # Benutzerrolle mit Eingabe
+            ],
+            "max_tokens": max_tokens,
+            "stream": stream
+        }
+        payload.update({key: value for key, value in options.items() if value is not None})
+        return payload
+
+    def prefix_cache_options(self, cache_key):
+        """
+        Returns the request parameters that ask the server to reuse the KV cache of a shared prompt prefix.
+
+        "cache_prompt" and "id_slot" are understood by llama.cpp based servers, "prompt_cache_key"
+        by OpenAI compatible ones; servers ignore the parameters they do not know.
+
+        Args:
+            cache_key (str): Identifies the shared prefix, e.g. a hash of the book text. None for no hint.
+
+        Returns:
+            dict: The additional request parameters.
+        """
+        if cache_key is None:
+            return {}
+        options = {"cache_prompt": True, "prompt_cache_key": cache_key}
+        if self.prefix_cache_slots:
+            # Gleicher Schlüssel, gleicher Slot: der Prefix liegt dort bereits im KV-Cache
+            options["id_slot"] = zlib.crc32(cache_key.encode("utf-8")) % self.prefix_cache_slots
+        return options
+
+    def request_timeout(self):
+        """
+        Returns the timeouts for the next request, shortened to the deadline of the current call.
+
+        Returns:
+            tuple: The connect and read timeout in seconds.
+
+        Raises:
+            requests.exceptions.Timeout: If the deadline of the current call has already passed.
+        """
+        remaining = remaining_time()
+        if remaining is None:
+            return self.timeout
+        if remaining <= 0:
+            raise requests.exceptions.Timeout("Frist des LLM-Aufrufs abgelaufen.")
+        return tuple(min(timeout, remaining) for timeout in self.timeout)
+
+    def response_key(self, payload, cache=None, **variant):
+        """
+        Returns the key under which the answer to a request is cached.
+
+        Only deterministic requests (temperature 0) are cached by default; sampled answers
+        differ on every call and are regenerated on purpose, e.g. after a failed validation.
+
+        Args:
+            payload (dict): The request payload.
+            cache (bool, optional): True or False to force caching on or off. Defaults to None (temperature 0 only).
+            **variant: Further values that change the answer, e.g. the verdict mode.
+
+        Returns:
+            str: The cache key, or None if the answer must not be cached.
+        """
+        if self.response_cache is None:
+            return None
+        if cache is None:
+            cache = payload.get("temperature") == 0
+        return cache_key({**payload, **variant}) if cache else None
+
+    def complete(self, prompt, max_tokens=-1, cache=None, **options):
+        """
+        Sends the prompt over the pooled session and returns the content of the answer.
+
+        The request waits for a slot of the scheduler, so chat calls overtake queued book calls.
+        Inside deadline_context, waiting and the request end at the deadline.
+        Deterministic requests are answered from the response cache if possible.
+
+        Args:
+            prompt (str): The user's input prompt to be sent to the model.
+            max_tokens (int, optional): Token limit of the completion, -1 for no limit. Defaults to -1.
+            cache (bool, optional): Forces caching of the answer on or off, see response_key. Defaults to None.
+            **options: Further request parameters such as temperature, stop or response_format.
+
+        Returns:
+            str: The content of the response message from the model.
+
+        Raises:
+            requests.exceptions.RequestException: If there is an issue with the connection to the LM Studio
+                or the deadline of the call has passed.
+        """
+        payload = self.build_payload(prompt, max_tokens=max_tokens, **options)
+        key = self.response_key(payload, cache)
+        if key:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return cached
+        with self.scheduler_slot():
+            response = self.session.post(self.url, json=payload, timeout=self.request_timeout())
+        response.raise_for_status()  # Überprüft auf HTTP-Fehler
+        # Extrahiere die Antwort aus der JSON-Antwort
+        message = response.json().get("choices", [{}])[0].get("message", {})
+        if key and "content" in message:
+            self.response_cache.put(key, message["content"])
+        return message.get("content", "Fehler: Keine Antwort erhalten.")
+
+    def stream(self, prompt, max_tokens=-1, **options):
+        """
+        Streams the answer to the prompt from the server-sent events of the endpoint.
+
+        Closing the generator early closes the HTTP response, which makes the server stop generating.
+        The scheduler slot is held until the stream is finished or closed, or until the deadline of
+        the call (see deadline_context) has passed.
+
+        Args:
+            prompt (str): The user's input prompt to be sent to the model.
+            max_tokens (int, optional): Token limit of the completion, -1 for no limit. Defaults to -1.
+            **options: Further request parameters such as temperature, stop or response_format.
+
+        Yields:
+            str: The text fragments of the answer in the order they are generated.
+
+        Raises:
+            requests.exceptions.RequestException: If there is an issue with the connection to the LM Studio
+                or the deadline of the call has passed.
+        """
+        payload = self.build_payload(prompt, max_tokens=max_tokens, stream=True, **options)
+        with self.scheduler_slot():
+            response = self.session.post(self.url, json=payload, timeout=self.request_timeout(), stream=True)
+            try:
+                response.raise_for_status()  # Überprüft auf HTTP-Fehler
+                for line in response.iter_lines(chunk_size=None):
+                    remaining = remaining_time()
+                    if remaining is not None and remaining <= 0:
+                        raise requests.exceptions.Timeout("Frist des LLM-Aufrufs während des Streamens abgelaufen.")
+                    if not line.startswith(b"data:"):
+                        continue  # Leerzeilen und Kommentare des Event-Streams überspringen
+                    data = line[len(b"data:"):].strip()
+                    if data == b"[DONE]":
+                        break
+                    choice = json.loads(data).get("choices", [{}])[0]
+                    content = choice.get("delta", {}).get("content")
+                    if content:
+                        yield content
+            finally:
+                response.close()
+
+    @contextmanager
+    def scheduler_slot(self):
+        """
+        Holds a scheduler slot for the duration of the block.
+
+        Raises:
+            requests.exceptions.Timeout: If the deadline of the call passes while it is queued.
+        """
+        try:
+            self.scheduler.acquire()
+        except TimeoutError as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        try:
+            yield
+        finally:
+            self.scheduler.release()
+
+    def verdict(self, prompt, with_reason=True, structured=False, cache=None):
+        """
+        Asks for a "Ja"/"Nein" verdict with a capped, deterministic completion.
+
+        Without a reason the completion is limited to a few tokens and stops at the first
+        line break or period. With a reason the answer is streamed and reading stops as soon
+        as a "Ja" arrives; a "Nein" is read up to VERDICT_REASON_MAX_TOKENS for its justification.
+        In structured mode the server is asked for JSON matching VERDICT_SCHEMA instead.
+        Verdicts are deterministic and therefore cached.
+
+        Args:
+            prompt (str): The prompt asking for a "Ja"/"Nein" answer.
+            with_reason (bool, optional): Whether a justification is needed after "Nein". Defaults to True.
+            structured (bool, optional): Whether to constrain the output with VERDICT_SCHEMA. Defaults to False.
+            cache (bool, optional): False to bypass the response cache. Defaults to None (cached).
+
+        Returns:
+            dict: The parsed verdict with the keys
+                - "approved" (bool or None): True for "Ja", False for "Nein", None if no verdict was found.
+                - "verdict" (str or None): "Ja", "Nein" or None.
+                - "reason" (str): The justification following the verdict, may be empty.
+                - "raw" (str): The text read from the model.
+
+        Raises:
+            requests.exceptions.RequestException: If there is an issue with the connection to the LM Studio.
+        """
+        key = self.response_key(self.build_payload(prompt, temperature=0), cache,
+                                verdict_mode=[with_reason, structured])
+        if key:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return dict(cached)
+
+        reason = ""
+        if structured:
+            raw = self.complete(
+                prompt,
+                max_tokens=VERDICT_REASON_MAX_TOKENS if with_reason else VERDICT_JSON_MAX_TOKENS,
+                cache=False,
+                temperature=0,
+                response_format={"type": "json_schema", "json_schema": {"name": "urteil", "schema": VERDICT_SCHEMA}}
+            )
+            try:
+                data = json.loads(raw)
+                verdict, reason = data.get("urteil"), data.get("begruendung", "")
+            except (ValueError, AttributeError):
+                verdict = None
+            if verdict not in ("Ja", "Nein"):
+                verdict, raw = read_verdict([raw])  # Server ohne Schema-Unterstützung
+                reason = split_reason(raw)
+        elif with_reason:
+            verdict, raw = read_verdict(self.stream(prompt, max_tokens=VERDICT_REASON_MAX_TOKENS, temperature=0))
+            reason = split_reason(raw)
+        else:
+            raw = self.complete(prompt, max_tokens=VERDICT_MAX_TOKENS, cache=False, temperature=0, stop=VERDICT_STOP)
+            verdict, raw = read_verdict([raw])
+        result = {
+            "approved": None if verdict is None else verdict == "Ja",
+            "verdict": verdict,
+            "reason": reason,
+            "raw": raw
+        }
+        if key and verdict:
+            self.response_cache.put(key, result)  # Antworten ohne Urteil beim nächsten Mal erneut anfragen
+        return result
+
+    def complete_json(self, prompt, schema, name, max_tokens=-1, **options):
+        """
+        Asks for an answer matching a JSON schema and parses it.
+
+        Args:
+            prompt (str): The user's input prompt to be sent to the model.
+            schema (dict): The JSON schema the answer has to follow.
+            name (str): The name of the schema sent to the server.
+            max_tokens (int, optional): Token limit of the completion, -1 for no limit. Defaults to -1.
+            **options: Further request parameters such as temperature, cache hints or cache (see complete).
+
+        Returns:
+            tuple: The parsed JSON object (None if the answer is not valid JSON) and the raw answer.
+
+        Raises:
+            requests.exceptions.RequestException: If there is an issue with the connection to the LM Studio.
+        """
+        raw = self.complete(
+            prompt,
+            max_tokens=max_tokens,
+            response_format={"type": "json_schema", "json_schema": {"name": name, "schema": schema}},
+            **options
+        )
+        # Server ohne Schema-Unterstützung liefern das JSON oft in einem Codeblock
+        match = re.search(r"\{.*\}", raw, re.DOTALL)
+        try:
+            return json.loads(match.group(0) if match else raw), raw
+        except ValueError:
+            return None, raw
+
+    def close(self):
+        """Closes all pooled connections."""
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """
+    Returns the process-wide LLM client, creating it on first use.
+
+    Returns:
+        LLMClient: The shared client instance.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
+
+
+def read_verdict(chunks, read_reason=True):
+    """
+    Consumes a token stream until the leading "Ja"/"Nein" verdict of the answer is known.
+
+    A positive verdict stops reading immediately. A negative verdict keeps reading so that
+    the justification is available, unless read_reason is False. If no verdict is found
+    within the first VERDICT_PREFIX_CHARS characters, the whole answer is read.
+
+    Args:
+        chunks (iterable): The text fragments, e.g. from OllamaLLM.stream().
+        read_reason (bool, optional): Whether to read the rest of the answer after "Nein". Defaults to True.
+
+    Returns:
+        tuple: The verdict ("Ja", "Nein" or None if none was found) and the text read so far.
+    """
+    text = ""
+    verdict = None
+    for chunk in chunks:
+        text += chunk
+        if verdict is None:
+            match = VERDICT_PATTERN.match(text)
+            # Erst entscheiden, wenn nach dem Wort noch ein Zeichen folgt ("Ja" vs. "Jahr")
+            if match and match.end() < len(text):
+                verdict = match.group(1).capitalize()
+                if verdict == "Ja" or not read_reason:
+                    break
+            elif len(text) > VERDICT_PREFIX_CHARS:
+                verdict = ""  # Kein Urteil am Anfang, Rest vollständig lesen
+    if hasattr(chunks, "close"):
+        chunks.close()  # Bricht die Generierung auf dem Server ab
+    if verdict is None:
+        match = VERDICT_PATTERN.match(text)
+        verdict = match.group(1).capitalize() if match else None
+    return verdict or None, text
+
+
+def split_reason(text):
+    """
+    Returns the part of an answer that follows its leading "Ja"/"Nein".
+
+    Args:
+        text (str): The answer of the model.
+
+    Returns:
+        str: The justification after the verdict, or the whole text if it has no leading verdict.
+    """
+    match = VERDICT_PATTERN.match(text)
+    if not match:
+        return text.strip()
+    return text[match.end():].lstrip(" \t\"'*.,:;-").strip()
+
+
+def configure_llm_client(**settings):
+    """
+    Replaces the process-wide LLM client with one using the given settings.
+
+    Args:
+        **settings: Keyword arguments accepted by LLMClient (url, model, timeouts, pool_size, scheduler,
+            cache_responses, response_cache).
+
+    Returns:
+        LLMClient: The new shared client instance.
+    """
+    global _client
+    with _client_lock:
+        old_client, _client = _client, LLMClient(**settings)
+    if old_client is not None:
+        old_client.close()
+    return _client
 
 
 class OllamaLLM:
     """Wrapper für Ollama LLM."""
-    def _call(self, prompt):
+    def __init__(self, client=None):
+        """
+        Initializes the wrapper on top of an LLM client.
+
+        Args:
+            client (LLMClient, optional): The client to use. Defaults to the process-wide client.
+        """
+        self.client = client or get_llm_client()
+
+    def _call(self, prompt, cache_key=None, deterministic=False, max_tokens=-1):
         """
         Sends a POST request to the LM Studio Chat Completions endpoint with the given prompt.
 
         Args:
             prompt (str): The user's input prompt to be sent to the model.
+            cache_key (str, optional): Identifies a prompt prefix shared with other requests, so the
+                server can reuse its KV cache. Defaults to None.
+            deterministic (bool, optional): Whether to answer with temperature 0; such answers are
+                reproducible and served from the response cache on repeat. Defaults to False.
+            max_tokens (int, optional): Caps the completion, -1 for no limit. Defaults to -1.
 
         Returns:
             str: The response content from the model or an error message if the request fails.
@@ -16,23 +476,69 @@ class OllamaLLM:
         Raises:
             requests.exceptions.RequestException: If there is an issue with the HTTP request.
         """
+        options = self.client.prefix_cache_options(cache_key)
+        if deterministic:
+            options["temperature"] = 0
         try:
-            # POST-Anfrage an den LM Studio Chat Completions Endpunkt
-            response = requests.post(
-                "http://127.0.0.1:1234/v1/chat/completions",  # API-Endpunkt
-                json={
-                    "model": "dolphin3.0-llama3.1-8b",  # Modellname
-                    "messages": [
-                        { "role": "system", "content": "Gebe eine Antwort zu dem Prompt von dem User ohne weitere Hinweise, Informationen, Kontext oder sonstiges sondern nur zu dem Prompt antworten" },  # Systemrolle mit Anweisung
-                        { "role": "user", "content": prompt }  # Benutzerrolle mit Eingabe
-                    ],
-                    "max_tokens": -1,  # Keine Begrenzung der Tokens
-                    "stream": False  # Setze auf False, wenn die gesamte Antwort abgewartet werden soll
-                },
-                timeout=900  # Timeout in Sekunden
-            )
-            response.raise_for_status()  # Überprüft auf HTTP-Fehler
-            # Extrahiere die Antwort aus der JSON-Antwort
-            return response.json().get("choices", [{}])[0].get("message", {}).get("content", "Fehler: Keine Antwort erhalten.")
+            return self.client.complete(prompt, max_tokens=max_tokens, **options)
         except requests.exceptions.RequestException as e:
             return f"Fehler bei der Verbindung zu LM Studio: {str(e)}"
+
+    def verdict(self, prompt, with_reason=True, structured=False):
+        """
+        Asks the model for a "Ja"/"Nein" verdict with a capped completion.
+
+        Args:
+            prompt (str): The prompt asking for a "Ja"/"Nein" answer.
+            with_reason (bool, optional): Whether a justification is needed after "Nein". Defaults to True.
+            structured (bool, optional): Whether to constrain the output to a JSON schema. Defaults to False.
+
+        Returns:
+            dict: The keys "approved", "verdict", "reason" and "raw" as returned by LLMClient.verdict,
+                  with "approved" set to None and the error message as "raw" if the request fails.
+        """
+        try:
+            return self.client.verdict(prompt, with_reason=with_reason, structured=structured)
+        except requests.exceptions.RequestException as e:
+            error = f"Fehler bei der Verbindung zu LM Studio: {str(e)}"
+            return {"approved": None, "verdict": None, "reason": error, "raw": error}
+
+    def structured(self, prompt, schema, name, cache_key=None):
+        """
+        Asks the model for a deterministic answer matching a JSON schema.
+
+        Args:
+            prompt (str): The user's input prompt to be sent to the model.
+            schema (dict): The JSON schema the answer has to follow.
+            name (str): The name of the schema sent to the server.
+            cache_key (str, optional): Identifies a prompt prefix shared with other requests. Defaults to None.
+
+        Returns:
+            dict: "data" with the parsed JSON object (None if parsing or the request failed)
+                  and "raw" with the answer or the error message.
+        """
+        try:
+            data, raw = self.client.complete_json(
+                prompt, schema, name, temperature=0, **self.client.prefix_cache_options(cache_key)
+            )
+            return {"data": data, "raw": raw}
+        except requests.exceptions.RequestException as e:
+            return {"data": None, "raw": f"Fehler bei der Verbindung zu LM Studio: {str(e)}"}
+
+    def stream(self, prompt):
+        """
+        Streams the answer to the given prompt token by token.
+
+        Args:
+            prompt (str): The user's input prompt to be sent to the model.
+
+        Yields:
+            str: The text fragments of the answer, or an error message if the request fails.
+        """
+        chunks = self.client.stream(prompt)
+        try:
+            yield from chunks
+        except requests.exceptions.RequestException as e:
+            yield f"Fehler bei der Verbindung zu LM Studio: {str(e)}"
+        finally:
+            chunks.close()
@@ -1,21 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import re
+import threading
 
-from duckduckgo_search import DDGS
+from llm_cache import ResponseCache, cache_key
 
 
-logging.basicConfig(
-    filename='Use_Case_2/Use_Case_2.1/backend/backend.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    encoding='utf-8'
-)
+logger = logging.getLogger(__name__)
 
+SEARCH_CACHE_DIR = "./Use_Case_2/Use_Case_2.1/backend/search_cache"  # Eine JSON-Datei pro Suchanfrage
+SEARCH_CACHE_MAX_ENTRIES = 500  # Suchanfragen im Speicher
+SEARCH_CACHE_TTL = 24 * 3600  # Sekunden, die Suchergebnisse wiederverwendet werden
+SEARCH_REGIONS = ["de-de", "wt-wt"]  # Bevorzugte Region zuerst; ohne Region sucht DDGS ebenfalls in "wt-wt"
+SEARCH_FETCH_RESULTS = 30  # Abgerufene Ergebnisse pro Region, aus denen gefiltert wird
+MAX_SEARCH_RESULTS = 10  # Ziel: 10 relevante Ergebnisse
+
+
+def normalize_query(query):
+    """
+    Normalises a search query so that queries differing only in spelling details share one cache entry.
+
+    Case, quotes, punctuation and whitespace are ignored. Word order and repeated words are
+    kept, since "Flug Berlin nach Paris" and "Flug Paris nach Berlin" need different results.
+
+    Args:
+        query (str): The search query.
+
+    Returns:
+        str: The normalised query.
+    """
+    words = re.findall(r"\w+", query.lower())
+    return " ".join(words)
+
+
+def result_link_key(link):
+    """Returns a link without scheme, "www." and trailing slash to detect duplicate results."""
+    link = re.sub(r"^https?://(www\.)?", "", link.strip().lower())
+    return link.rstrip("/")
 
-logger = logging.getLogger(__name__)
 
 class DuckDuckGoSearch:
     """DuckDuckGo-Suche."""
 
+    def __init__(self, ddgs_factory=None, cache=None, regions=SEARCH_REGIONS):
+        """
+        Initializes the search with reusable DDGS sessions and a result cache.
+
+        Args:
+            ddgs_factory (callable, optional): Creates a DDGS session; a stub can be passed in tests. Defaults to DDGS,
+                imported only when the first search instance is created.
+            cache (ResponseCache, optional): The cache of search results. Defaults to a cache in SEARCH_CACHE_DIR.
+            regions (list, optional): The regions searched concurrently, preferred first. Defaults to SEARCH_REGIONS.
+        """
+        if ddgs_factory is None:
+            from duckduckgo_search import DDGS
+            ddgs_factory = DDGS
+        self.ddgs_factory = ddgs_factory
+        self.cache = cache or ResponseCache(
+            directory=SEARCH_CACHE_DIR,
+            max_entries=SEARCH_CACHE_MAX_ENTRIES,
+            ttl=SEARCH_CACHE_TTL
+        )
+        self.regions = regions
+        self.sessions = {}  # Region -> (DDGS-Sitzung, Lock); eine Sitzung bedient nur eine Anfrage gleichzeitig
+        self.in_flight = {}  # Schlüssel -> Event der laufenden Suche nach derselben Anfrage
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(regions)), thread_name_prefix="ddgs")
+
     def perform_search(self, query):
         """
         Perform a search using DuckDuckGo and return relevant results.
@@ -31,17 +82,42 @@ class DuckDuckGoSearch:
         """
         try:
             logger.info(f"Suche nach: {query}")
-            max_results = 10  # Ziel: 10 relevante Ergebnisse
-            collected_results = []
-            logger.info(f"Suche nach: {query}")
-            # Führe die Suche durch
-            results = DDGS().text(query, region='de-de', safesearch='Off', max_results=50)  # Höhere Anzahl abrufen, um zu filtern
-            #fallback without region search und query format anpassen
-            if not results:
-                results = DDGS().text(query, region='wt-wt', safesearch='Off', max_results=50)  # Höhere Anzahl abrufen, um zu filtern
-            if not results:
-                results = DDGS().text(query, safesearch='Off', max_results=50)  # Höhere Anzahl abrufen, um zu filtern
-            
+            key = cache_key({"query": normalize_query(query)})
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info(f"Suchergebnisse aus dem Cache: {len(cached)}")
+                return {"results": cached}
+
+            # Läuft dieselbe Suche bereits, auf deren Ergebnis warten statt erneut zu suchen
+            with self.lock:
+                running = self.in_flight.get(key)
+                if running is None:
+                    self.in_flight[key] = threading.Event()
+            if running is not None:
+                running.wait()
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return {"results": cached}
+                return self.search_uncached(query, key, owner=False)
+            return self.search_uncached(query, key, owner=True)
+
+        except Exception as e:
+            return {"error": f"Fehler bei der DuckDuckGo-Suche: {str(e)}"}
+
+    def search_uncached(self, query, key, owner):
+        """
+        Searches DuckDuckGo, filters the results and stores them in the cache.
+
+        Args:
+            query (str): The search query string.
+            key (str): The cache key of the normalised query.
+            owner (bool): Whether this call registered the search in in_flight and has to release it.
+
+        Returns:
+            dict: "results" with up to MAX_SEARCH_RESULTS relevant results.
+        """
+        try:
+            results = self.search_regions(query)
             logger.info(f"Anzahl der Suchergebnisse: {len(results)}")
             logger.info(f"Ergebnisse: {results}")
 
@@ -49,13 +125,17 @@ class DuckDuckGoSearch:
                 logger.warning("Keine Ergebnisse gefunden.")
                 return {"results": []}
 
-            # Filtere Ergebnisse mit Titel, Link und Snippet
+            # Filtere Ergebnisse mit Titel, Link und Snippet, doppelte Links nur einmal
+            collected_results = []
+            seen_links = set()
             for result in results:
                 if (
                     "title" in result and result["title"].strip() and
                     "href" in result and result["href"].strip() and
-                    "body" in result and result["body"].strip()
+                    "body" in result and result["body"].strip() and
+                    result_link_key(result["href"]) not in seen_links
                 ):
+                    seen_links.add(result_link_key(result["href"]))
                     collected_results.append({
                         "title": result["title"].strip(),
                         "link": result["href"].strip(),
@@ -63,13 +143,106 @@ class DuckDuckGoSearch:
                     })
 
                 # Beende die Schleife, sobald 10 Ergebnisse erreicht wurden
-                if len(collected_results) >= max_results:
+                if len(collected_results) >= MAX_SEARCH_RESULTS:
                     break
 
             # Rückgabe der gesammelten Ergebnisse
             logger.info(f"Gefundene relevante Ergebnisse: {len(collected_results)}")
+            if collected_results:
+                self.cache.put(key, collected_results)
             return {"results": collected_results}
+        finally:
+            if owner:
+                with self.lock:
+                    self.in_flight.pop(key).set()
 
-        except Exception as e:
-            return {"error": f"Fehler bei der DuckDuckGo-Suche: {str(e)}"}
-        
\ No newline at end of file
+    def search_regions(self, query):
+        """
+        Searches all regions concurrently and returns the results of the first region that has any.
+
+        Args:
+            query (str): The search query string.
+
+        Returns:
+            list: The raw DDGS results of the preferred region with results, or an empty list.
+
+        Raises:
+            Exception: The error of the preferred region if no region returned results and all failed.
+        """
+        futures = [self.executor.submit(self.search_region, query, region) for region in self.regions]
+        errors = []
+        for region, future in zip(self.regions, futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.warning(f"Suche in Region {region} fehlgeschlagen: {e}")
+                errors.append(e)
+                continue
+            if results:
+                return results
+        if errors and len(errors) == len(futures):
+            raise errors[0]
+        return []
+
+    def search_region(self, query, region):
+        """
+        Searches one region with its reused DDGS session.
+
+        Args:
+            query (str): The search query string.
+            region (str): The DDGS region, e.g. "de-de".
+
+        Returns:
+            list: The raw DDGS results.
+        """
+        with self.lock:
+            if region not in self.sessions:
+                self.sessions[region] = (self.ddgs_factory(), threading.Lock())
+            session, session_lock = self.sessions[region]
+        with session_lock:
+            return session.text(query, region=region, safesearch='Off', max_results=SEARCH_FETCH_RESULTS) or []
+
+
+_search_engine = None
+_search_engine_lock = threading.Lock()
+
+
+def get_search_engine():
+    """
+    Returns the process-wide search, creating it on first use.
+
+    Returns:
+        DuckDuckGoSearch: The shared instance, so sessions, cache and running searches are shared.
+    """
+    global _search_engine
+    if _search_engine is None:
+        with _search_engine_lock:
+            if _search_engine is None:
+                _search_engine = DuckDuckGoSearch()
+    return _search_engine
+
+
+def search(query):
+    """
+    Runs a web search in-process; used by the agents and by the /api/search endpoint.
+
+    Args:
+        query (str): The search query; quotes are removed.
+
+    Returns:
+        dict: "results" with the relevant results, plus "message" if nothing relevant was found.
+
+    Raises:
+        ValueError: If the search query is empty.
+    """
+    query = (query or "").replace('"', '').replace("'", "").strip()
+    if not query:
+        raise ValueError("Die Suchanfrage ist leer. Bitte einen gültigen Suchbegriff angeben.")
+
+    result = get_search_engine().perform_search(query=query)
+    if not result or not result.get("results"):
+        if result and result.get("error"):
+            logger.error(result["error"])
+        logger.warning("Keine relevanten Ergebnisse gefunden.")
+        return {"results": [], "message": "Keine relevanten Ergebnisse gefunden."}
+    return result
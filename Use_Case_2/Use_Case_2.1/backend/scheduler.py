@@ -0,0 +1,186 @@
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import contextvars
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0  # Chat-Anfragen, werden immer zuerst bedient
+PRIORITY_BATCH = 1  # Buch-Generierungen im Hintergrund
+DEFAULT_MAX_CONCURRENT = 4  # Gleichzeitige LLM-Aufrufe, sollte den Slots des LLM-Servers entsprechen
+
+# Job und Priorität des aktuellen Aufrufs; wird über contextvars.copy_context an Worker-Threads vererbt
+current_request = contextvars.ContextVar("current_request", default=None)
+# Frist (time.monotonic()) der Aufrufe im aktuellen Kontext, None = ohne Frist
+current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+
+@contextmanager
+def request_context(job_id, priority=PRIORITY_BATCH, weight=1):
+    """
+    Assigns all LLM calls made inside the block to a job and a priority class.
+
+    Args:
+        job_id (str): The job the calls belong to; calls of the same job share one fair-queuing turn.
+        priority (int, optional): PRIORITY_INTERACTIVE or PRIORITY_BATCH. Defaults to PRIORITY_BATCH.
+        weight (int, optional): Number of calls the job may start per round-robin turn. Defaults to 1.
+    """
+    token = current_request.set((job_id, priority, max(1, int(weight))))
+    try:
+        yield
+    finally:
+        current_request.reset(token)
+
+
+@contextmanager
+def deadline_context(seconds):
+    """
+    Limits all LLM calls made inside the block to the given number of seconds from now.
+
+    Waiting for a slot and the HTTP request both end at the deadline, so a call whose
+    result is no longer awaited does not keep its slot. Nested deadlines keep the earlier one.
+
+    Args:
+        seconds (float): The time the calls inside the block may take in total.
+    """
+    deadline = time.monotonic() + seconds
+    outer = current_deadline.get()
+    token = current_deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def remaining_time():
+    """
+    Returns the time left until the deadline of the current call.
+
+    Returns:
+        float: The remaining seconds (0 or less once the deadline has passed), None without deadline.
+    """
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def get_request():
+    """
+    Returns job, priority and weight of the current call.
+
+    Calls outside of request_context (e.g. /api/chat) count as interactive and
+    form their own job per thread.
+
+    Returns:
+        tuple: The job ID, the priority class and the weight.
+    """
+    return current_request.get() or (f"thread-{threading.get_ident()}", PRIORITY_INTERACTIVE, 1)
+
+
+class LLMScheduler:
+    """Limits concurrent LLM calls and hands free slots to waiting jobs by priority and round-robin."""
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT):
+        """
+        Initializes the scheduler without waiting calls.
+
+        Args:
+            max_concurrent (int, optional): The global cap of concurrent LLM calls. Defaults to DEFAULT_MAX_CONCURRENT.
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.active = 0
+        self.lock = threading.Lock()
+        self.queues = {}  # Priorität -> OrderedDict(job_id -> Warteschlange des Jobs), vorne ist der Job am Zug
+        self.stats = {"calls": 0, "queued": 0, "timeouts": 0, "max_wait": 0.0}
+
+    def acquire(self):
+        """
+        Blocks until the current call may be sent to the LLM server.
+
+        A free slot is taken immediately if nobody is waiting. Otherwise the call is queued
+        under its job; released slots go to the highest priority class, and within a class
+        to the jobs in turn, each job starting up to `weight` calls per turn.
+
+        Raises:
+            TimeoutError: If the deadline of the call (see deadline_context) passes while it is queued.
+        """
+        job_id, priority, weight = get_request()
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError("Frist des LLM-Aufrufs abgelaufen, bevor er gestartet wurde.")
+        with self.lock:
+            self.stats["calls"] += 1
+            if self.active < self.max_concurrent and not any(self.queues.values()):
+                self.active += 1
+                return
+            ticket = threading.Event()
+            jobs = self.queues.setdefault(priority, OrderedDict())
+            job = jobs.setdefault(job_id, {"weight": weight, "credits": weight, "tickets": deque()})
+            job["tickets"].append(ticket)
+            self.stats["queued"] += 1
+        start = time.monotonic()
+        ticket.wait(timeout=remaining)
+        waited = time.monotonic() - start
+        with self.lock:
+            if not ticket.is_set():
+                # Frist abgelaufen: Aufruf aus der Warteschlange nehmen, statt später einen Slot zu belegen
+                job["tickets"].remove(ticket)
+                if not job["tickets"] and jobs.get(job_id) is job:
+                    del jobs[job_id]
+                self.stats["timeouts"] += 1
+                raise TimeoutError(f"Frist des LLM-Aufrufs nach {waited:.2f} s in der Warteschlange abgelaufen.")
+            self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+        logger.debug(f"LLM-Aufruf von Job {job_id} (Priorität {priority}) nach {waited:.2f} s gestartet.")
+
+    def release(self):
+        """Frees the slot of a finished call and starts the next waiting calls."""
+        with self.lock:
+            self.active -= 1
+            while self.active < self.max_concurrent:
+                ticket = self._next_ticket()
+                if ticket is None:
+                    break
+                self.active += 1
+                ticket.set()
+
+    def _next_ticket(self):
+        """Takes the next waiting call by priority and round-robin; the lock must be held."""
+        for priority in sorted(self.queues):
+            jobs = self.queues[priority]
+            if not jobs:
+                continue
+            job_id, job = next(iter(jobs.items()))
+            ticket = job["tickets"].popleft()
+            job["credits"] -= 1
+            if not job["tickets"]:
+                del jobs[job_id]  # Job kommt beim nächsten Aufruf hinten wieder in die Runde
+            elif job["credits"] <= 0:
+                job["credits"] = job["weight"]
+                jobs.move_to_end(job_id)  # Nächster Job ist am Zug
+            return ticket
+        return None
+
+    @contextmanager
+    def slot(self):
+        """Holds a slot for the duration of the block."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self):
+        """
+        Returns the current load of the scheduler.
+
+        Returns:
+            dict: Active calls, waiting calls per priority class and the counters in stats.
+        """
+        with self.lock:
+            waiting = {
+                priority: sum(len(job["tickets"]) for job in jobs.values())
+                for priority, jobs in self.queues.items()
+            }
+            return {"active": self.active, "max_concurrent": self.max_concurrent, "waiting": waiting, **self.stats}
@@ -0,0 +1,320 @@
+import atexit
+import itertools
+import logging
+import threading
+import time
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+CHROMA_PATH = "./Use_Case_2/Use_Case_2.1/backend/chroma_storage"  # Persistenter Speicher von Chroma
+WRITE_BATCH_SIZE = 32  # Gepufferte Dokumente, ab denen sofort in einem upsert geschrieben wird
+WRITE_FLUSH_INTERVAL = 2.0  # Sekunden, nach denen gepufferte Dokumente spätestens geschrieben werden
+WRITE_MAX_RETRIES = 3  # Automatische Wiederholungen nach einem fehlgeschlagenen upsert, danach erst beim nächsten Lesen
+
+
+class DocumentIdAllocator:
+    """Allocates unique, time-ordered document IDs without reading the collection."""
+
+    def __init__(self):
+        """
+        Initializes the allocator with a random process prefix and a fresh counter.
+
+        Attributes:
+            prefix (str): Random part that keeps IDs of different processes apart.
+        """
+        self.prefix = uuid.uuid4().hex[:8]
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        """
+        Returns the next document ID.
+
+        The ID consists of the current time in milliseconds, a per-process sequence number
+        and the process prefix, so IDs sort by creation time and never repeat, even with
+        several threads or processes writing to the same collection.
+
+        Returns:
+            str: The next document ID.
+        """
+        with self._lock:
+            sequence = next(self._counter)
+        return f"{time.time_ns() // 1_000_000:013d}-{sequence:06d}-{self.prefix}"
+
+
+# Gemeinsamer Allokator für alle Agenten des Prozesses
+document_ids = DocumentIdAllocator()
+
+
+def next_document_id():
+    """
+    Returns the next document ID from the process-wide allocator.
+
+    Returns:
+        str: The next document ID.
+    """
+    return document_ids.next_id()
+
+
+class BufferedCollection:
+    """
+    Write-behind buffer in front of a Chroma collection that writes documents in bulk upserts.
+
+    Documents of a failed upsert are put back into the buffer, never dropped. Flushes triggered
+    by size or time retry them in the background, at most WRITE_MAX_RETRIES times in a row;
+    explicit flushes, including those before every read, raise the error of the upsert.
+    """
+
+    def __init__(self, collection, embedding_function=None, batch_size=WRITE_BATCH_SIZE,
+                 flush_interval=WRITE_FLUSH_INTERVAL):
+        """
+        Initializes an empty buffer.
+
+        Args:
+            collection: The Chroma collection to write to.
+            embedding_function (EmbeddingFunction, optional): The embedding function of the collection. If given,
+                the buffer computes the embeddings itself and skips documents added with embed=False.
+                Defaults to None, so Chroma embeds every document.
+            batch_size (int, optional): The number of buffered documents that triggers a flush.
+                Defaults to WRITE_BATCH_SIZE.
+            flush_interval (float, optional): Seconds after which buffered documents are flushed, None to flush
+                only on size, reads and explicit flush calls. Defaults to WRITE_FLUSH_INTERVAL.
+        """
+        self.collection = collection
+        self.embedding_function = embedding_function
+        self.dimensions = None
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.pending = self._empty_batch()
+        self.lock = threading.Lock()  # Schützt den Puffer
+        self.flush_lock = threading.Lock()  # Lesende warten, bis laufende Schreibvorgänge abgeschlossen sind
+        self.timer = None
+        self.failures = 0  # Fehlgeschlagene upserts in Folge
+        self.stats = {"documents": 0, "flushes": 0, "failed": 0, "not_embedded": 0}
+
+    def add(self, documents, ids, metadatas=None, embed=True):
+        """
+        Buffers documents; they are written once the batch is full, the flush interval has passed,
+        or the collection is read.
+
+        Args:
+            documents (list): The documents to store.
+            ids (list): Their IDs.
+            metadatas (list, optional): Their metadata. Defaults to None.
+            embed (bool, optional): False for documents that are only read by metadata and never
+                queried by similarity; they are stored without computing an embedding. Defaults to True.
+        """
+        with self.lock:
+            self.pending["ids"].extend(ids)
+            self.pending["documents"].extend(documents)
+            self.pending["metadatas"].extend(metadatas or [{} for _ in ids])
+            self.pending["embed"].extend([embed] * len(ids))
+            # Nach wiederholten Fehlern nicht bei jedem weiteren Dokument erneut schreiben
+            full = len(self.pending["ids"]) >= self.batch_size and self.failures < WRITE_MAX_RETRIES
+            if not full:
+                self._schedule_flush()
+        if full:
+            self._flush_in_background()
+
+    upsert = add
+
+    def _schedule_flush(self):
+        """Starts the flush timer unless it is already running; the lock must be held."""
+        if self.timer is None and self.flush_interval is not None:
+            self.timer = threading.Timer(self.flush_interval, self._flush_in_background)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _flush_in_background(self):
+        """Flushes after a size or time trigger and schedules a retry if the upsert failed."""
+        try:
+            self.flush()
+        except Exception:
+            with self.lock:
+                if self.failures < WRITE_MAX_RETRIES:
+                    self._schedule_flush()
+                else:
+                    logger.error(f"{len(self.pending['ids'])} Dokument(e) bleiben gepuffert bis zum nächsten Lesezugriff.")
+
+    def flush(self):
+        """
+        Writes all buffered documents to the collection in one upsert.
+
+        If the upsert fails, the documents are put back in front of the buffer, so they are
+        written with the next flush, and the error is raised.
+
+        Returns:
+            int: The number of documents written.
+
+        Raises:
+            Exception: The error of the embedding function or the upsert.
+        """
+        with self.flush_lock:
+            with self.lock:
+                batch = self.pending
+                self.pending = self._empty_batch()
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+            if not batch["ids"]:
+                return 0
+            embed = batch["embed"]
+            try:
+                write = {"ids": batch["ids"], "documents": batch["documents"], "metadatas": batch["metadatas"]}
+                if self.embedding_function is not None:
+                    write["embeddings"] = self._embed(batch["documents"], embed)
+                self.collection.upsert(**write)
+            except Exception as e:
+                with self.lock:
+                    # Vor die inzwischen gepufferten Dokumente stellen, damit die Reihenfolge erhalten bleibt
+                    for field, values in batch.items():
+                        self.pending[field][:0] = values
+                    self.failures += 1
+                    self.stats["failed"] += len(batch["ids"])
+                logger.error(f"Fehler beim Schreiben von {len(batch['ids'])} gepufferten Dokument(en), "
+                             f"sie bleiben gepuffert: {e}")
+                raise
+            with self.lock:
+                self.failures = 0
+                self.stats["documents"] += len(batch["ids"])
+                self.stats["flushes"] += 1
+                if self.embedding_function is not None:
+                    self.stats["not_embedded"] += embed.count(False)
+            logger.debug(f"{len(batch['ids'])} Dokument(e) in einem upsert gespeichert.")
+            return len(batch["ids"])
+
+    def _embed(self, documents, embed):
+        """Embeds the documents marked in `embed`; the others get a zero vector that is never queried."""
+        texts = [document for document, flag in zip(documents, embed) if flag]
+        # Chroma liefert numpy-Arrays, upsert erwartet Listen aus Python-Zahlen
+        vectors = [[float(value) for value in vector] for vector in self.embedding_function(texts)] if texts else []
+        if self.dimensions is None:
+            self.dimensions = len(vectors[0]) if vectors else len(self.embedding_function(["Dimension"])[0])
+        placeholder = [0.0] * self.dimensions
+        vectors = iter(vectors)
+        return [next(vectors) if flag else placeholder for flag in embed]
+
+    @staticmethod
+    def _empty_batch():
+        return {"ids": [], "documents": [], "metadatas": [], "embed": []}
+
+    def get(self, *args, **kwargs):
+        """Flushes the buffer, so reads see all earlier writes, and reads from the collection."""
+        self.flush()
+        return self.collection.get(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        """Flushes the buffer and runs a similarity query on the collection."""
+        self.flush()
+        return self.collection.query(*args, **kwargs)
+
+    def count(self):
+        """Flushes the buffer and returns the number of documents in the collection."""
+        self.flush()
+        return self.collection.count()
+
+    def delete(self, *args, **kwargs):
+        """Flushes the buffer, so no buffered document is written after the deletion, and deletes."""
+        self.flush()
+        return self.collection.delete(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # Alle übrigen Attribute (z. B. name, metadata) direkt von der Collection
+        return getattr(self.collection, name)
+
+
+_client = None
+_vectorstore = None
+_storage_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the process-wide Chroma client, opening the persistent storage on first use.
+
+    Returns:
+        PersistentClient: The shared client, so the storage is opened only once per process.
+    """
+    global _client
+    if _client is None:
+        with _storage_lock:
+            if _client is None:
+                from chromadb import PersistentClient  # Erst bei Bedarf laden, der Import dauert rund eine Sekunde
+                _client = PersistentClient(path=CHROMA_PATH)
+                logger.info(f"Chroma-Speicher geöffnet: {CHROMA_PATH}")
+    return _client
+
+
+def get_vectorstore():
+    """
+    Returns the process-wide context collection, creating it on first use.
+
+    All agents and the chat write through this one buffer, so reads always see
+    the writes of every component.
+
+    Returns:
+        BufferedCollection: The shared collection with the configured embedding function.
+    """
+    global _vectorstore
+    if _vectorstore is None:
+        from embeddings import get_collection, get_embedding_function  # Lädt chromadb
+        client = get_client()
+        with _storage_lock:
+            if _vectorstore is None:
+                _vectorstore = BufferedCollection(get_collection(client), embedding_function=get_embedding_function())
+                atexit.register(_vectorstore.flush)  # Gepufferte Dokumente beim Beenden schreiben, Fehler werden gemeldet
+    return _vectorstore
+
+
+def storage_ready():
+    """
+    Checks whether the context collection has already been opened.
+
+    Returns:
+        bool: True once get_vectorstore has been called.
+    """
+    return _vectorstore is not None
+
+
+def list_sessions():
+    """
+    Lists the sessions stored in the context collection.
+
+    Returns:
+        list: One dictionary per session with session ID, job ID, number of documents and
+            time of the last document, most recent first.
+    """
+    sessions = {}
+    for metadata in get_vectorstore().get(include=["metadatas"])["metadatas"]:
+        session_id = metadata.get("session_id")
+        if session_id is None:
+            continue  # Einträge aus der Zeit vor den Sitzungs-IDs
+        session = sessions.setdefault(session_id, {
+            "session_id": session_id,
+            "job_id": metadata.get("job_id"),
+            "documents": 0,
+            "updated_at": ""
+        })
+        session["documents"] += 1
+        session["updated_at"] = max(session["updated_at"], metadata.get("timestamp", ""))
+    return sorted(sessions.values(), key=lambda session: session["updated_at"], reverse=True)
+
+
+def delete_session(session_id):
+    """
+    Deletes all documents of a session.
+
+    Args:
+        session_id (str): The session to delete.
+
+    Returns:
+        int: The number of deleted documents.
+    """
+    vectorstore = get_vectorstore()
+    ids = vectorstore.get(where={"session_id": session_id}, include=[])["ids"]
+    if ids:
+        vectorstore.delete(ids=ids)
+        logger.info(f"Sitzung {session_id} mit {len(ids)} Dokument(en) gelöscht.")
+    return len(ids)
@@ -1,9 +1,9 @@
 from datetime import datetime
 import logging
 
-from chromadb import PersistentClient
-
+from context_builder import CHAT_KIND_PRIORITIES, CONTEXT_TOKEN_BUDGET, build_context, estimate_tokens, kind_for_label
 from ollama import OllamaLLM
+from storage import get_vectorstore, next_document_id
 
 
 logging.basicConfig(
@@ -13,18 +13,15 @@ logging.basicConfig(
     encoding='utf-8'
 )
 
-# Initialisiere Chroma mit persistentem Speicher
-client = PersistentClient(path="./Use_Case_2/Use_Case_2.2/backend/chroma_storage")
-
-# Erstelle oder erhalte eine Sammlung (Collection)
-vectorstore = client.get_or_create_collection(
-    name="conversation_context"
-)
 logger = logging.getLogger(__name__)
 
+DEFAULT_CHAT_SESSION = "chat"  # Sitzung des Chats, wenn der Client keine eigene angibt
+
 class ChatAgent:
-    def __init__(self, vectorstore):
-        self.vectorstore = vectorstore
+    def __init__(self, vectorstore=None, session_id=DEFAULT_CHAT_SESSION, job_id=None):
+        self.vectorstore = vectorstore if vectorstore is not None else get_vectorstore()
+        self.session_id = session_id
+        self.job_id = job_id
 
     def chat(self, user_input):
         log = {"agent": "ChatAgent", "status": "running", "details": []}
@@ -70,54 +67,75 @@ class ChatAgent:
             return {"log": log, "final_response": f"Fehler: {str(e)}"}
 
     def get_next_document_id(self):
-        """Ermittelt die nächste ID basierend auf der Anzahl der gespeicherten Dokumente."""
-        try:
-            all_data = self.vectorstore.get()  # Alle Daten abrufen
-            existing_ids = all_data.get("ids", [])
-            return str(len(existing_ids) + 1)
-        except Exception as e:
-            logger.error(f"Fehler beim Abrufen der nächsten ID: {e}")
-            return "1"  # Fallback auf ID "1", falls ein Fehler auftritt
+        """
+        Allocates the next document ID without reading the collection.
+
+        The IDs come from the process-wide allocator in storage.py, so concurrent
+        stores never receive the same ID and cannot overwrite each other.
+
+        Returns:
+            str: The next document ID as a string.
+        """
+        return next_document_id()
 
-    def store_context(self, label, data):
+    def store_context(self, label, data, kind=None, **extra_metadata):
         """Speichert den Kontext in ChromaDB mit einer fortlaufenden ID."""
         try:
             doc_id = self.get_next_document_id()  # Zugriff auf die Instanzmethode
-            metadata = {"timestamp": datetime.now().isoformat()}
+            metadata = {
+                "timestamp": datetime.now().isoformat(),
+                "kind": kind or kind_for_label(label),
+                "session_id": self.session_id,
+                **{key: str(value) for key, value in extra_metadata.items()}
+            }
             logger.info(f"Speichere Kontext: {label} -> {data} (ID: {doc_id})")  # Nur die ersten 100 Zeichen loggen
 
-            # Dokument speichern
-            self.vectorstore.upsert(
+            # Dokument speichern; Chatverläufe werden nur nach Metadaten gelesen und brauchen kein Embedding
+            self.vectorstore.add(
                 documents=[f"{label}: {data}"],
                 ids=[doc_id],
-                metadatas=[metadata]
+                metadatas=[metadata],
+                embed=False
             )
             logger.debug("Speichern erfolgreich.")
         except Exception as e:
             logger.error(f"Fehler beim Speichern des Kontexts: {e}")
 
-    def get_context(self):
-        """Ruft den gespeicherten Kontext aus ChromaDB ab."""
+    def context_where(self):
+        """
+        Returns the metadata filter of the chat context.
+
+        Returns:
+            dict: The where clause selecting the messages of this chat session and, if a job
+                is given, the documents of its book.
+        """
+        session_filter = {"session_id": self.session_id}
+        return {"$or": [session_filter, {"job_id": self.job_id}]} if self.job_id else session_filter
+
+    def get_context(self, max_tokens=CONTEXT_TOKEN_BUDGET):
+        """Ruft den gespeicherten Kontext innerhalb des Tokenbudgets aus ChromaDB ab."""
         try:
             logger.debug("Abfrage aller Dokumente aus der Collection.")
-            results = self.vectorstore.get()  # Alle Dokumente abrufen
+            results = self.vectorstore.get(where=self.context_where(), include=["documents", "metadatas"])  # Dokumente samt Art abrufen
             documents = results.get("documents", [])
-            logger.info(f"Kontext erfolgreich abgerufen: {len(documents)} Dokument(e) gefunden.")
-            return "\n".join(documents)
+            context = build_context(documents, results.get("metadatas"), max_tokens, priorities=CHAT_KIND_PRIORITIES)
+            logger.info(f"Kontext erfolgreich abgerufen: {len(documents)} Dokument(e) gefunden, {estimate_tokens(context)} Tokens verwendet.")
+            return context
         except Exception as e:
             logger.error(f"Fehler beim Abrufen des Kontexts: {e}")
             return "Standardkontext: Keine vorherigen Daten gefunden."
 
-    def get_context_all(self):
-        """Ruft alle gespeicherten Dokumente ab."""
+    def get_context_all(self, max_tokens=CONTEXT_TOKEN_BUDGET):
+        """Ruft die wichtigsten gespeicherten Dokumente innerhalb des Tokenbudgets ab."""
         try:
-            results = self.vectorstore.get()  # Alle Daten aus der Collection abrufen
+            results = self.vectorstore.get(where=self.context_where(), include=["documents", "metadatas"])  # Chat und Buch abrufen
             documents = results.get("documents", [])
             if not documents:
                 logger.warning("Keine gespeicherten Dokumente gefunden.")
                 return "Keine gespeicherten Dokumente verfügbar."
-            logger.info(f"{len(documents)} Dokument(e) erfolgreich abgerufen.")
-            return "\n".join(documents)
+            context = build_context(documents, results.get("metadatas"), max_tokens, priorities=CHAT_KIND_PRIORITIES)
+            logger.info(f"{len(documents)} Dokument(e) erfolgreich abgerufen, {estimate_tokens(context)} Tokens verwendet.")
+            return context
         except Exception as e:
             logger.error(f"Fehler beim Abrufen aller Dokumente: {e}")
             return "Standardkontext: Keine Dokumente gefunden."
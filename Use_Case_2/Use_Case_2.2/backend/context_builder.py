@@ -0,0 +1,199 @@
+import logging
+import math
+import re
+
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = 8000  # Maximale Tokenanzahl des Kontexts in einem Prompt
+MIN_TRUNCATED_TOKENS = 200  # Kürzere Reste werden nicht mehr mit einem gekürzten Eintrag gefüllt
+CHARS_PER_TOKEN = 4  # Durchschnittliche Zeichen pro Token bei langen Wörtern
+
+# Vortokenisierung wie bei BPE-Tokenizern: Wörter, Zahlen und Satzzeichen getrennt
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]+")
+
+# Priorität je Art des gespeicherten Eintrags (kleiner = wichtiger)
+KIND_PRIORITIES = {
+    "synopsis": 0,
+    "outline": 1,
+    "summary": 2,
+    "neighbour": 3,
+    "search": 4,
+    "subchapter": 5,
+    "chat": 6,
+    "other": 6,
+    "feedback": 7,
+    "final_text": 8
+}
+
+# Im Chat sind die bisherigen Nachrichten wichtiger als Suchergebnisse und Unterkapitel
+CHAT_KIND_PRIORITIES = {**KIND_PRIORITIES, "chat": 2}
+
+# Art der Einträge, die unter einem festen Label gespeichert werden
+LABEL_KINDS = {
+    "Synopsis": "synopsis",
+    "Chapters": "outline",
+    "Validated Summary": "summary",
+    "Search Results": "search",
+    "Failed Summary Validation": "feedback",
+    "Final Text": "final_text",
+    "User Input": "chat",
+    "AI Response": "chat"
+}
+
+
+def kind_for_label(label):
+    """
+    Returns the kind of entry stored under a label.
+
+    Args:
+        label (str): The label passed to store_context.
+
+    Returns:
+        str: The kind used for prioritisation, "other" for unknown labels.
+    """
+    return LABEL_KINDS.get(label, "other")
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens of a text without loading a tokenizer.
+
+    The text is split like the pre-tokenization step of BPE tokenizers; every piece counts
+    as one token, long pieces (e.g. German compound words) as one token per CHARS_PER_TOKEN characters.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return sum(max(1, math.ceil(len(piece) / CHARS_PER_TOKEN)) for piece in TOKEN_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Shortens a text to roughly the given number of tokens, keeping its beginning.
+
+    Args:
+        text (str): The text to shorten.
+        max_tokens (int): The number of tokens the result may have.
+
+    Returns:
+        str: The shortened text, marked with " [...]" if something was cut off.
+    """
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    cut = max(0, int(len(text) * max_tokens / tokens))
+    return text[:cut].rstrip() + " [...]"
+
+
+class ContextBuilder:
+    """Assembles prompt context from prioritised entries within a token budget."""
+
+    def __init__(self, max_tokens=CONTEXT_TOKEN_BUDGET):
+        """
+        Initializes an empty builder.
+
+        Args:
+            max_tokens (int, optional): The token budget of the assembled context. Defaults to CONTEXT_TOKEN_BUDGET.
+        """
+        self.max_tokens = max_tokens
+        self.entries = []
+
+    def add(self, text, priority, rank=0):
+        """
+        Adds a candidate entry.
+
+        Args:
+            text (str): The text of the entry.
+            priority (int): The priority class, lower values are included first.
+            rank (float, optional): Order within the priority class, lower values first. Defaults to 0.
+        """
+        if text:
+            self.entries.append((priority, rank, len(self.entries), text))
+
+    def build(self):
+        """
+        Selects entries by priority until the token budget is used up.
+
+        An entry that no longer fits completely is shortened if at least MIN_TRUNCATED_TOKENS
+        remain; all later entries of lower priority are left out.
+
+        Returns:
+            str: The selected entries separated by newlines.
+        """
+        remaining = self.max_tokens
+        selected = []
+        skipped = 0
+        for priority, rank, index, text in sorted(self.entries):
+            tokens = estimate_tokens(text)
+            if tokens <= remaining:
+                selected.append(text)
+                remaining -= tokens
+            elif remaining >= MIN_TRUNCATED_TOKENS:
+                selected.append(truncate_to_tokens(text, remaining))
+                remaining = 0
+            else:
+                skipped += 1
+        if skipped:
+            logger.debug(f"Kontextbudget von {self.max_tokens} Tokens erreicht, {skipped} Eintrag/Einträge ausgelassen.")
+        return "\n".join(selected)
+
+
+def build_context(documents, metadatas, max_tokens=CONTEXT_TOKEN_BUDGET, focus=None, priorities=KIND_PRIORITIES,
+                  relevance_ordered=False):
+    """
+    Builds a budgeted context from the documents of the collection.
+
+    Synopsis and chapter outline come first, followed by summaries, the subchapters next
+    to the focused subchapter, search results and the remaining entries (newest first).
+
+    Args:
+        documents (list): The stored documents in insertion order.
+        metadatas (list): The metadata of the documents ("kind", "chapter", "subchapter").
+        max_tokens (int, optional): The token budget. Defaults to CONTEXT_TOKEN_BUDGET.
+        focus (dict, optional): The subchapter currently worked on with the keys "chapter" and "subchapter".
+        priorities (dict, optional): The priority per kind of entry. Defaults to KIND_PRIORITIES.
+        relevance_ordered (bool, optional): Whether the documents are sorted by relevance (e.g. results of a
+            similarity query) instead of insertion order. Defaults to False.
+
+    Returns:
+        str: The assembled context.
+    """
+    builder = ContextBuilder(max_tokens)
+    metadatas = metadatas or [None] * len(documents)
+    total = len(documents)
+    for index, (document, metadata) in enumerate(zip(documents, metadatas)):
+        metadata = metadata or {}
+        kind = metadata.get("kind", "other")
+        age = index if relevance_ordered else total - index  # Relevantere bzw. neuere Einträge zuerst
+        rank = age
+        if kind == "subchapter" and focus and str(metadata.get("chapter")) == str(focus.get("chapter")):
+            kind = "neighbour"
+            rank = subchapter_distance(metadata.get("subchapter"), focus.get("subchapter"), age)
+        builder.add(document, priorities.get(kind, priorities["other"]), rank)
+    return builder.build()
+
+
+def subchapter_distance(number, focus_number, default):
+    """
+    Returns how far a subchapter number ("2.3") is from the focused one.
+
+    Args:
+        number (str): The number of the stored subchapter.
+        focus_number (str): The number of the focused subchapter.
+        default (float): The value returned if a number cannot be parsed.
+
+    Returns:
+        float: The distance; the directly preceding subchapter is the closest.
+    """
+    try:
+        position = int(str(number).split(".")[-1])
+        focus_position = int(str(focus_number).split(".")[-1])
+    except (TypeError, ValueError):
+        return default
+    distance = focus_position - position
+    # Vorherige Unterkapitel sind wichtiger als nachfolgende
+    return distance if distance > 0 else abs(distance) + 0.5
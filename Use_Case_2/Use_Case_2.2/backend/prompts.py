@@ -0,0 +1,32 @@
+import hashlib
+
+
+def shared_prefix_prompt(payload, instruction, payload_label="Text"):
+    """
+    Builds a prompt that starts with the large payload and ends with the instruction.
+
+    Prompts for the same payload are identical up to the instruction, so a server with
+    prefix caching only has to prefill the payload once.
+
+    Args:
+        payload (str): The large invariant part, e.g. the text of the book.
+        instruction (str): The task of the individual agent.
+        payload_label (str, optional): The heading in front of the payload. Defaults to "Text".
+
+    Returns:
+        str: The prompt.
+    """
+    return f"{payload_label}:\n{payload}\n\n{instruction.strip()}\n"
+
+
+def prefix_cache_key(payload):
+    """
+    Returns a short key identifying the payload of a shared-prefix prompt.
+
+    Args:
+        payload (str): The large invariant part of the prompt.
+
+    Returns:
+        str: The first 16 hex digits of the SHA-256 hash of the payload.
+    """
+    return hashlib.sha256(str(payload).encode("utf-8")).hexdigest()[:16]
@@ -1,14 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+import contextvars
 from datetime import datetime
+import itertools
 import json
 import logging
 import os
 import re
+import threading
+import time
 import uuid
 
-from chromadb import PersistentClient
-import requests
-
-from ollama import OllamaLLM
+from checkpoints import CheckpointStore, load_checkpoint
+from context_builder import CONTEXT_TOKEN_BUDGET, build_context, estimate_tokens, kind_for_label
+from duckduckgo import search as web_search
+from llm_cache import ResponseCache, cache_key
+from ollama import MAX_PARALLEL_REQUESTS, OllamaLLM, get_llm_client
+from prompts import prefix_cache_key, shared_prefix_prompt
+from scheduler import deadline_context
+from storage import get_vectorstore, next_document_id
+from summaries import SUBCHAPTER_SUMMARY_WORDS, RollingSummaries, limit_words, summarize_book
 
 
 logging.basicConfig(
@@ -18,27 +28,97 @@ logging.basicConfig(
     encoding='utf-8'
 )
 
-# Initialisiere Chroma mit persistentem Speicher
-client = PersistentClient(path="./Use_Case_3/Use_Case_3.1/backend/chroma_storage")
+logger = logging.getLogger(__name__)
 
-# Erstelle oder erhalte eine Sammlung (Collection)
-vectorstore = client.get_or_create_collection(
-    name="conversation_context"
+STREAM_LOG_INTERVAL = 2000  # Fortschritt beim Streamen alle 2000 Zeichen loggen
+WRITING_WORKERS = MAX_PARALLEL_REQUESTS  # Gleichzeitig geschriebene Kapitel, ihre Unterkapitel jeweils nacheinander
+EVALUATION_WORKERS = MAX_PARALLEL_REQUESTS  # Gleichzeitig laufende Bewertungsagenten
+EVALUATION_TIMEOUT = 900  # Sekunden pro Bewertungsagent
+DETERMINISTIC_EVALUATION = False  # True: Bewertungen mit temperature 0, wiederholte Bewertungen kommen aus dem Antwort-Cache
+EVALUATION_INSTRUCTION = (
+    "Gib eine Bewertung so streng wie mögliche auf einer Skala von 0 bis 100 ab. Ohne /100 sondern nur deine Bewertung.\n"
+    "Erkläre, warum du diese Bewertung vergeben hast, und schlage Verbesserungen vor."
 )
-logger = logging.getLogger(__name__)
+EVALUATION_MODE = "separate"  # "separate": sieben Einzelbewertungen, "combined": eine JSON-Bewertung, "chunked": pro Kapitel
+CHAPTER_EVALUATION_WORKERS = MAX_PARALLEL_REQUESTS  # Gleichzeitige Bewertungen (Kapitel und Kriterium) im Modus "chunked"
+CHAPTER_SCORE_AGGREGATION = "weighted_mean"  # "weighted_mean" (nach Kapitellänge), "mean" oder "min"
+CHAPTER_SCORE_CACHE_DIR = "./Use_Case_3/Use_Case_3.1/backend/evaluation_cache"  # Bewertungen einzelner Kapitel, Schlüssel ist der Kapiteltext
+COMBINED_EVALUATION_INSTRUCTION = (
+    "Gib für jedes Kriterium eine Bewertung so streng wie möglich auf einer Skala von 0 bis 100 ab "
+    "und erkläre, warum du diese Bewertung vergeben hast, mit Verbesserungsvorschlägen. "
+    "Antworte ausschließlich mit einem JSON-Objekt, das für jedes Kriterium \"score\" und \"begruendung\" enthält."
+)
+
+# Kriterien der kombinierten Bewertung in der Reihenfolge der Gewichtungen von calculate_final_score
+EVALUATION_CRITERIA = [
+    ("kapitel", "ChapterEvaluationAgent", "Struktur, Konsistenz und Übergänge der Kapitel"),
+    ("absaetze", "ParagraphEvaluationAgent", "Lesefluss, Fokus und logische Verknüpfung der Absätze"),
+    ("buchart", "BookTypeEvaluationAgent", "Eignung der Buchart für Zielgruppe und Thema"),
+    ("inhalt", "ContentEvaluationAgent", "Tiefe, Relevanz und Fokus des Inhalts auf das Thema"),
+    ("grammatik", "GrammarEvaluationAgent", "Grammatik und Rechtschreibung"),
+    ("stil", "StyleEvaluationAgent", "Abwechslung, Tonalität und Authentizität des Schreibstils"),
+    ("spannung", "TensionEvaluationAgent", "Wendepunkte, Aufbau und Charakterentwicklung der Spannung")
+]
+
+# JSON-Schema der kombinierten Bewertung
+EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        key: {
+            "type": "object",
+            "properties": {
+                "score": {"type": "integer", "minimum": 0, "maximum": 100},
+                "begruendung": {"type": "string"}
+            },
+            "required": ["score", "begruendung"]
+        }
+        for key, _, _ in EVALUATION_CRITERIA
+    },
+    "required": [key for key, _, _ in EVALUATION_CRITERIA]
+}
+PIPELINE_PHASES = ["decision", "synopsis", "chapters", "writing", "summary", "evaluation"]  # Schritte von run_agents
+REWRITE_ROUNDS = 3  # Gezielte Überarbeitungen nach abgelehnten Zusammenfassungen, danach wird der Text übernommen
+
+# JSON-Schema der Unterkapitel, die nach einer abgelehnten Zusammenfassung überarbeitet werden
+REWRITE_SCHEMA = {
+    "type": "object",
+    "properties": {"unterkapitel": {"type": "array", "items": {"type": "string"}}},
+    "required": ["unterkapitel"]
+}
+RETRIEVAL_TOP_K = 6  # Anzahl ähnlicher Dokumente pro Abfrage
+QUERY_MAX_CHARS = 2000  # Längere Abfragetexte werden für das Embedding gekürzt
+RETRIEVAL_KINDS = ["subchapter", "search", "summary", "other"]  # Per Ähnlichkeit abgefragte Arten
+SUBCHAPTER_RETRIEVAL_KINDS = ["search"]  # Zusätzlich zur Kapitelzusammenfassung abgefragte Arten beim Schreiben
+
+# AgentSystem der laufenden Anfrage, damit alle Agenten dieselbe Sitzung verwenden
+active_agent_system = contextvars.ContextVar("active_agent_system", default=None)
 
 class AgentSystem:
-    def __init__(self):
+    def __init__(self, vectorstore=None):
         """
         Initializes a new instance of the agent class.
 
+        Args:
+            vectorstore (BufferedCollection, optional): The context collection. Defaults to the shared
+                collection of storage.py, opened on first use.
+
         Attributes:
             agents (list): A list to store agent instances.
             session_id (str): A unique identifier for the session, generated using UUID.
+            job_id (str): The job of the running pipeline, stored with every document; None outside of jobs.
         """
         self.agents = []
+        self._vectorstore = vectorstore
+        self.job_id = None
         self.session_id = str(uuid.uuid4())  # Eindeutige ID für die Sitzung
 
+    @property
+    def vectorstore(self):
+        """BufferedCollection: The context collection of this instance."""
+        if self._vectorstore is None:
+            self._vectorstore = get_vectorstore()
+        return self._vectorstore
+
     def add_agent(self, agent_function, kontrolliert=False):
         """
         Adds an agent to the list of agents.
@@ -52,13 +132,124 @@ class AgentSystem:
         """
         self.agents.append({"function": agent_function, "kontrolliert": kontrolliert})
 
-    def run_agents(self, user_input, min_chapter=0, min_subchapter=0):
+    def run_agents(self, user_input, min_chapter=0, min_subchapter=0, evaluation_mode=None, progress=None,
+                   job_id=None):
+        """
+        Runs the agent pipeline with this instance as the active agent system.
+
+        All agents called during the run store and retrieve their context through
+        get_agent_system(), so they share the session ID of this instance. With a job ID
+        every completed step is saved to the checkpoint of the job and skipped when the
+        same job is run again, see resume_agents.
+
+        Args:
+            user_input (str): The input provided by the user.
+            min_chapter (int, optional): Minimum number of chapters to generate. Defaults to 0.
+            min_subchapter (int, optional): Minimum number of subchapters to generate. Defaults to 0.
+            evaluation_mode (str, optional): "separate", "combined" or "chunked" book evaluation. Defaults to EVALUATION_MODE.
+            progress (callable, optional): Called as progress(phase, step=..., total_steps=..., **details)
+                whenever the pipeline enters a phase of PIPELINE_PHASES or finishes a subchapter. Defaults to None.
+            job_id (str, optional): The job whose checkpoint is written and resumed. Defaults to None (no checkpoint).
+
+        Returns:
+            dict: The result of the pipeline, see _run_agents.
+        """
+        checkpoint = None
+        self.job_id = job_id
+        if job_id:
+            # Zwischenstände dauerhaft speichern; beim Fortsetzen dieselbe Sitzung weiterverwenden
+            checkpoint = CheckpointStore(job_id)
+            self.session_id = checkpoint.params.get("session_id", self.session_id)
+            checkpoint.set_params(
+                user_input=user_input,
+                min_chapter=min_chapter,
+                min_subchapter=min_subchapter,
+                evaluation_mode=evaluation_mode,
+                session_id=self.session_id
+            )
+        token = active_agent_system.set(self)
+        try:
+            return self._run_agents(user_input, min_chapter=min_chapter, min_subchapter=min_subchapter,
+                                    evaluation_mode=evaluation_mode, progress=progress, checkpoint=checkpoint)
+        finally:
+            active_agent_system.reset(token)
+
+    def resume_agents(self, job_id, progress=None):
+        """
+        Resumes an interrupted run from the checkpoint of its job.
+
+        Validated synopsis, chapter structure, written subchapters, the validated summary and
+        completed evaluations are taken from the checkpoint; only the missing steps are run.
+
+        Args:
+            job_id (str): The job to resume.
+            progress (callable, optional): Receives the current phase and progress details. Defaults to None.
+
+        Returns:
+            dict: The result of the pipeline, see _run_agents.
+
+        Raises:
+            ValueError: If the job has no checkpoint.
+        """
+        checkpoint = load_checkpoint(job_id)
+        if checkpoint is None:
+            raise ValueError(f"Kein Checkpoint für Job {job_id} gefunden.")
+        if checkpoint.state["status"] == "completed":
+            logger.info(f"Job {job_id} ist bereits abgeschlossen.")
+            return checkpoint.state["result"]
+        params = checkpoint.params
+        logger.info(f"Setze Job {job_id} fort, abgeschlossene Schritte: {list(checkpoint.state['phases'])}")
+        return self.run_agents(
+            params["user_input"],
+            min_chapter=params.get("min_chapter", 0),
+            min_subchapter=params.get("min_subchapter", 0),
+            evaluation_mode=params.get("evaluation_mode"),
+            progress=progress,
+            job_id=job_id
+        )
+
+    def restore_context(self, checkpoint):
+        """
+        Stores the checkpointed results of a resumed run again if the collection no longer contains them,
+        e.g. because the Chroma storage was deleted on restart.
+
+        Args:
+            checkpoint (CheckpointStore): The checkpoint of the resumed job.
+        """
+        try:
+            if self.vectorstore.get(where=self.session_where(), limit=1, include=[])["ids"]:
+                return  # Kontext der Sitzung ist noch vorhanden
+        except Exception as e:
+            logger.error(f"Fehler beim Prüfen des gespeicherten Kontexts: {e}")
+            return
+        logger.info(f"Stelle Kontext der Sitzung {self.session_id} aus dem Checkpoint wieder her.")
+        if checkpoint.get("synopsis"):
+            self.store_context("Synopsis", checkpoint.get("synopsis"))
+        if checkpoint.get("chapters"):
+            self.store_context("Chapters", checkpoint.get("chapters"))
+        for key, subchapter in checkpoint.get("subchapters", {}).items():
+            self.store_context(
+                subchapter["Title"],
+                subchapter["Content"],
+                kind="subchapter",
+                chapter=key.split("/", 1)[0],
+                subchapter=subchapter["Number"]
+            )
+        if checkpoint.get("summary"):
+            self.store_context("Validated Summary", checkpoint.get("summary"))
+
+    def _run_agents(self, user_input, min_chapter=0, min_subchapter=0, evaluation_mode=None, progress=None,
+                    checkpoint=None):
         """
         Executes a series of agents to process the user input and generate a final book evaluation.
         Args:
             user_input (str): The input provided by the user.
             min_chapter (int, optional): Minimum number of chapters to generate. Defaults to 0.
             min_subchapter (int, optional): Minimum number of subchapters to generate. Defaults to 0.
+            evaluation_mode (str, optional): "separate", "combined" or "chunked" book evaluation. Defaults to EVALUATION_MODE.
+            progress (callable, optional): Receives the current phase and progress details. Defaults to None.
+            checkpoint (CheckpointStore, optional): Saves completed steps and provides those of an earlier
+                attempt, which are skipped. Defaults to None.
         Returns:
             dict: A dictionary containing the final grade and detailed results of the book evaluation.
         Raises:
@@ -69,6 +260,7 @@ class AgentSystem:
             3. Chapter Structure Agent: Generates and validates the chapter structure.
             4. Writing Agent: Writes the chapters based on the validated structure.
             5. Summary Generation and Validation: Creates and validates the summary of the final text.
+               If it is rejected, only the subchapters blamed for it are rewritten, for at most REWRITE_ROUNDS rounds.
             6. Book Evaluation: Evaluates the book based on various criteria and calculates the final grade.
         Logs:
             - Logs various debug, info, and error messages throughout the process.
@@ -76,20 +268,40 @@ class AgentSystem:
         """
         logger.debug(f"run_agents called with user_input: {user_input}, min_chapter: {min_chapter}")
         response_data = {"steps": [], "final_response": ""}
-        context = self.get_context()
 
-        # Entscheidung vor der Synopsis-Agent
-        logger.debug("Entscheide, ob eine Internetsuche für die Synopsis erforderlich ist...")
-        decision_result = decision_agent(context, user_input, task_type="Synopsis")
-        response_data["steps"].append(decision_result["log"])
+        current_phase = {"name": None}
+
+        def report(phase, **details):
+            # Beim Wechsel der Phase gepufferte Dokumente der vorherigen Phase schreiben
+            if phase != current_phase["name"]:
+                current_phase["name"] = phase
+                self.vectorstore.flush()
+            # Fortschritt an den Aufrufer melden, z. B. an den JobManager
+            if progress:
+                progress(phase, step=PIPELINE_PHASES.index(phase) + 1, total_steps=len(PIPELINE_PHASES), **details)
 
-        if decision_result["output"] == "Ja":
-            logger.info("Internetsuche wurde bereits durchgeführt. Ergebnisse werden verwendet.")
+        if checkpoint:
+            self.restore_context(checkpoint)
+        validated_synopsis = checkpoint.get("synopsis") if checkpoint else None
+
+        if validated_synopsis:
+            logger.info("Validierte Synopsis aus dem Checkpoint übernommen.")
         else:
-            logger.info("Keine Internetsuche erforderlich.")
+            context = self.query_context(user_input)
+
+            # Entscheidung vor der Synopsis-Agent
+            report("decision")
+            logger.debug("Entscheide, ob eine Internetsuche für die Synopsis erforderlich ist...")
+            decision_result = decision_agent(context, user_input, task_type="Synopsis")
+            response_data["steps"].append(decision_result["log"])
+
+            if decision_result["output"] == "Ja":
+                logger.info("Internetsuche wurde bereits durchgeführt. Ergebnisse werden verwendet.")
+            else:
+                logger.info("Keine Internetsuche erforderlich.")
 
         # Schritt 2: Synopsis-Agent
-        validated_synopsis = None
+        report("synopsis")
         while not validated_synopsis:
             logger.debug("Starting synopsis_agent...")
             synopsis_result = synopsis_agent(user_input, context)
@@ -107,13 +319,18 @@ class AgentSystem:
                     # Speichere die validierte Synopsis
                     synopsis_id = self.store_context("Synopsis", validated_synopsis)
                     logger.info(f"Validierte Synopsis gespeichert mit ID: {synopsis_id}")
+                    if checkpoint:
+                        checkpoint.save("synopsis", validated_synopsis)
                 else:
                     logger.error(f"Validierung fehlgeschlagen: {validation_result['log']['output']}. Wiederhole...")
             else:
                 logger.error("Fehler beim Erstellen der Synopsis. Wiederhole...")
 
         # Schritt 3: Kapitelstruktur-Agent
-        validated_chapters = None
+        report("chapters")
+        validated_chapters = checkpoint.get("chapters") if checkpoint else None
+        if validated_chapters:
+            logger.info("Validierte Kapitelstruktur aus dem Checkpoint übernommen.")
         while not validated_chapters:
             logger.debug("Starting chapter_agent...")
             chapter_result = chapter_agent(min_chapter=min_chapter, min_subchapter=min_subchapter)  # min_chapter übergeben
@@ -128,17 +345,43 @@ class AgentSystem:
                     validated_chapters = chapter_result["output"]
                     # Speichere die validierten Kapitel im Kontext
                     self.store_context("Chapters", validated_chapters)
+                    if checkpoint:
+                        checkpoint.save("chapters", validated_chapters)
                 else:
                     logger.error("Kapitelvalidierung fehlgeschlagen. Wiederhole...")
             else:
                 logger.error("chapter_agent did not complete, retrying...")
         
-        while True:
+        # Geschriebene Unterkapitel liegen im Checkpoint, nach der Prüfung der Zusammenfassung auch der ganze Text
+        summary_validated = bool(checkpoint and checkpoint.get("summary"))
+        summary_rejected = bool(checkpoint and checkpoint.get("summary_rejected")) and not summary_validated
+        final_text = checkpoint.get("final_text") if summary_validated or summary_rejected else None
+        if summary_validated:
+            logger.info("Text und validierte Zusammenfassung aus dem Checkpoint übernommen.")
+        elif summary_rejected:
+            logger.warning("Text mit abgelehnter Zusammenfassung aus dem Checkpoint übernommen.")
+
+        # Beim Schreiben berechnete Zusammenfassungen, die Gesamtzusammenfassung verwendet sie wieder
+        summaries = RollingSummaries({"chapters": checkpoint.get("chapter_summaries", {})} if checkpoint else None)
+        rewrite = None  # Unterkapitel, die nach einer abgelehnten Zusammenfassung neu geschrieben werden
+        rewrite_round = 0
+
+        while not (summary_validated or summary_rejected):
             # Schritt 4: Schreiben der Kapitel
+            report("writing")
+            previous_text = final_text
             final_text = None
             while not final_text:
                 logger.debug("Starting writing_agent...")
-                writing_result = writing_agent(user_input, validated_chapters)
+                writing_result = writing_agent(
+                    user_input,
+                    validated_chapters,
+                    progress=lambda **details: report("writing", **details),
+                    checkpoint=checkpoint,
+                    summaries=summaries,
+                    previous=previous_text,
+                    rewrite=rewrite
+                )
                 logger.debug(f"writing_agent result: {writing_result}")
                 response_data["steps"].append(writing_result["log"])
 
@@ -150,35 +393,49 @@ class AgentSystem:
                     logger.error("Writing failed, retrying...")
 
             # Schritt 5: Erstellung und Validierung der Gesamtszusammenfassung
-            summary = generate_summary(final_text=final_text)  # Gesamter Text wird übergeben
+            report("summary")
+            summary = generate_summary(final_text=final_text, summaries=summaries)  # Map-Reduce über die Unterkapitel
             logger.debug("Validiere Zusammenfassung...")
             validation_result = validate_summary(summary)
 
             if validation_result.get("Validated", False):
                 logger.info("Zusammenfassung erfolgreich validiert.")
                 self.store_context("Validated Summary", validation_result)
+                if checkpoint:
+                    checkpoint.save("final_text", final_text)
+                    checkpoint.save("summary", validation_result)
                 break  # Beende die äußere Schleife, da alles erfolgreich abgeschlossen ist
-            else:
-                logger.warning("Zusammenfassung ist fehlerhaft. Wiederhole den gesamten Schreibprozess...")
-                final_text = None  # Setze den final_text zurück, um den Schreibprozess erneut zu starten
+            rewrite = (
+                find_rewrite_targets(final_text, validation_result, summaries, outline=validated_chapters)
+                if rewrite_round < REWRITE_ROUNDS else []
+            )
+            if not rewrite:
+                # Ohne verantwortliche Unterkapitel wird der Text bewertet, aber als nicht validiert gekennzeichnet
+                logger.warning("Zusammenfassung nicht validiert, keine Überarbeitung möglich. Text wird ohne Validierung bewertet.")
+                summary_rejected = True
+                if checkpoint:
+                    checkpoint.save("final_text", final_text)
+                    checkpoint.save("summary_rejected", {**validation_result, "rewrite_rounds": rewrite_round})
+                break
+            rewrite_round += 1
+            logger.warning(
+                f"Zusammenfassung ist fehlerhaft. Überarbeite {len(rewrite)} Unterkapitel "
+                f"(Runde {rewrite_round}/{REWRITE_ROUNDS}): {', '.join(rewrite)}"
+            )
+            # Verworfene Unterkapitel und die alte Fassung nicht mehr als Kontext verwenden
+            where = subchapter_where(final_text, rewrite)
+            if where:
+                self.compact("subchapter", condition=where)
+            self.compact("final_text")
+            summaries.discard(rewrite)
+            if checkpoint:
+                checkpoint.save("chapter_summaries", summaries.snapshot()["chapters"])
                 
         # Schritt 6: Buch bewerten
+        report("evaluation")
         logger.debug("Starte Buchbewertung...")
-        weighted_scores_with_details = []
-
-        agents = [
-            evaluate_chapters,
-            evaluate_paragraphs,
-            evaluate_book_type,
-            evaluate_content,
-            evaluate_grammar,
-            evaluate_style,
-            evaluate_tension
-        ]
 
-        for agent in agents:
-            result = agent(final_text)
-            weighted_scores_with_details.append(result)
+        weighted_scores_with_details = evaluate_book(final_text, evaluation_mode or EVALUATION_MODE, checkpoint=checkpoint)
 
         # Extrahiere die Scores und Details
         scores = [entry["output"] for entry in weighted_scores_with_details]
@@ -200,7 +457,8 @@ class AgentSystem:
 
         terminal_output = {
             "final_grade": final_evaluation,
-            "detailed_results": details
+            "detailed_results": details,
+            "summary_validation": "failed" if summary_rejected else "validated"  # Abgelehnte Zusammenfassung kenntlich machen
         }
 
         # Validierung vor Rückgabe
@@ -208,6 +466,10 @@ class AgentSystem:
             logger.error(f"Fehler in terminal_output: {terminal_output}")
             raise ValueError("terminal_output ist unvollständig.")
 
+        self.compact("feedback")  # Rückmeldungen der Validierung werden nach Abschluss nicht mehr benötigt
+        self.vectorstore.flush()
+        if checkpoint:
+            checkpoint.complete(terminal_output)
         logger.debug(f"All agents completed. Returning terminal_output: {terminal_output}")
         return terminal_output
 
@@ -215,29 +477,29 @@ class AgentSystem:
 
     def get_next_document_id(self):
         """
-        Determines the next document ID based on the number of stored documents.
+        Allocates the next document ID without reading the collection.
 
-        This method retrieves all stored data from the vector store and calculates
-        the next document ID by counting the existing IDs. If an error occurs during
-        the retrieval process, it logs the error and returns "1" as a fallback ID.
+        The IDs come from the process-wide allocator in storage.py, so concurrent
+        stores never receive the same ID and cannot overwrite each other.
 
         Returns:
             str: The next document ID as a string.
         """
-        try:
-            all_data = vectorstore.get()  # Alle Daten abrufen
-            existing_ids = all_data.get("ids", [])
-            return str(len(existing_ids) + 1)
-        except Exception as e:
-            logger.error(f"Fehler beim Abrufen der nächsten ID: {e}")
-            return "1"  # Fallback auf ID "1", falls ein Fehler auftritt
+        return next_document_id()
 
-    def store_context(self, label, data):
+    def store_context(self, label, data, kind=None, **extra_metadata):
         """
         Stores the context in ChromaDB with a sequential ID.
+
+        The document is buffered and written together with others in one upsert,
+        at the latest on the next read of the collection. Only kinds in RETRIEVAL_KINDS
+        are embedded; all others are only ever read by metadata.
         Args:
             label (str): The label associated with the context.
             data (str): The context data to be stored.
+            kind (str, optional): The kind of entry used to prioritise it in the context. Derived from the label if not given.
+            **extra_metadata: Additional metadata such as the chapter and subchapter number.
+                The label, the session ID and, within a job, the job ID are always stored, so entries can be filtered.
         Raises:
             Exception: If there is an error while storing the context.
         Logs:
@@ -247,54 +509,144 @@ class AgentSystem:
         """
         try:
             doc_id = self.get_next_document_id()  # Zugriff auf die Instanzmethode
-            metadata = {"timestamp": datetime.now().isoformat()}
+            metadata = {
+                "timestamp": datetime.now().isoformat(),
+                "kind": kind or kind_for_label(label),
+                "label": str(label)[:200],
+                "session_id": self.session_id,
+                **({"job_id": self.job_id} if self.job_id else {}),
+                **{key: str(value) for key, value in extra_metadata.items()}
+            }
             logger.info(f"Speichere Kontext: {label} -> {data} (ID: {doc_id})")  # Nur die ersten 100 Zeichen loggen
 
-            # Dokument speichern
-            vectorstore.upsert(
+            # Dokument puffern, geschrieben wird gebündelt
+            self.vectorstore.add(
                 documents=[f"{label}: {data}"],
                 ids=[doc_id],
-                metadatas=[metadata]
+                metadatas=[metadata],
+                embed=metadata["kind"] in RETRIEVAL_KINDS
             )
             logger.debug("Speichern erfolgreich.")
         except Exception as e:
             logger.error(f"Fehler beim Speichern des Kontexts: {e}")
 
-    def get_context(self):
+    def session_where(self, condition=None):
+        """
+        Returns the metadata filter that restricts a read to the documents of this session.
+
+        Args:
+            condition (dict, optional): A further filter, e.g. on the kind. Defaults to None.
+
+        Returns:
+            dict: The where clause for Chroma.
+        """
+        session_filter = {"session_id": self.session_id}
+        return {"$and": [session_filter, condition]} if condition else session_filter
+
+    def compact(self, *kinds, condition=None):
+        """
+        Deletes the documents of the given kinds from this session, e.g. a discarded draft.
+
+        Args:
+            *kinds (str): The kinds to delete, e.g. "subchapter" and "final_text".
+            condition (dict, optional): A further filter, e.g. on chapter and subchapter. Defaults to None.
         """
-        Retrieves the stored context from ChromaDB.
+        try:
+            where = {"kind": {"$in": list(kinds)}}
+            if condition:
+                where = {"$and": [where, condition]}
+            self.vectorstore.delete(where=self.session_where(where))
+            logger.info(f"Sitzung {self.session_id}: Einträge der Arten {', '.join(kinds)} entfernt.")
+        except Exception as e:
+            logger.error(f"Fehler beim Verdichten der Sitzung {self.session_id}: {e}")
 
-        This method fetches all documents from the collection in the vector store.
-        If successful, it returns the documents as a single string, with each document
-        separated by a newline character. If an error occurs during retrieval, it logs
-        the error and returns a default context message.
+    def get_context(self, max_tokens=CONTEXT_TOKEN_BUDGET, focus=None):
+        """
+        Retrieves the stored context of the current session from ChromaDB within a token budget.
+
+        Instead of concatenating the whole collection, the entries are prioritised
+        (synopsis, chapter outline, summaries, neighbouring subchapters, search results)
+        and added until the budget is used up, so the prompt size stays bounded
+        regardless of the length of the book.
+
+        Args:
+            max_tokens (int, optional): The token budget of the context. Defaults to CONTEXT_TOKEN_BUDGET.
+            focus (dict, optional): The subchapter currently worked on ("chapter" and "subchapter"),
+                whose neighbouring subchapters are preferred.
 
         Returns:
-            str: The concatenated string of all documents or a default context message
+            str: The selected documents separated by newlines or a default context message
                  if an error occurs.
         """
+        """Ruft den gespeicherten Kontext aus ChromaDB ab."""
         try:
             logger.debug("Abfrage aller Dokumente aus der Collection.")
-            results = vectorstore.get()  # Alle Dokumente abrufen
+            results = self.vectorstore.get(where=self.session_where(), include=["documents", "metadatas"])  # Nur diese Sitzung
             documents = results.get("documents", [])
-            logger.info(f"Kontext erfolgreich abgerufen: {len(documents)} Dokument(e) gefunden.")
-            return "\n".join(documents)
+            context = build_context(documents, results.get("metadatas"), max_tokens, focus)
+            logger.info(f"Kontext erfolgreich abgerufen: {len(documents)} Dokument(e) gefunden, {estimate_tokens(context)} Tokens verwendet.")
+            return context
         except Exception as e:
             logger.error(f"Fehler beim Abrufen des Kontexts: {e}")
             return "Standardkontext: Keine vorherigen Daten gefunden."
 
-    def get_context_all(self):
+    def query_context(self, query_text, n_results=RETRIEVAL_TOP_K, max_tokens=CONTEXT_TOKEN_BUDGET, focus=None,
+                      kinds=RETRIEVAL_KINDS):
         """
-        Retrieves all documents from the vector store collection.
+        Retrieves the documents of the current session that are most similar to the query text.
+
+        Synopsis and chapter outline of the session are always included; further entries
+        come from a top-k similarity query on the collection, filtered by the session ID.
+        Falls back to get_context if the query fails.
+
+        Args:
+            query_text (str): The text to search for, e.g. the title of a subchapter.
+            n_results (int, optional): The number of similar documents. Defaults to RETRIEVAL_TOP_K.
+            max_tokens (int, optional): The token budget of the context. Defaults to CONTEXT_TOKEN_BUDGET.
+            focus (dict, optional): The subchapter currently worked on ("chapter" and "subchapter").
+            kinds (list, optional): The kinds of entries the similarity query considers. Defaults to RETRIEVAL_KINDS.
 
-        This method attempts to fetch all documents stored in the vector store.
+        Returns:
+            str: The selected documents separated by newlines.
+        """
+        try:
+            anchors = self.vectorstore.get(
+                where=self.session_where({"kind": {"$in": ["synopsis", "outline"]}}),
+                include=["documents", "metadatas"]
+            )
+            documents = anchors.get("documents", [])
+            metadatas = anchors.get("metadatas", [])
+            if query_text:
+                results = self.vectorstore.query(
+                    query_texts=[str(query_text)[:QUERY_MAX_CHARS]],
+                    n_results=n_results,
+                    where=self.session_where({"kind": {"$in": list(kinds)}}),
+                    include=["documents", "metadatas"]
+                )
+                documents += results["documents"][0]
+                metadatas += results["metadatas"][0]
+            context = build_context(documents, metadatas, max_tokens, focus, relevance_ordered=True)
+            logger.info(f"Ähnlichkeitsabfrage: {len(documents)} Dokument(e) gefunden, {estimate_tokens(context)} Tokens verwendet.")
+            return context
+        except Exception as e:
+            logger.error(f"Fehler bei der Ähnlichkeitsabfrage, verwende gesamten Kontext: {e}")
+            return self.get_context(max_tokens, focus)
+
+    def get_context_all(self, max_tokens=CONTEXT_TOKEN_BUDGET):
+        """
+        Retrieves all documents of the current session from the vector store collection.
+
+        This method attempts to fetch all documents of the session stored in the vector store.
         If no documents are found, it logs a warning and returns a message indicating
         that no documents are available. If documents are successfully retrieved,
         it logs the number of documents and returns them as a single string, with each
         document separated by a newline character.
 
+        Args:
+            max_tokens (int, optional): The token budget of the context. Defaults to CONTEXT_TOKEN_BUDGET.
+
         Returns:
-            str: A string containing all retrieved documents separated by newlines,
+            str: The prioritised documents within the token budget separated by newlines,
                  or a message indicating that no documents are available.
 
         Raises:
@@ -302,13 +654,14 @@ class AgentSystem:
                        and returns a default context message indicating no documents were found.
         """
         try:
-            results = vectorstore.get()  # Alle Daten aus der Collection abrufen
+            results = self.vectorstore.get(where=self.session_where(), include=["documents", "metadatas"])  # Alle Daten der Sitzung
             documents = results.get("documents", [])
             if not documents:
                 logger.warning("Keine gespeicherten Dokumente gefunden.")
                 return "Keine gespeicherten Dokumente verfügbar."
-            logger.info(f"{len(documents)} Dokument(e) erfolgreich abgerufen.")
-            return "\n".join(documents)
+            context = build_context(documents, results.get("metadatas"), max_tokens)
+            logger.info(f"{len(documents)} Dokument(e) erfolgreich abgerufen, {estimate_tokens(context)} Tokens verwendet.")
+            return context
         except Exception as e:
             logger.error(f"Fehler beim Abrufen aller Dokumente: {e}")
             return "Standardkontext: Keine Dokumente gefunden."
@@ -329,7 +682,7 @@ class AgentSystem:
         """
         try:
             logger.debug("Validiere gespeicherte Daten...")
-            results = vectorstore.get(where={"metadata.session_id": {"$eq": self.session_id}})
+            results = self.vectorstore.get(where=self.session_where(), include=["documents"])
             logger.debug(f"Validierungsergebnis: {results}")
             if not results.get("documents", []):
                 logger.error("Gespeicherte Daten konnten nicht abgerufen werden.")
@@ -338,6 +691,17 @@ class AgentSystem:
             logger.error(f"Fehler bei der Validierung gespeicherter Daten: {e}")
             return []
 
+def get_agent_system():
+    """
+    Returns the AgentSystem of the running pipeline.
+
+    Returns:
+        AgentSystem: The instance bound by run_agents, or the module-wide agent_system
+            if no pipeline is running in the current context.
+    """
+    return active_agent_system.get() or agent_system
+
+
 def sanitize_filename(filename):
     """
     Sanitize the given filename by removing any invalid characters.
@@ -511,7 +875,9 @@ def decision_agent(context, input_text, task_type="Synopsis"):
         logger.debug(f"Prompt für DecisionAgent (Task-Typ: {task_type}):\n{prompt}")
         
         llm = OllamaLLM()
-        response = llm._call(prompt).strip().rstrip('.').lower()  # Bereinige die Antwort
+        # Nur das Urteil wird benötigt, die Antwort ist auf wenige Tokens begrenzt
+        verdict = llm.verdict(prompt, with_reason=False)
+        response = (verdict["verdict"] or verdict["raw"]).strip().rstrip('.').lower()  # Bereinige die Antwort
         logger.debug(f"Antwort von LLM für DecisionAgent: {response}")
 
         if response not in ["ja", "nein"]:
@@ -620,16 +986,11 @@ def SearchQueryAgent(input_text, context, task_type="Synopsis"):
             logger.error(f"Fehler im SearchQueryAgent: {e}")
             return {"log": log, "search_query": f"Fehler: {str(e)}"}
 
-    # Nach erfolgreicher Validierung: Anfrage an den Endpunkt senden
+    # Nach erfolgreicher Validierung: Suche direkt im Prozess ausführen, ohne Umweg über /api/search
     try:
-        logger.info("Sende validierte Suchanfrage an den /api/search-Endpunkt...")
-        api_url = "http://127.0.0.1:5000/api/search"  # Lokaler Endpunkt
+        logger.info("Führe validierte Suchanfrage aus...")
         logger.debug(f"Validierte Suchanfrage: {validated_search_query}")
-        response = requests.post(api_url, json={"request_input": validated_search_query}, timeout=10)
-        logger.debug(f"Antwort vom /api/search-Endpunkt: {response}")
-        response.raise_for_status()
-
-        search_results = response.json()
+        search_results = web_search(validated_search_query)
         log.update({"status": "completed", "search_results": search_results})
         logger.info(f"Suchergebnisse erhalten: {search_results}")
 
@@ -639,13 +1000,13 @@ def SearchQueryAgent(input_text, context, task_type="Synopsis"):
             "query": validated_search_query,
             "results": search_results
         }
-        agent_system.store_context(label, data)  # Nutzung der bestehenden Funktion
+        get_agent_system().store_context(label, data)  # Nutzung der bestehenden Funktion
         logger.info("Suchergebnisse erfolgreich in ChromaDB gespeichert.")
 
         return {"log": log, "search_results": search_results}
-    except requests.exceptions.RequestException as e:
-        log.update({"status": "failed", "output": f"Fehler beim Senden der Suchanfrage: {str(e)}"})
-        logger.error(f"Fehler beim Senden der Suchanfrage: {e}")
+    except ValueError as e:
+        log.update({"status": "failed", "output": f"Fehler bei der Suchanfrage: {str(e)}"})
+        logger.error(f"Fehler bei der Suchanfrage: {e}")
         return {"log": log, "search_results": f"Fehler: {str(e)}"}
     except Exception as e:
         log.update({"status": "failed", "output": f"Fehler beim Speichern in ChromaDB: {str(e)}"})
@@ -683,14 +1044,15 @@ def validate_search_query(input_text, context, search_query):
 
         # Aufruf des LLM
         llm = OllamaLLM()
-        validation_response = llm._call(prompt).strip()
+        verdict = llm.verdict(prompt)
+        validation_response = verdict["raw"].strip()
         logger.debug(f"Antwort von LLM zur Validierung: {validation_response}")
 
-        if validation_response.startswith("Ja"):
+        if verdict["approved"]:
             log.update({"status": "completed", "output": "Validierung erfolgreich."})
             logger.info("Suchanfrage erfolgreich validiert.")
         else:
-            reason = validation_response.split("Begründung:", 1)[-1].strip() if "Begründung:" in validation_response else "Keine Begründung erhalten."
+            reason = validation_response.split("Begründung:", 1)[-1].strip() if "Begründung:" in validation_response else (verdict["reason"] or "Keine Begründung erhalten.")
             corrections = validation_response.split("Verbesserungsvorschläge:", 1)[-1].strip() if "Verbesserungsvorschläge:" in validation_response else "Keine Verbesserungsvorschläge erhalten."
             log.update({
                 "status": "failed",
@@ -771,17 +1133,18 @@ def synopsis_validation_agent(user_input, output):
         2. Begründung, warum die Ausgabe korrekt oder falsch ist.
         """
         llm = OllamaLLM()
-        validation_result = llm._call(prompt)
+        verdict = llm.verdict(prompt)
+        validation_result = verdict["raw"]
         logger.debug(f"[DEBUG] Validierungsergebnis von LLM: {validation_result}")
 
-        if "Ja" in validation_result:
+        if verdict["approved"] or (verdict["approved"] is None and "Ja" in validation_result):
             logger.info("Validierung erfolgreich. Ausgabe ist inhaltlich korrekt.")
             log.update({
                 "status": "completed",
                 "output": "Validierung erfolgreich. Ausgabe ist inhaltlich korrekt."
             })
         else:
-            reason = validation_result.split("Begründung:")[1].strip() if "Begründung:" in validation_result else "Unzureichende Begründung erhalten."
+            reason = validation_result.split("Begründung:")[1].strip() if "Begründung:" in validation_result else (verdict["reason"] or "Unzureichende Begründung erhalten.")
             logger.warning(f"Validierung fehlgeschlagen: {reason}")
             log.update({
                 "status": "failed",
@@ -798,7 +1161,7 @@ def synopsis_validation_agent(user_input, output):
     return {"log": log}
 
 # Validierungs-Agent
-def validation_agent(user_input, output):
+def validation_agent(user_input, output, context=None):
     """
     Validates the given user input and output using a series of validation agents.
     This function sequentially runs the input and output through multiple validation agents:
@@ -810,6 +1173,8 @@ def validation_agent(user_input, output):
     Args:
         user_input (str): The user input to be validated.
         output (str): The output to be validated.
+        context (str, optional): The context for the content validation, e.g. the rolling summaries of the book.
+            Defaults to None, which retrieves the entries of the session most similar to the output.
     Returns:
         dict: A dictionary containing the validation log with status and output message.
     """
@@ -821,7 +1186,10 @@ def validation_agent(user_input, output):
     
     for agent in agents:
         try:
-            result = agent(user_input, output)
+            if agent is validation_agent_content:
+                result = agent(user_input, output, context=context)  # Nur die inhaltliche Prüfung benötigt Kontext
+            else:
+                result = agent(user_input, output)
             if result["log"].get("status") != "completed":
                 logger.error(f"[ERROR] Validierung fehlgeschlagen bei {agent.__name__}: {result['log']['output']}")
                 return {"log": {"status": "failed", "output": f"Validierung fehlgeschlagen bei {agent.__name__}"}}  # Abbruch
@@ -834,7 +1202,7 @@ def validation_agent(user_input, output):
     return {"log": {"status": "completed", "output": "Alle Validierungen erfolgreich abgeschlossen."}}
 
 ## 1. Inhaltlicher Validierungsagent (Original-Agent erweitert)
-def validation_agent_content(user_input, output):
+def validation_agent_content(user_input, output, context=None):
     """
     Validates the content of the output based on the user input and context.
     This function logs the validation process, retrieves the context from the agent system,
@@ -843,6 +1211,8 @@ def validation_agent_content(user_input, output):
     Args:
         user_input (str): The input provided by the user.
         output (str): The output that needs to be validated.
+        context (str, optional): The context to validate against, e.g. the rolling summaries of the book.
+            Defaults to None, which retrieves the entries of the session most similar to the output.
     Returns:
         dict: A dictionary containing the log with the status and validation result.
     """
@@ -853,7 +1223,8 @@ def validation_agent_content(user_input, output):
         logger.debug(f"[DEBUG] Benutzerinput: {user_input}")
         logger.debug(f"[DEBUG] Ausgabe zum Validieren: {output}")
 
-        context = agent_system.get_context()  # Kontext abrufen
+        if context is None:
+            context = get_agent_system().query_context(output)  # Ähnlichste Einträge der Sitzung abrufen
         logger.debug(f"[DEBUG] Abgerufener Kontext: {context}")
 
         prompt = f"""
@@ -873,16 +1244,17 @@ def validation_agent_content(user_input, output):
         2. Begründung, warum die Ausgabe korrekt oder falsch ist.
         """
         llm = OllamaLLM()
-        validation_result = llm._call(prompt)
+        verdict = llm.verdict(prompt)
+        validation_result = verdict["raw"]
         logger.debug(f"[DEBUG] Validierungsergebnis von LLM: {validation_result}")
 
-        if "Ja" in validation_result:
+        if verdict["approved"] or (verdict["approved"] is None and "Ja" in validation_result):
             log.update({
                 "status": "completed",
                 "output": "Validierung erfolgreich. Ausgabe ist inhaltlich korrekt."
             })
         else:
-            reason = validation_result.split("Begründung:")[1].strip() if "Begründung:" in validation_result else "Unzureichende Begründung erhalten."
+            reason = validation_result.split("Begründung:")[1].strip() if "Begründung:" in validation_result else (verdict["reason"] or "Unzureichende Begründung erhalten.")
             log.update({
                 "status": "failed",
                 "output": f"Validierung fehlgeschlagen: {reason}"
@@ -929,17 +1301,18 @@ def validation_agent_logic(user_input, output):
         2. Begründung, warum die Ausgabe korrekt oder falsch ist.
         """
         llm = OllamaLLM()
-        validation_result = llm._call(prompt)
+        verdict = llm.verdict(prompt)
+        validation_result = verdict["raw"]
         logger.debug(f"[DEBUG] Validierungsergebnis von LLM: {validation_result}")
 
-        if "Ja" in validation_result:
+        if verdict["approved"] or (verdict["approved"] is None and "Ja" in validation_result):
             logger.info("Validierung erfolgreich. Ausgabe ist inhaltlich korrekt.")
             log.update({
                 "status": "completed",
                 "output": "Validierung erfolgreich. Ausgabe ist logisch konsistent."
             })
         else:
-            reason = validation_result.split("Begründung:")[1].strip() if "Begründung:" in validation_result else "Unzureichende Begründung erhalten."
+            reason = validation_result.split("Begründung:")[1].strip() if "Begründung:" in validation_result else (verdict["reason"] or "Unzureichende Begründung erhalten.")
             logger.warning(f"Validierung fehlgeschlagen: {reason}")
             log.update({
                 "status": "failed",
@@ -984,17 +1357,18 @@ def validation_agent_language(user_input, output):
         2. Begründung, warum die Ausgabe korrekt oder falsch ist.
         """
         llm = OllamaLLM()
-        validation_result = llm._call(prompt)
+        verdict = llm.verdict(prompt)
+        validation_result = verdict["raw"]
         logger.debug(f"[DEBUG] Validierungsergebnis von LLM: {validation_result}")
 
-        if "Ja" in validation_result:
+        if verdict["approved"] or (verdict["approved"] is None and "Ja" in validation_result):
             logger.info("Validierung erfolgreich. Ausgabe ist inhaltlich korrekt.")
             log.update({
                 "status": "completed",
                 "output": "Validierung erfolgreich. Ausgabe ist sprachlich korrekt."
             })
         else:
-            reason = validation_result.split("Fehler:")[1].strip() if "Fehler:" in validation_result else "Unzureichende Begründung erhalten."
+            reason = validation_result.split("Fehler:")[1].strip() if "Fehler:" in validation_result else (verdict["reason"] or "Unzureichende Begründung erhalten.")
             logger.warning(f"Validierung fehlgeschlagen: {reason}")
             log.update({
                 "status": "failed",
@@ -1025,7 +1399,7 @@ def chapter_agent(min_chapter=0, min_subchapter=0):
     log = {"agent": "ChapterAgent", "status": "running", "details": []}
     try:
         logger.debug("Rufe alle gespeicherten Kontexte ab...")
-        context = agent_system.get_context_all()
+        context = get_agent_system().get_context_all()
         if not context:
             raise ValueError("Kein Kontext verfügbar.")
         logger.debug(f"Erhaltener Kontext:\n{context}")
@@ -1446,7 +1820,7 @@ def chapter_validation_agent(chapter_dict, **kwargs):
     try:
         # Kontext abrufen
         logger.debug("Rufe den Kontext für die Kapitelvalidierung ab...")
-        context = agent_system.get_context()
+        context = get_agent_system().get_context()
         if not context:
             logger.warning("Kein Kontext verfügbar. Verwende Standardkontext.")
             context = "Standardkontext: Keine vorherigen Daten gefunden."
@@ -1479,12 +1853,13 @@ def chapter_validation_agent(chapter_dict, **kwargs):
         """
         llm = OllamaLLM()
         logger.debug("Sende Anfrage zur Kapitelstrukturvalidierung an LLM...")
-        response = llm._call(prompt).strip()
+        verdict = llm.verdict(prompt)
+        response = verdict["raw"].strip()
         logger.debug(f"LLM-Antwort zur Kapitelvalidierung:\n{response}")
 
         # Prüfung der Kapitelantwort
-        if response.startswith("Nein"):
-            reason = response.split("Begründung:", 1)[-1].strip() if "Begründung:" in response else "Keine Begründung erhalten."
+        if verdict["approved"] is False:
+            reason = response.split("Begründung:", 1)[-1].strip() if "Begründung:" in response else (verdict["reason"] or "Keine Begründung erhalten.")
             corrections = response.split("Korrekturvorschläge:", 1)[-1].strip() if "Korrekturvorschläge:" in response else "Keine Korrekturvorschläge erhalten."
             logger.error(f"Kapitelvalidierung fehlgeschlagen. Begründung: {reason}, Korrekturvorschläge: {corrections}")
 
@@ -1531,11 +1906,12 @@ def chapter_validation_agent(chapter_dict, **kwargs):
             - "Nein" am Anfang, gefolgt von einer detaillierten Begründung und Korrekturvorschlägen.
             """
             logger.debug("Sende Anfrage zur Unterkapitelvalidierung an LLM...")
-            subchapter_response = llm._call(subchapter_prompt).strip()
+            subchapter_verdict = llm.verdict(subchapter_prompt)
+            subchapter_response = subchapter_verdict["raw"].strip()
             logger.debug(f"LLM-Antwort zur Unterkapitelvalidierung von Kapitel {chapter['Number']}:\n{subchapter_response}")
 
-            if subchapter_response.startswith("Nein"):
-                reason = subchapter_response.split("Begründung:", 1)[-1].strip() if "Begründung:" in subchapter_response else "Keine Begründung erhalten."
+            if subchapter_verdict["approved"] is False:
+                reason = subchapter_response.split("Begründung:", 1)[-1].strip() if "Begründung:" in subchapter_response else (subchapter_verdict["reason"] or "Keine Begründung erhalten.")
                 corrections = subchapter_response.split("Korrekturvorschläge:", 1)[-1].strip() if "Korrekturvorschläge:" in subchapter_response else "Keine Korrekturvorschläge erhalten."
                 logger.error(f"Unterkapitelvalidierung fehlgeschlagen für Kapitel {chapter['Number']}. Begründung: {reason}, Korrekturvorschläge: {corrections}")
 
@@ -1556,7 +1932,7 @@ def chapter_validation_agent(chapter_dict, **kwargs):
             "details": ["Kapitel und Unterkapitel sind inhaltlich korrekt."]
         })
         logger.info("Kapitel- und Unterkapitelvalidierung erfolgreich abgeschlossen.")
-        agent_system.store_context(chapters_text, "Kapitel und Unterkapitel validiert.")
+        get_agent_system().store_context(chapters_text, "Kapitel und Unterkapitel validiert.", kind="outline")
         return {"log": log}
 
     except ValueError as e:
@@ -1579,22 +1955,33 @@ def chapter_validation_agent(chapter_dict, **kwargs):
         })
         return {"log": log}
 
-def writing_agent(user_input, validated_chapters):
+def writing_agent(user_input, validated_chapters, max_workers=WRITING_WORKERS, progress=None, checkpoint=None,
+                  summaries=None, previous=None, rewrite=None):
     """
     Processes validated chapters and generates content for each subchapter using a language model.
+
+    The outline is fixed at this point, so the chapters are written concurrently by a
+    worker pool whose size should match the parallel slots of the LLM server. The
+    subchapters of a chapter are written one after another in write_subchapter, so each
+    receives the rolling summary of exactly the subchapters before it instead of the raw
+    text written so far. Chapters written in parallel see only their own chapter summary,
+    not each other's text. The results are reassembled in the order of the outline.
+
     Args:
         user_input (str): The input provided by the user.
         validated_chapters (dict): A dictionary containing validated chapters with their titles and subchapters.
+        max_workers (int, optional): The number of chapters written at the same time. Defaults to WRITING_WORKERS.
+        progress (callable, optional): Called as progress(subchapters_done=..., subchapters_total=...)
+            whenever a subchapter is finished. Defaults to None.
+        checkpoint (CheckpointStore, optional): Saves every validated subchapter together with the summary
+            of its chapter; subchapters already saved there are not written again. Defaults to None.
+        summaries (RollingSummaries, optional): The rolling summaries to update. Defaults to None,
+            which restores them from the checkpoint or starts empty.
+        previous (dict, optional): An earlier version of the text; its subchapters are reused. Defaults to None.
+        rewrite (list, optional): Keys "<chapter>/<subchapter>" of subchapters written again even if they
+            are part of `previous` or the checkpoint. Defaults to None.
     Returns:
         dict: A dictionary containing the log of the process and the final generated text for the chapters.
-    The function performs the following steps:
-    1. Initializes a log dictionary to track the status and details of the process.
-    2. Iterates through each chapter in the validated chapters.
-    3. For each chapter, iterates through its subchapters and generates content using a language model.
-    4. Validates the generated content for each subchapter.
-    5. If validation is successful, stores the content and updates the context.
-    6. If any error occurs during the process, logs the error and updates the status to failed.
-    7. Returns the log and the final generated text for the chapters.
     Raises:
         ValueError: If no chapter could be successfully processed.
     """
@@ -1605,67 +1992,66 @@ def writing_agent(user_input, validated_chapters):
         logger.debug("WritingAgent gestartet")
         logger.debug(f"[DEBUG] validated_chapters: {validated_chapters}")
 
-        for chapter in validated_chapters.get("Chapters", []):
-            logger.debug(f"[DEBUG] Verarbeite Kapitel: {chapter['Title']}")
-
-            chapter_content = {"Number": chapter["Number"], "Title": chapter["Title"], "Subchapters": []}
+        # Kapitelzusammenfassungen fester Länge als Kontext für die folgenden Unterkapitel
+        if summaries is None:
+            summaries = RollingSummaries({"chapters": checkpoint.get("chapter_summaries", {})} if checkpoint else None)
 
+        # Unterkapitel der vorherigen Fassung, die nicht überarbeitet werden
+        kept = {
+            f"{chapter['Number']}/{subchapter['Number']}": subchapter
+            for chapter in (previous or {}).get("Chapters", [])
+            for subchapter in chapter.get("Subchapters", [])
+        }
+        rewrite = set(rewrite or [])
+
+        def write(chapter, subchapter):
+            key = f"{chapter['Number']}/{subchapter['Number']}"
+            if key not in rewrite:
+                saved = kept.get(key) or (checkpoint.get_item("subchapters", key) if checkpoint else None)
+                if saved:
+                    # Bereits geschrieben, z. B. vor einem Neustart; nach discard() wieder in die Kapitelzusammenfassung aufnehmen
+                    summaries.update(chapter, subchapter, saved.get("Content", ""))
+                    return {"details": [], "subchapter": saved}
+            result = write_subchapter(user_input, chapter, subchapter, summaries=summaries)
+            if checkpoint and result["subchapter"]:
+                # Unterkapitel und Kapitelzusammenfassung in einem Schreibvorgang, unabhängig von der Buchlänge
+                items = [("subchapters", key, result["subchapter"])]
+                chapter_summary = summaries.chapter_state(chapter["Number"])
+                if chapter_summary:
+                    items.append(("chapter_summaries", str(chapter["Number"]), chapter_summary))
+                checkpoint.save_items(items)
+            return result
+
+        chapters = validated_chapters.get("Chapters", [])
+        total = sum(len(chapter.get("Subchapters", [])) for chapter in chapters)
+        done = itertools.count(1)
+        done_lock = threading.Lock()  # Zählt die fertigen Unterkapitel aller Kapitel-Threads
+
+        def write_chapter(chapter):
+            # Nacheinander, damit jedes Unterkapitel die Zusammenfassung aller vorherigen des Kapitels erhält
+            results = []
             for subchapter in chapter.get("Subchapters", []):
-                subchapter_validated = False
-
-                # Entscheidung vor dem Schreiben des Unterkapitels
-                decision_result = decision_agent(
-                    context=agent_system.get_context(),
-                    input_text=subchapter["Title"],
-                    task_type="Unterkapitel"
-                )
-                log["details"].append(decision_result["log"])
-
-                if decision_result["output"] == "Ja":
-                    logger.info(f"Internetsuche erforderlich für Unterkapitel: {subchapter['Title']}")
-                    # Optionale Integration einer Internetsuche hier
-
-                while not subchapter_validated:
-                    try:
-                        subchapter_prompt = f"""
-                        Kapitel {chapter['Number']} - {chapter['Title']}
-                        Unterkapitel {subchapter['Number']} - {subchapter['Title']}
-
-                        Schreibe den vollständigen Text für dieses Unterkapitel. Konzentriere dich ausschließlich auf den Inhalt des Unterkapitels 
-                        und vermeide jegliche Hinweise oder Erklärungen zum Benutzerinput oder Schreibprozess. Gib nur den reinen Text des Unterkapitels zurück.
-                        """
-                        llm = OllamaLLM()
-                        subchapter_content = llm._call(subchapter_prompt)
-                        logger.debug(f"[DEBUG] Generierter Unterkapitelinhalt: {subchapter_content}")
-
-                        # Validierung des Unterkapitelinhalts
-                        validation_result = validation_agent(user_input, subchapter_content)
-                        logger.debug(f"[DEBUG] Validierungsergebnis für Unterkapitel: {validation_result}")
-
-                        log["details"].append(validation_result["log"])
-
-                        if validation_result["log"].get("status") == "completed":
-                            subchapter_validated = True
-                            chapter_content["Subchapters"].append({
-                                "Number": subchapter["Number"],
-                                "Title": subchapter["Title"],
-                                "Content": subchapter_content
-                            })
-                            agent_system.store_context(subchapter["Title"], subchapter_content)
-                            logger.debug(f"[DEBUG] Unterkapitel erfolgreich gespeichert: {subchapter['Title']}")
-                        else:
-                            logger.error(f"[DEBUG] Unterkapitel {subchapter['Number']} nicht validiert. Wiederhole...")
-
-                    except Exception as e:
-                        logger.error(f"[DEBUG] Fehler beim Verarbeiten des Unterkapitels {subchapter['Number']}: {e}")
-                        log["details"].append({
-                            "status": "failed",
-                            "error": str(e),
-                            "subchapter": subchapter["Title"]
-                        })
-                        break  # Bricht die Schleife für dieses Unterkapitel ab, um Endlosschleifen zu vermeiden
-
-            final_text["Chapters"].append(chapter_content)
+                results.append(write(chapter, subchapter))
+                if progress:
+                    with done_lock:  # Unter der Sperre, damit der Fortschritt nie rückwärts gemeldet wird
+                        progress(subchapters_done=next(done), subchapters_total=total)
+            return results
+
+        if progress:
+            progress(subchapters_done=0, subchapters_total=total)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            # Jede Aufgabe erhält eine Kopie des Kontexts, damit das aktive AgentSystem erhalten bleibt
+            futures = [executor.submit(contextvars.copy_context().run, write_chapter, chapter) for chapter in chapters]
+
+            # Zusammensetzen in der Reihenfolge der Gliederung
+            for chapter, future in zip(chapters, futures):
+                logger.debug(f"[DEBUG] Verarbeite Kapitel: {chapter['Title']}")
+                chapter_content = {"Number": chapter["Number"], "Title": chapter["Title"], "Subchapters": []}
+                for result in future.result():
+                    log["details"].extend(result["details"])
+                    if result["subchapter"]:
+                        chapter_content["Subchapters"].append(result["subchapter"])
+                final_text["Chapters"].append(chapter_content)
 
         if final_text["Chapters"]:
             log.update({"status": "completed", "output": final_text})
@@ -1678,26 +2064,164 @@ def writing_agent(user_input, validated_chapters):
         log.update({"status": "failed", "output": f"Fehler: {str(e)}"})
         logger.error(f"[DEBUG] Fehler in WritingAgent: {e}")
         return {"log": log, "output": {}}
+
+def write_subchapter(user_input, chapter, subchapter, summaries):
+    """
+    Writes a single subchapter until it passes the validation.
+
+    Runs the decision agent, generates the text, validates it and stores it in the context.
+    Validation failures are retried; an error stops only this subchapter.
+
+    The decision, writing and validation prompts receive the summary of the chapter instead
+    of retrieved raw text, so their size does not grow with the book; the accepted subchapter
+    is folded into the summaries. Synopsis, outline and the search results of the session
+    that match the subchapter are added within the remaining token budget (see subchapter_context).
+
+    Args:
+        user_input (str): The input provided by the user.
+        chapter (dict): The chapter containing the subchapter ("Number", "Title").
+        subchapter (dict): The subchapter to write ("Number", "Title").
+        summaries (RollingSummaries): The rolling summaries of the book.
+    Returns:
+        dict: The log entries of this subchapter ("details") and the validated subchapter
+            with "Number", "Title" and "Content", or None if it failed ("subchapter").
+    """
+    details = []
+
+    context = subchapter_context(chapter, subchapter, summaries)
+
+    # Entscheidung vor dem Schreiben des Unterkapitels
+    decision_result = decision_agent(
+        context=context,
+        input_text=subchapter["Title"],
+        task_type="Unterkapitel"
+    )
+    details.append(decision_result["log"])
+
+    if decision_result["output"] == "Ja":
+        logger.info(f"Internetsuche erforderlich für Unterkapitel: {subchapter['Title']}")
+        # Die Suche hat ihre Ergebnisse in der Sitzung gespeichert, daher den Kontext neu aufbauen
+        context = subchapter_context(chapter, subchapter, summaries)
+
+    while True:
+        try:
+            subchapter_prompt = f"""
+            Bisher geschrieben:
+            {context}
+
+            Kapitel {chapter['Number']} - {chapter['Title']}
+            Unterkapitel {subchapter['Number']} - {subchapter['Title']}
+
+            Schreibe den vollständigen Text für dieses Unterkapitel. Konzentriere dich ausschließlich auf den Inhalt des Unterkapitels 
+            und vermeide jegliche Hinweise oder Erklärungen zum Benutzerinput oder Schreibprozess. Gib nur den reinen Text des Unterkapitels zurück.
+            """
+            llm = OllamaLLM()
+            subchapter_content = collect_stream(llm.stream(subchapter_prompt), subchapter["Title"])
+            logger.debug(f"[DEBUG] Generierter Unterkapitelinhalt: {subchapter_content}")
+
+            # Validierung des Unterkapitelinhalts
+            validation_result = validation_agent(user_input, subchapter_content, context=context)
+            logger.debug(f"[DEBUG] Validierungsergebnis für Unterkapitel: {validation_result}")
+
+            details.append(validation_result["log"])
+
+            if validation_result["log"].get("status") == "completed":
+                get_agent_system().store_context(
+                    subchapter["Title"],
+                    subchapter_content,
+                    kind="subchapter",
+                    chapter=chapter["Number"],
+                    subchapter=subchapter["Number"]
+                )
+                logger.debug(f"[DEBUG] Unterkapitel erfolgreich gespeichert: {subchapter['Title']}")
+                summaries.update(chapter, subchapter, subchapter_content)
+                return {
+                    "details": details,
+                    "subchapter": {
+                        "Number": subchapter["Number"],
+                        "Title": subchapter["Title"],
+                        "Content": subchapter_content
+                    }
+                }
+            logger.error(f"[DEBUG] Unterkapitel {subchapter['Number']} nicht validiert. Wiederhole...")
+
+        except Exception as e:
+            logger.error(f"[DEBUG] Fehler beim Verarbeiten des Unterkapitels {subchapter['Number']}: {e}")
+            details.append({
+                "status": "failed",
+                "error": str(e),
+                "subchapter": subchapter["Title"]
+            })
+            return {"details": details, "subchapter": None}  # Nur dieses Unterkapitel abbrechen, um Endlosschleifen zu vermeiden
     
-def generate_summary(final_text):
+def subchapter_context(chapter, subchapter, summaries):
+    """
+    Builds the context for writing and validating a subchapter.
+
+    The summary of the chapter is combined with synopsis, outline and the search results of
+    the session most similar to the subchapter title, which share the token budget left by
+    the summary.
+
+    Args:
+        chapter (dict): The chapter containing the subchapter ("Number", "Title").
+        subchapter (dict): The subchapter to write ("Number", "Title").
+        summaries (RollingSummaries): The rolling summaries of the book.
+    Returns:
+        str: The context for the prompts of the subchapter.
+    """
+    chapter_context = summaries.context(chapter["Number"])
+    retrieved = get_agent_system().query_context(
+        subchapter["Title"],
+        max_tokens=max(0, CONTEXT_TOKEN_BUDGET - estimate_tokens(chapter_context)),
+        focus={"chapter": chapter["Number"], "subchapter": subchapter["Number"]},
+        kinds=SUBCHAPTER_RETRIEVAL_KINDS
+    )
+    context = "\n\n".join(part for part in (retrieved, chapter_context) if part)
+    return context or "Es wurde noch kein Unterkapitel geschrieben."
+
+def collect_stream(chunks, label):
+    """
+    Collects a streamed answer while logging the generation progress.
+    Args:
+        chunks (iterable): The text fragments of the answer.
+        label (str): The name of the generated part used in the log messages.
+    Returns:
+        str: The complete answer.
+    """
+    start_time = time.monotonic()
+    parts = []
+    length = 0
+    next_report = STREAM_LOG_INTERVAL
+    for chunk in chunks:
+        if not parts:
+            logger.debug(f"Erste Tokens für '{label}' nach {time.monotonic() - start_time:.1f}s erhalten.")
+        parts.append(chunk)
+        length += len(chunk)
+        if length >= next_report:
+            logger.debug(f"'{label}': {length} Zeichen nach {time.monotonic() - start_time:.1f}s generiert.")
+            next_report += STREAM_LOG_INTERVAL
+    logger.info(f"'{label}' vollständig generiert: {length} Zeichen in {time.monotonic() - start_time:.1f}s.")
+    return "".join(parts)
+
+def generate_summary(final_text, summaries=None):
     """
     Generates a summary of the provided text.
     This function takes a text input and generates a concise summary that covers the main points from each chapter in a logical order without omitting details.
+    The book is summarised by map-reduce (summaries.summarize_book), so its length is not limited by the context window of the model.
     Args:
-        final_text (str): The entire text to be summarized.
+        final_text (dict): The entire text to be summarized, with "Chapters" as returned by writing_agent.
+        summaries (RollingSummaries, optional): The summaries computed while writing; their subchapter
+            summaries are reused. Defaults to None.
     Returns:
         dict: A dictionary containing the summary of the text. If an error occurs, the dictionary contains an error message.
     """
     try:
-        prompt = f"""
-        Aufgabe: Erstelle eine prägnante Zusammenfassung des gesamten Textes.
-        Die Zusammenfassung sollte eine logische Reihenfolge haben und die Hauptpunkte aus jedem Kapitel abdecken, ohne Details auszulassen.
-
-        Text:
-        {final_text}
-        """
-        llm = OllamaLLM()
-        summary = llm._call(prompt).strip()
+        if not isinstance(final_text, dict):
+            # Unstrukturierter Text wird als ein einziges Unterkapitel behandelt
+            final_text = {"Chapters": [{"Number": 1, "Title": "Text", "Subchapters": [
+                {"Number": 1, "Title": "Text", "Content": str(final_text)}
+            ]}]}
+        summary = summarize_book(final_text, summaries=summaries, llm=OllamaLLM())
         return {"Summary": summary}
     except Exception as e:
         logger.error(f"Fehler bei der Erstellung der Zusammenfassung: {e}")
@@ -1732,13 +2256,14 @@ def validate_summary(summary):
         und gib eine Begründung, falls "Nein".
         """
         llm = OllamaLLM()
-        validation_result = llm._call(prompt).strip()
-        if validation_result.startswith("Ja"):
+        verdict = llm.verdict(prompt)
+        validation_result = verdict["raw"].strip()
+        if verdict["approved"]:
             return {"Summary": summary["Summary"], "Validated": True}
         else:
             logger.warning(f"Zusammenfassung nicht validiert: {validation_result}")
             # Speichere die fehlerhafte Zusammenfassung und die Validierungsantwort
-            agent_system.store_context(
+            get_agent_system().store_context(
                 "Failed Summary Validation",
                 {
                     "Summary": summary["Summary"],
@@ -1753,7 +2278,7 @@ def validate_summary(summary):
     except Exception as e:
         logger.error(f"Fehler bei der Validierung der Zusammenfassung: {e}")
         # Speichere die fehlerhafte Zusammenfassung und die Fehlermeldung
-        agent_system.store_context(
+        get_agent_system().store_context(
             "Failed Summary Validation",
             {
                 "Summary": summary["Summary"],
@@ -1766,33 +2291,135 @@ def validate_summary(summary):
             "Reason": f"Fehler: {str(e)}",
         }
 
-def evaluate_chapters(final_text):
+def find_rewrite_targets(final_text, validation_result, summaries=None, outline=None):
     """
-    Evaluates the chapters of a book based on their structure, consistency, and transitions.
+    Determines the subchapters that caused a summary to be rejected.
+
+    The model receives the rejected summary, the feedback of the validation and a short
+    summary of every subchapter, so the prompt does not contain the book itself.
+    The keys it names are checked against the outline; unknown keys are ignored.
+
     Args:
-        final_text (str): The text of the book to be evaluated.
+        final_text (dict): The book with "Chapters" as returned by writing_agent.
+        validation_result (dict): The result of validate_summary with "Summary" and "Reason".
+        summaries (RollingSummaries, optional): The summaries computed while writing. Defaults to None,
+            which uses the beginning of each subchapter instead.
+        outline (dict, optional): The validated chapters; subchapters missing from final_text can be
+            named as well. Defaults to None, which uses the subchapters of final_text.
     Returns:
-        dict: A dictionary containing the evaluation log, the output score, and the explanation.
-            - log (dict): Contains the agent name, status, and details of the evaluation.
-            - output (int): The evaluation score on a scale from 0 to 100.
-            - explanation (str): The explanation for the given score and suggestions for improvement.
-    Raises:
-        ValueError: If no numerical score is found in the response.
+        list: The keys "<chapter>/<subchapter>" of the subchapters to rewrite in the order of the outline,
+            empty if none could be identified.
+    """
+    written = {
+        f"{chapter['Number']}/{subchapter['Number']}": subchapter
+        for chapter in final_text.get("Chapters", [])
+        for subchapter in chapter.get("Subchapters", [])
+    }
+    keys = []
+    lines = []
+    for chapter in (outline or final_text).get("Chapters", []):
+        for subchapter in chapter.get("Subchapters", []):
+            key = f"{chapter['Number']}/{subchapter['Number']}"
+            if key in written:
+                summary = summaries.subchapter_summary(chapter["Number"], subchapter["Number"]) if summaries else None
+                summary = summary or limit_words(written[key].get("Content", ""), SUBCHAPTER_SUMMARY_WORDS)
+            else:
+                summary = "Nicht geschrieben."
+            keys.append(key)
+            lines.append(f"{key} - {subchapter['Title']}: {summary}")
+    if not keys:
+        return []
+    listing = "\n".join(lines)
+
+    prompt = f"""
+    Die Zusammenfassung eines Buches wurde bei der Prüfung abgelehnt.
+
+    Zusammenfassung:
+    {validation_result.get("Summary", "")}
+
+    Begründung der Ablehnung:
+    {validation_result.get("Reason", "Keine Begründung.")}
+
+    Unterkapitel des Buches (Schlüssel - Titel: Zusammenfassung):
+    {listing}
+
+    Aufgabe: Bestimme die Unterkapitel, deren Inhalt die Ablehnung verursacht hat und die neu geschrieben werden müssen.
+    Antworte ausschließlich mit einem JSON-Objekt, das unter "unterkapitel" die Liste ihrer Schlüssel enthält, z. B. {{"unterkapitel": ["1/2"]}}.
+    Gib eine leere Liste zurück, wenn kein Unterkapitel verantwortlich ist.
     """
-    log = {"agent": "ChapterEvaluationAgent", "status": "running", "details": []}
     try:
-        prompt = f"""
-        Aufgabe: Bewerte die Kapitel des Buches basierend auf ihrer Struktur, Konsistenz und den Übergängen.
-        Text:
-        {final_text}
+        answer = OllamaLLM().structured(prompt, REWRITE_SCHEMA, "ueberarbeitung")
+        data = answer["data"] if isinstance(answer["data"], dict) else {}
+        named = data.get("unterkapitel", [])
+        named = {re.sub(r"\s+", "", str(key)) for key in named if isinstance(key, (str, int, float))} if isinstance(named, list) else set()
+        unknown = named - set(keys)
+        if unknown:
+            logger.warning(f"Unbekannte Unterkapitel in der Antwort ignoriert: {sorted(unknown)}")
+        targets = [key for key in keys if key in named]  # Nur Schlüssel der Gliederung, in deren Reihenfolge
+        logger.info(f"Zu überarbeitende Unterkapitel: {targets or 'keine'}")
+        return targets
+    except Exception as e:
+        logger.error(f"Fehler bei der Bestimmung der zu überarbeitenden Unterkapitel: {e}")
+        return []
 
-        Gib eine Bewertung so streng wie mögliche auf einer Skala von 0 bis 100 ab. Ohne /100 sondern nur deine Bewertung.
-        Erkläre, warum du diese Bewertung vergeben hast, und schlage Verbesserungen vor.
-        """
+def subchapter_where(final_text, keys):
+    """
+    Builds the metadata filter matching the stored context of the given subchapters.
+
+    Args:
+        final_text (dict): The book with "Chapters" as returned by writing_agent.
+        keys (list): Keys "<chapter>/<subchapter>" of the subchapters.
+    Returns:
+        dict: The where clause for Chroma, or None if no subchapter matches.
+    """
+    clauses = [
+        {"$and": [{"chapter": str(chapter["Number"])}, {"subchapter": str(subchapter["Number"])}]}  # store_context speichert Texte
+        for chapter in final_text.get("Chapters", [])
+        for subchapter in chapter.get("Subchapters", [])
+        if f"{chapter['Number']}/{subchapter['Number']}" in keys
+    ]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+def evaluation_prompt(final_text, task):
+    """
+    Builds the prompt of an evaluation agent with the book text as shared prefix.
+
+    The book comes first and the task last, so the prompts of all evaluators are
+    identical up to the task and the server can reuse the KV cache of the book.
+
+    Args:
+        final_text (str): The text of the book to be evaluated.
+        task (str): The evaluation task of the agent.
+    Returns:
+        str: The prompt.
+    """
+    return shared_prefix_prompt(final_text, f"Aufgabe: {task}\n{EVALUATION_INSTRUCTION}")
+
+def run_evaluation(final_text, task, agent_name):
+    """
+    Runs one evaluation agent on the book and parses its score.
+
+    All evaluators share this call: the prompt from evaluation_prompt, the cache key of the
+    book, and the first number of the answer as score, followed by the explanation.
+
+    Args:
+        final_text (str): The text of the book to be evaluated.
+        task (str): The evaluation task of the agent.
+        agent_name (str): The name of the agent used in the log.
+    Returns:
+        dict: The log of the evaluation ("log"), the score from 0 to 100 ("output") and the
+            explanation of the score ("explanation"). If the evaluation fails, the score is 0
+            and the log contains the error.
+    """
+    log = {"agent": agent_name, "status": "running", "details": []}
+    try:
+        prompt = evaluation_prompt(final_text, task)
         llm = OllamaLLM()
-        response = llm._call(prompt).strip()
+        response = llm._call(prompt, cache_key=prefix_cache_key(final_text), deterministic=DETERMINISTIC_EVALUATION).strip()
 
-        # Extrahiere die erste Zahl und den Rest des Textes
+        # Extrahiere die erste Zahl und die Erklärung
         match = re.search(r'\b(\d+)\b', response)
         if match:
             score = int(match.group(1))
@@ -1810,6 +2437,25 @@ def evaluate_chapters(final_text):
         log.update({"status": "failed", "output": 0, "error": str(e)})
         return {"log": log, "output": 0, "explanation": "Fehler bei der Bewertung"}
 
+def evaluate_chapters(final_text):
+    """
+    Evaluates the chapters of a book based on their structure, consistency, and transitions.
+    Args:
+        final_text (str): The text of the book to be evaluated.
+    Returns:
+        dict: A dictionary containing the evaluation log, the output score, and the explanation.
+            - log (dict): Contains the agent name, status, and details of the evaluation.
+            - output (int): The evaluation score on a scale from 0 to 100.
+            - explanation (str): The explanation for the given score and suggestions for improvement.
+    Raises:
+        ValueError: If no numerical score is found in the response.
+    """
+    return run_evaluation(
+        final_text,
+        "Bewerte die Kapitel des Buches basierend auf ihrer Struktur, Konsistenz und den Übergängen.",
+        "ChapterEvaluationAgent"
+    )
+
 def evaluate_paragraphs(final_text):
     """
     Evaluates the paragraphs of a given text based on their readability, focus, and logical coherence.
@@ -1828,36 +2474,11 @@ def evaluate_paragraphs(final_text):
     Raises:
         ValueError: If no numerical score is found in the response.
     """
-    log = {"agent": "ParagraphEvaluationAgent", "status": "running", "details": []}
-    try:
-        prompt = f"""
-        Aufgabe: Bewerte die Absätze des Buches basierend auf ihrem Lesefluss, Fokus und logischer Verknüpfung.
-        Text:
-        {final_text}
-
-        Gib eine Bewertung so streng wie mögliche auf einer Skala von 0 bis 100 ab. Ohne /100 sondern nur deine Bewertung.
-        Erkläre, warum du diese Bewertung vergeben hast, und schlage Verbesserungen vor.
-        """
-        llm = OllamaLLM()
-        response = llm._call(prompt).strip()
-
-        # Extrahiere die erste Zahl und den Rest des Textes
-        match = re.search(r'\b(\d+)\b', response)
-        if match:
-            score = int(match.group(1))
-            explanation = response[match.end():].strip()
-            log.update({
-                "status": "completed",
-                "output": min(max(score, 0), 100),
-                "explanation": explanation
-            })
-        else:
-            raise ValueError("Keine Zahl in der Antwort gefunden.")
-
-        return {"log": log, "output": log["output"], "explanation": log["explanation"]}
-    except Exception as e:
-        log.update({"status": "failed", "output": 0, "error": str(e)})
-        return {"log": log, "output": 0, "explanation": "Fehler bei der Bewertung"}
+    return run_evaluation(
+        final_text,
+        "Bewerte die Absätze des Buches basierend auf ihrem Lesefluss, Fokus und logischer Verknüpfung.",
+        "ParagraphEvaluationAgent"
+    )
 
 def evaluate_book_type(final_text):
     """
@@ -1877,36 +2498,11 @@ def evaluate_book_type(final_text):
     Raises:
         ValueError: If no number is found in the response.
     """
-    log = {"agent": "BookTypeEvaluationAgent", "status": "running", "details": []}
-    try:
-        prompt = f"""
-        Aufgabe: Bewerte die Buchart basierend auf ihrer Eignung für Zielgruppe und Thema.
-        Text:
-        {final_text}
-
-        Gib eine Bewertung so streng wie mögliche auf einer Skala von 0 bis 100 ab. Ohne /100 sondern nur deine Bewertung.
-        Erkläre, warum du diese Bewertung vergeben hast, und schlage Verbesserungen vor.
-        """
-        llm = OllamaLLM()
-        response = llm._call(prompt).strip()
-
-        # Extrahiere die erste Zahl und die Erklärung
-        match = re.search(r'\b(\d+)\b', response)
-        if match:
-            score = int(match.group(1))
-            explanation = response[match.end():].strip()
-            log.update({
-                "status": "completed",
-                "output": min(max(score, 0), 100),
-                "explanation": explanation
-            })
-        else:
-            raise ValueError("Keine Zahl in der Antwort gefunden.")
-
-        return {"log": log, "output": log["output"], "explanation": log["explanation"]}
-    except Exception as e:
-        log.update({"status": "failed", "output": 0, "error": str(e)})
-        return {"log": log, "output": 0, "explanation": "Fehler bei der Bewertung"}
+    return run_evaluation(
+        final_text,
+        "Bewerte die Buchart basierend auf ihrer Eignung für Zielgruppe und Thema.",
+        "BookTypeEvaluationAgent"
+    )
 
 def evaluate_content(final_text):
     """
@@ -1921,36 +2517,11 @@ def evaluate_content(final_text):
     Raises:
         ValueError: If no numerical score is found in the response.
     """
-    log = {"agent": "ContentEvaluationAgent", "status": "running", "details": []}
-    try:
-        prompt = f"""
-        Aufgabe: Bewerte den Inhalt des Buches basierend auf Tiefe, Relevanz und Fokus auf das Thema.
-        Text:
-        {final_text}
-
-        Gib eine Bewertung so streng wie mögliche auf einer Skala von 0 bis 100 ab. Ohne /100 sondern nur deine Bewertung.
-        Erkläre, warum du diese Bewertung vergeben hast, und schlage Verbesserungen vor.
-        """
-        llm = OllamaLLM()
-        response = llm._call(prompt).strip()
-
-        # Extrahiere die erste Zahl und die Erklärung
-        match = re.search(r'\b(\d+)\b', response)
-        if match:
-            score = int(match.group(1))
-            explanation = response[match.end():].strip()
-            log.update({
-                "status": "completed",
-                "output": min(max(score, 0), 100),
-                "explanation": explanation
-            })
-        else:
-            raise ValueError("Keine Zahl in der Antwort gefunden.")
-
-        return {"log": log, "output": log["output"], "explanation": log["explanation"]}
-    except Exception as e:
-        log.update({"status": "failed", "output": 0, "error": str(e)})
-        return {"log": log, "output": 0, "explanation": "Fehler bei der Bewertung"}
+    return run_evaluation(
+        final_text,
+        "Bewerte den Inhalt des Buches basierend auf Tiefe, Relevanz und Fokus auf das Thema.",
+        "ContentEvaluationAgent"
+    )
 
 def evaluate_grammar(final_text):
     """
@@ -1974,36 +2545,11 @@ def evaluate_grammar(final_text):
     Raises:
         ValueError: If no numerical score is found in the response.
     """
-    log = {"agent": "GrammarEvaluationAgent", "status": "running", "details": []}
-    try:
-        prompt = f"""
-        Aufgabe: Bewerte die Grammatik und Rechtschreibung des Buches.
-        Text:
-        {final_text}
-
-        Gib eine Bewertung so streng wie mögliche auf einer Skala von 0 bis 100 ab. Ohne /100 sondern nur deine Bewertung.
-        Erkläre, warum du diese Bewertung vergeben hast, und schlage Verbesserungen vor.
-        """
-        llm = OllamaLLM()
-        response = llm._call(prompt).strip()
-
-        # Extrahiere die erste Zahl und die Erklärung
-        match = re.search(r'\b(\d+)\b', response)
-        if match:
-            score = int(match.group(1))
-            explanation = response[match.end():].strip()
-            log.update({
-                "status": "completed",
-                "output": min(max(score, 0), 100),
-                "explanation": explanation
-            })
-        else:
-            raise ValueError("Keine Zahl in der Antwort gefunden.")
-
-        return {"log": log, "output": log["output"], "explanation": log["explanation"]}
-    except Exception as e:
-        log.update({"status": "failed", "output": 0, "error": str(e)})
-        return {"log": log, "output": 0, "explanation": "Fehler bei der Bewertung"}
+    return run_evaluation(
+        final_text,
+        "Bewerte die Grammatik und Rechtschreibung des Buches.",
+        "GrammarEvaluationAgent"
+    )
 
 def evaluate_style(final_text):
     """
@@ -2023,36 +2569,11 @@ def evaluate_style(final_text):
     Raises:
         ValueError: If no number is found in the response.
     """
-    log = {"agent": "StyleEvaluationAgent", "status": "running", "details": []}
-    try:
-        prompt = f"""
-        Aufgabe: Bewerte den Schreibstil des Buches basierend auf Abwechslung, Tonalität und Authentizität.
-        Text:
-        {final_text}
-
-        Gib eine Bewertung so streng wie mögliche auf einer Skala von 0 bis 100 ab. Ohne /100 sondern nur deine Bewertung.
-        Erkläre, warum du diese Bewertung vergeben hast, und schlage Verbesserungen vor.
-        """
-        llm = OllamaLLM()
-        response = llm._call(prompt).strip()
-
-        # Extrahiere die erste Zahl und die Erklärung
-        match = re.search(r'\b(\d+)\b', response)
-        if match:
-            score = int(match.group(1))
-            explanation = response[match.end():].strip()
-            log.update({
-                "status": "completed",
-                "output": min(max(score, 0), 100),
-                "explanation": explanation
-            })
-        else:
-            raise ValueError("Keine Zahl in der Antwort gefunden.")
-
-        return {"log": log, "output": log["output"], "explanation": log["explanation"]}
-    except Exception as e:
-        log.update({"status": "failed", "output": 0, "error": str(e)})
-        return {"log": log, "output": 0, "explanation": "Fehler bei der Bewertung"}
+    return run_evaluation(
+        final_text,
+        "Bewerte den Schreibstil des Buches basierend auf Abwechslung, Tonalität und Authentizität.",
+        "StyleEvaluationAgent"
+    )
 
 def evaluate_tension(final_text):
     """
@@ -2074,36 +2595,11 @@ def evaluate_tension(final_text):
     Raises:
         ValueError: If no number is found in the response from the language model.
     """
-    log = {"agent": "TensionEvaluationAgent", "status": "running", "details": []}
-    try:
-        prompt = f"""
-        Aufgabe: Bewerte die Spannung des Buches basierend auf Wendepunkten, Aufbau und Charakterentwicklung.
-        Text:
-        {final_text}
-
-        Gib eine Bewertung so streng wie mögliche auf einer Skala von 0 bis 100 ab. Ohne /100 sondern nur deine Bewertung.
-        Erkläre, warum du diese Bewertung vergeben hast, und schlage Verbesserungen vor.
-        """
-        llm = OllamaLLM()
-        response = llm._call(prompt).strip()
-
-        # Extrahiere die erste Zahl und die Erklärung
-        match = re.search(r'\b(\d+)\b', response)
-        if match:
-            score = int(match.group(1))
-            explanation = response[match.end():].strip()
-            log.update({
-                "status": "completed",
-                "output": min(max(score, 0), 100),
-                "explanation": explanation
-            })
-        else:
-            raise ValueError("Keine Zahl in der Antwort gefunden.")
-
-        return {"log": log, "output": log["output"], "explanation": log["explanation"]}
-    except Exception as e:
-        log.update({"status": "failed", "output": 0, "error": str(e)})
-        return {"log": log, "output": 0, "explanation": "Fehler bei der Bewertung"}
+    return run_evaluation(
+        final_text,
+        "Bewerte die Spannung des Buches basierend auf Wendepunkten, Aufbau und Charakterentwicklung.",
+        "TensionEvaluationAgent"
+    )
 
 
 # Buchbewertung 
@@ -2176,12 +2672,306 @@ def map_score_to_grade(score):
         return "Fehler"
 
 # Final Score Calculation
+def run_evaluations(final_text, agents, max_workers=EVALUATION_WORKERS, timeout=EVALUATION_TIMEOUT, warm_prefix=True):
+    """
+    Runs the evaluation agents on the book concurrently and returns their results in the given order.
+
+    With warm_prefix the first agent runs alone, so the server prefills the book once
+    and the remaining agents can reuse the cached prefix.
+
+    Args:
+        final_text (str): The text of the book to be evaluated.
+        agents (list): The evaluation functions in the order expected by calculate_final_score.
+        max_workers (int, optional): The number of agents running at the same time. Defaults to EVALUATION_WORKERS.
+        timeout (float, optional): Seconds each agent may take. Defaults to EVALUATION_TIMEOUT.
+        warm_prefix (bool, optional): Whether to run the first agent before the others. Defaults to True.
+    Returns:
+        list: The result dictionaries ("log", "output", "explanation") in the order of `agents`.
+    """
+    return run_evaluation_tasks([(final_text, agent) for agent in agents], max_workers, timeout, warm_prefix)
+
+def run_evaluation_tasks(tasks, max_workers=EVALUATION_WORKERS, timeout=EVALUATION_TIMEOUT, warm_prefix=False):
+    """
+    Runs evaluation agents on their texts in one worker pool and returns their results in the given order.
+
+    The tasks are independent of each other, so they are dispatched to one worker pool.
+    Each task has `timeout` seconds from its own start; a task that takes longer
+    is counted as failed with a score of 0, so a single slow call cannot hold up the
+    whole evaluation. The same deadline is passed to its LLM calls, which then end
+    together with the task and free their scheduler slot.
+
+    Args:
+        tasks (list): Pairs of the text to be evaluated and the evaluation function.
+        max_workers (int, optional): The number of tasks running at the same time. Defaults to EVALUATION_WORKERS.
+        timeout (float, optional): Seconds each task may take. Defaults to EVALUATION_TIMEOUT.
+        warm_prefix (bool, optional): Whether to run the first task before the others, so its text is
+            in the prefix cache of the server. Defaults to False.
+    Returns:
+        list: The result dictionaries ("log", "output", "explanation") in the order of `tasks`.
+    """
+    started = [threading.Event() for _ in tasks]
+    start_times = [None] * len(tasks)
+
+    def run(index, final_text, agent):
+        start_times[index] = time.monotonic()
+        started[index].set()
+        # HTTP-Anfrage und Warten auf einen Slot enden mit der Frist des Agenten
+        with deadline_context(timeout):
+            return agent(final_text)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        futures = []
+        for index, (final_text, agent) in enumerate(tasks):
+            futures.append(executor.submit(contextvars.copy_context().run, run, index, final_text, agent))
+            if index == 0 and warm_prefix:
+                # Erste Bewertung allein laufen lassen, damit der Buchtext im Prefix-Cache liegt
+                wait(futures, timeout=timeout)
+        results = []
+        for index, ((_, agent), future) in enumerate(zip(tasks, futures)):
+            try:
+                started[index].wait()
+                remaining = start_times[index] + timeout - time.monotonic()
+                results.append(future.result(timeout=max(0, remaining)))
+            except FutureTimeoutError:
+                logger.error(f"Zeitüberschreitung bei {agent.__name__} nach {timeout} Sekunden.")
+                results.append({
+                    "log": {"agent": agent.__name__, "status": "failed", "output": 0, "error": "Zeitüberschreitung"},
+                    "output": 0,
+                    "explanation": "Zeitüberschreitung bei der Bewertung"
+                })
+            except Exception as e:
+                logger.error(f"Fehler in {agent.__name__}: {e}")
+                results.append({
+                    "log": {"agent": agent.__name__, "status": "failed", "output": 0, "error": str(e)},
+                    "output": 0,
+                    "explanation": "Fehler bei der Bewertung"
+                })
+        return results
+    finally:
+        # Nicht auf abgelaufene Bewertungen warten, ihre LLM-Aufrufe enden mit der Frist
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def evaluate_book(final_text, evaluation_mode=EVALUATION_MODE, checkpoint=None):
+    """
+    Evaluates the book with the selected evaluation engine.
+
+    Args:
+        final_text (str): The text of the book to be evaluated.
+        evaluation_mode (str, optional): "separate" for one call per criterion, "combined" for a
+            single JSON evaluation of all criteria, "chunked" for one call per criterion and chapter.
+            Defaults to EVALUATION_MODE.
+        checkpoint (CheckpointStore, optional): Saves every completed evaluation; evaluations already
+            saved there are reused. Defaults to None.
+    Returns:
+        list: The result dictionaries ("log", "output", "explanation") in the order expected by calculate_final_score.
+    """
+    agents = [
+        evaluate_chapters,
+        evaluate_paragraphs,
+        evaluate_book_type,
+        evaluate_content,
+        evaluate_grammar,
+        evaluate_style,
+        evaluate_tension
+    ]
+    saved = checkpoint.get("evaluations", {}) if checkpoint else {}
+    pending = [agent for agent in agents if agent.__name__ not in saved]
+    if not pending:
+        new_results = {}
+    elif evaluation_mode == "combined":
+        new_results = dict(zip(agents, evaluate_combined(final_text, agents)))
+    elif evaluation_mode == "chunked":
+        new_results = dict(zip(pending, evaluate_chunked(final_text, pending)))
+    else:
+        # Die Bewertungen sind unabhängig voneinander und laufen parallel, die Reihenfolge bleibt erhalten
+        new_results = dict(zip(pending, run_evaluations(final_text, pending)))
+
+    results = []
+    for agent in agents:
+        if agent.__name__ in saved:
+            results.append(saved[agent.__name__])
+            continue
+        result = new_results[agent]
+        if checkpoint and result["log"].get("status") == "completed":
+            checkpoint.save_item("evaluations", agent.__name__, result)  # Fehlgeschlagene beim Fortsetzen wiederholen
+        results.append(result)
+    return results
+
+def evaluate_combined(final_text, fallback_agents):
+    """
+    Evaluates all criteria of EVALUATION_CRITERIA with a single structured call.
+
+    The book is sent once and the model answers with a JSON object matching EVALUATION_SCHEMA.
+    Criteria missing from the answer or with an invalid score are evaluated by the
+    corresponding per-criterion agent instead.
+
+    Args:
+        final_text (str): The text of the book to be evaluated.
+        fallback_agents (list): The per-criterion agents in the order of EVALUATION_CRITERIA.
+    Returns:
+        list: The result dictionaries ("log", "output", "explanation") in the order of EVALUATION_CRITERIA.
+    """
+    criteria = "\n".join(f'- "{key}": {description}' for key, _, description in EVALUATION_CRITERIA)
+    prompt = shared_prefix_prompt(final_text, f"Aufgabe: Bewerte das Buch nach diesen Kriterien:\n{criteria}\n{COMBINED_EVALUATION_INSTRUCTION}")
+    llm = OllamaLLM()
+    answer = llm.structured(prompt, EVALUATION_SCHEMA, "bewertung", cache_key=prefix_cache_key(final_text))
+    data = answer["data"] if isinstance(answer["data"], dict) else {}
+
+    results = [None] * len(EVALUATION_CRITERIA)
+    fallback = []
+    for index, (key, agent_name, _) in enumerate(EVALUATION_CRITERIA):
+        entry = data.get(key)
+        score = entry.get("score") if isinstance(entry, dict) else None
+        if isinstance(score, (int, float)) and not isinstance(score, bool) and 0 <= score <= 100:
+            explanation = str(entry.get("begruendung", "")).strip()
+            log = {
+                "agent": agent_name,
+                "status": "completed",
+                "details": ["Kombinierte Bewertung"],
+                "output": int(score),
+                "explanation": explanation
+            }
+            results[index] = {"log": log, "output": log["output"], "explanation": explanation}
+        else:
+            fallback.append(index)
+
+    if fallback:
+        logger.warning(f"Kombinierte Bewertung unvollständig, bewerte einzeln: {[EVALUATION_CRITERIA[i][0] for i in fallback]}")
+        logger.debug(f"Antwort der kombinierten Bewertung: {answer['raw']}")
+        fallback_results = run_evaluations(final_text, [fallback_agents[i] for i in fallback])
+        for index, result in zip(fallback, fallback_results):
+            results[index] = result
+    return results
+
+_chapter_score_cache = None
+_chapter_score_cache_lock = threading.Lock()
+
+def get_chapter_score_cache():
+    """
+    Returns the cache of chapter scores, creating it on first use.
+
+    Returns:
+        ResponseCache: The cache in CHAPTER_SCORE_CACHE_DIR, so after a rewrite only changed chapters are scored again.
+    """
+    global _chapter_score_cache
+    if _chapter_score_cache is None:
+        with _chapter_score_cache_lock:
+            if _chapter_score_cache is None:
+                _chapter_score_cache = ResponseCache(directory=CHAPTER_SCORE_CACHE_DIR)
+    return _chapter_score_cache
+
+def evaluate_chunked(final_text, agents, aggregation=CHAPTER_SCORE_AGGREGATION, max_workers=CHAPTER_EVALUATION_WORKERS):
+    """
+    Evaluates every chapter separately and aggregates the chapter scores per criterion.
+
+    Each prompt contains a single chapter, so the prefill stays small and the scores are more
+    reliable on long books. All pairs of chapter and agent run in one worker pool, so the
+    timeout of each evaluation is not spent waiting behind other chapters. Completed chapter
+    scores are cached by model, agent and chapter text, so after a rewrite only changed
+    chapters are scored again.
+
+    Args:
+        final_text (dict): The book with "Chapters" as returned by writing_agent.
+        agents (list): The evaluation functions in the order expected by calculate_final_score.
+        aggregation (str, optional): How chapter scores are combined, see aggregate_scores.
+            Defaults to CHAPTER_SCORE_AGGREGATION.
+        max_workers (int, optional): The number of chapter evaluations running at the same time.
+            Defaults to CHAPTER_EVALUATION_WORKERS.
+    Returns:
+        list: The result dictionaries ("log", "output", "explanation") in the order of `agents`.
+    """
+    chapters = [chapter for chapter in final_text.get("Chapters", []) if chapter.get("Subchapters")] if isinstance(final_text, dict) else []
+    if not chapters:
+        logger.warning("Keine Kapitel für die kapitelweise Bewertung gefunden, bewerte das ganze Buch.")
+        return run_evaluations(final_text, agents)
+
+    # Modell des konfigurierten Clients, damit ein anderes Modell nicht alte Bewertungen erhält
+    model = get_llm_client().model
+    score_cache = get_chapter_score_cache()
+    keys = [
+        [cache_key({"model": model, "agent": agent.__name__, "chapter": chapter}) for agent in agents]
+        for chapter in chapters
+    ]
+    per_chapter = [[score_cache.get(key) for key in chapter_keys] for chapter_keys in keys]
+    # Erst das erste Kriterium jedes Kapitels, damit jeder Kapiteltext früh im Prefix-Cache liegt
+    pending = sorted(
+        ((chapter_index, agent_index)
+         for chapter_index, results in enumerate(per_chapter)
+         for agent_index, result in enumerate(results) if result is None),
+        key=lambda task: (task[1] > 0, task[0], task[1])
+    )
+    scored = run_evaluation_tasks(
+        [({"Chapters": [chapters[chapter_index]]}, agents[agent_index]) for chapter_index, agent_index in pending],
+        max_workers=max_workers
+    )
+    for (chapter_index, agent_index), result in zip(pending, scored):
+        if result["log"].get("status") == "completed":
+            score_cache.put(keys[chapter_index][agent_index], result)  # Fehlgeschlagene beim nächsten Mal erneut bewerten
+        per_chapter[chapter_index][agent_index] = result
+    logger.debug(f"{len(chapters) * len(agents) - len(pending)} Kapitelbewertung(en) aus dem Cache.")
+
+    lengths = [
+        sum(len(str(subchapter.get("Content", "")).split()) for subchapter in chapter["Subchapters"])
+        for chapter in chapters
+    ]
+    results = []
+    for index, agent in enumerate(agents):
+        chapter_results = [chapter_result[index] for chapter_result in per_chapter]
+        completed = [
+            (chapter, result, length)
+            for chapter, result, length in zip(chapters, chapter_results, lengths)
+            if result["log"].get("status") == "completed"
+        ]
+        score = aggregate_scores(
+            [result["output"] for _, result, _ in completed], [length for _, _, length in completed], aggregation
+        ) if completed else 0
+        explanation = "\n".join(
+            f"Kapitel {chapter['Number']} ({result['output']}): {result['explanation']}" for chapter, result, _ in completed
+        ) or "Fehler bei der Bewertung"
+        log = {
+            "agent": agent.__name__,
+            # Unvollständige Bewertungen werden beim Fortsetzen wiederholt, bewertete Kapitel kommen dann aus dem Cache
+            "status": "completed" if len(completed) == len(chapters) else "failed",
+            "details": [result["log"] for result in chapter_results],
+            "output": score,
+            "explanation": explanation,
+            "aggregation": aggregation
+        }
+        results.append({"log": log, "output": score, "explanation": explanation})
+    return results
+
+def aggregate_scores(scores, weights, method=CHAPTER_SCORE_AGGREGATION):
+    """
+    Combines the chapter scores of one criterion.
+
+    Args:
+        scores (list): The chapter scores (0-100).
+        weights (list): The weight of each chapter, e.g. its number of words.
+        method (str, optional): "weighted_mean" for the mean weighted by `weights`, "mean" for the
+            plain mean or "min" for the weakest chapter. Defaults to CHAPTER_SCORE_AGGREGATION.
+    Returns:
+        int: The aggregated score.
+    Raises:
+        ValueError: If there are no scores or the method is unknown.
+    """
+    if not scores:
+        raise ValueError("Keine Bewertungen zum Zusammenfassen.")
+    if method == "min":
+        return min(scores)
+    if method == "mean" or (method == "weighted_mean" and sum(weights) <= 0):
+        return round(sum(scores) / len(scores))
+    if method == "weighted_mean":
+        return round(sum(score * weight for score, weight in zip(scores, weights)) / sum(weights))
+    raise ValueError(f"Unbekannte Aggregation: {method}")
+
 def calculate_final_score(weighted_scores_with_details):
     """
     Calculates the final score based on weighted evaluations.
     Args:
-        weighted_scores_with_details (list): A list of either numerical scores or dictionaries containing 
-                                             'output' (score) and 'log' (details).
+        weighted_scores_with_details (list or dict): A list of either numerical scores or dictionaries containing 
+                                             'output' (score) and 'log' (details), or the JSON object of the
+                                             combined evaluation with "score" and "begruendung" per criterion.
     Returns:
         dict: A dictionary containing:
             - 'score' (float): The weighted average score rounded to two decimal places.
@@ -2194,6 +2984,17 @@ def calculate_final_score(weighted_scores_with_details):
         # Gewichtungen für universelle Bewertung
         weights = [1.5, 1.5, 1, 2, 1.5, 1.5, 1]  # Kapitel, Absätze, Buchart, Inhalt, Grammatik, Stil, Spannung
 
+        # Rohe JSON-Antwort der kombinierten Bewertung in Einzelergebnisse umwandeln
+        if isinstance(weighted_scores_with_details, dict):
+            logger.info("Kombinierte Bewertung in weighted_scores_with_details erkannt.")
+            weighted_scores_with_details = [
+                {
+                    "output": weighted_scores_with_details.get(key, {}).get("score", 0),
+                    "log": {"agent": agent_name, "explanation": weighted_scores_with_details.get(key, {}).get("begruendung", "")}
+                }
+                for key, agent_name, _ in EVALUATION_CRITERIA
+            ]
+
         # Validierung der Eingabestruktur
         if all(isinstance(entry, (int, float)) for entry in weighted_scores_with_details):
             logger.info("Numerische Werte in weighted_scores_with_details erkannt.")
@@ -2236,8 +3037,6 @@ def calculate_final_score(weighted_scores_with_details):
 
 # Initialisiere das Agentensystem
 agent_system = AgentSystem()
-if not agent_system.validate_saved_data():
-    logger.warning("Es gibt ungültige oder nicht abrufbare gespeicherte Daten.")
 agent_system.add_agent(synopsis_agent, kontrolliert=True)
 agent_system.add_agent(synopsis_validation_agent, kontrolliert=False)
 agent_system.add_agent(chapter_agent, kontrolliert=True)
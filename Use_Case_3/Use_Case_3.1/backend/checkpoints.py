@@ -0,0 +1,275 @@
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = "./Use_Case_3/Use_Case_3.1/backend/checkpoints"  # Eine JSON-Datei pro Job
+ITEM_LOG_SUFFIX = ".items.jsonl"  # Einzelne Einträge werden an dieses Protokoll angehängt statt die JSON-Datei neu zu schreiben
+
+
+class CheckpointStore:
+    """
+    Durable state of one pipeline run, written to a JSON file after every completed step.
+
+    Single entries of phases with several results (save_items) are appended as one line to
+    an item log next to the JSON file, so saving a subchapter costs the size of the
+    subchapter instead of the whole checkpoint. Every full write of the JSON file includes
+    these entries and starts a new, empty log.
+    """
+
+    def __init__(self, job_id, directory=CHECKPOINT_DIR):
+        """
+        Opens the checkpoint of a job, loading it if it already exists.
+
+        Args:
+            job_id (str): The ID of the job; used as the file name.
+            directory (str, optional): The directory of the checkpoint files. Defaults to CHECKPOINT_DIR.
+        """
+        self.job_id = job_id
+        self.path = os.path.join(directory, f"{job_id}.json")
+        self.log_path = item_log_path(self.path)
+        self.lock = threading.Lock()
+        self.state = read_checkpoint(self.path) or {
+            "job_id": job_id,
+            "status": "running",
+            "params": {},
+            "phases": {},
+            "result": None,
+            "generation": 0,
+            "updated_at": None
+        }
+
+    @property
+    def params(self):
+        """dict: The arguments of run_agents needed to resume the run."""
+        return self.state["params"]
+
+    def set_params(self, **params):
+        """
+        Records the arguments of the run.
+
+        Args:
+            **params: JSON-serialisable arguments such as user_input and min_chapter.
+        """
+        with self.lock:
+            self.state["params"].update(params)
+            self._write()
+
+    def get(self, phase, default=None):
+        """
+        Returns the saved result of a phase.
+
+        Args:
+            phase (str): The phase, e.g. "synopsis" or "chapters".
+            default: The value returned if the phase has no result yet. Defaults to None.
+
+        Returns:
+            The saved result or default.
+        """
+        with self.lock:
+            return self.state["phases"].get(phase, default)
+
+    def save(self, phase, value):
+        """
+        Saves the result of a phase and writes the checkpoint.
+
+        Args:
+            phase (str): The phase, e.g. "synopsis" or "chapters".
+            value: The JSON-serialisable result.
+        """
+        with self.lock:
+            self.state["phases"][phase] = value
+            self._write()
+        logger.debug(f"Checkpoint für Job {self.job_id} gespeichert: {phase}")
+
+    def get_item(self, phase, key):
+        """
+        Returns one saved entry of a phase with several results, e.g. a written subchapter.
+
+        Args:
+            phase (str): The phase, e.g. "subchapters" or "evaluations".
+            key (str): The key of the entry within the phase.
+
+        Returns:
+            The saved entry or None.
+        """
+        with self.lock:
+            return self.state["phases"].get(phase, {}).get(key)
+
+    def save_item(self, phase, key, value):
+        """
+        Saves one entry of a phase with several results, see save_items.
+
+        Args:
+            phase (str): The phase, e.g. "subchapters" or "evaluations".
+            key (str): The key of the entry within the phase.
+            value: The JSON-serialisable entry.
+        """
+        self.save_items([(phase, key, value)])
+
+    def save_items(self, items):
+        """
+        Saves entries of phases with several results together in one append to the item log.
+
+        A crash either keeps all of the entries or none of them.
+
+        Args:
+            items (list): Tuples (phase, key, value) with JSON-serialisable values.
+        """
+        with self.lock:
+            if not os.path.exists(self.path):
+                self._write()  # Das Protokoll wird nur zusammen mit der JSON-Datei gelesen
+            updated_at = datetime.now().isoformat()
+            line = json.dumps({
+                "generation": self.state.get("generation", 0),
+                "items": [[phase, key, value] for phase, key, value in items],
+                "updated_at": updated_at
+            }, ensure_ascii=False)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            for phase, key, value in items:
+                self.state["phases"].setdefault(phase, {})[key] = value
+            self.state["updated_at"] = updated_at
+        logger.debug(
+            f"Checkpoint für Job {self.job_id} gespeichert: {', '.join(f'{phase}/{key}' for phase, key, _ in items)}"
+        )
+
+    def clear(self, *phases):
+        """
+        Discards the results of phases that have to be repeated.
+
+        Args:
+            *phases (str): The phases to discard.
+        """
+        with self.lock:
+            for phase in phases:
+                self.state["phases"].pop(phase, None)
+            self._write()
+
+    def complete(self, result):
+        """
+        Marks the run as completed and stores its result.
+
+        Args:
+            result (dict): The result returned by run_agents.
+        """
+        with self.lock:
+            self.state.update({"status": "completed", "result": result})
+            self._write()
+
+    def _write(self):
+        """Writes the state atomically and empties the item log; the lock must be held."""
+        self.state["updated_at"] = datetime.now().isoformat()
+        # Die JSON-Datei enthält alle bisherigen Einträge, ältere Zeilen des Protokolls werden beim Lesen übersprungen
+        self.state["generation"] = self.state.get("generation", 0) + 1
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)  # Ein Absturz hinterlässt nie eine halb geschriebene Datei
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+
+
+def item_log_path(path):
+    """
+    Returns the path of the item log belonging to a checkpoint file.
+
+    Args:
+        path (str): The path of the checkpoint file.
+
+    Returns:
+        str: The path of the item log.
+    """
+    return path[:-len(".json")] + ITEM_LOG_SUFFIX if path.endswith(".json") else path + ITEM_LOG_SUFFIX
+
+
+def read_checkpoint(path):
+    """
+    Reads a checkpoint file and applies the entries of its item log.
+
+    Args:
+        path (str): The path of the checkpoint file.
+
+    Returns:
+        dict: The saved state, or None if the file does not exist or is unreadable.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Checkpoint {path} konnte nicht gelesen werden: {e}")
+        return None
+
+    log_path = item_log_path(path)
+    if not os.path.exists(log_path):
+        return state
+    try:
+        with open(log_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError as e:
+        logger.error(f"Protokoll {log_path} konnte nicht gelesen werden: {e}")
+        return state
+    for number, line in enumerate(lines, start=1):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # Nur die letzte Zeile kann bei einem Absturz unvollständig geschrieben worden sein
+            logger.warning(f"Unvollständige Zeile {number} in {log_path} wird übersprungen.")
+            continue
+        if entry.get("generation", 0) != state.get("generation", 0):
+            continue  # Bereits in der JSON-Datei enthalten
+        for phase, key, value in entry["items"]:
+            state["phases"].setdefault(phase, {})[key] = value
+        state["updated_at"] = entry.get("updated_at", state.get("updated_at"))
+    return state
+
+
+def load_checkpoint(job_id, directory=CHECKPOINT_DIR):
+    """
+    Opens the checkpoint of an earlier run.
+
+    Args:
+        job_id (str): The ID of the job.
+        directory (str, optional): The directory of the checkpoint files. Defaults to CHECKPOINT_DIR.
+
+    Returns:
+        CheckpointStore: The checkpoint, or None if the job has no checkpoint.
+    """
+    if not os.path.exists(os.path.join(directory, f"{job_id}.json")):
+        return None
+    return CheckpointStore(job_id, directory)
+
+
+def list_checkpoints(directory=CHECKPOINT_DIR):
+    """
+    Lists the saved runs without their results.
+
+    Args:
+        directory (str, optional): The directory of the checkpoint files. Defaults to CHECKPOINT_DIR.
+
+    Returns:
+        list: One dictionary per run with job ID, status, parameters, completed phases and last update.
+    """
+    if not os.path.isdir(directory):
+        return []
+    checkpoints = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        state = read_checkpoint(os.path.join(directory, name))
+        if state:
+            checkpoints.append({
+                "job_id": state.get("job_id"),
+                "status": state.get("status"),
+                "params": state.get("params", {}),
+                "phases": list(state.get("phases", {})),
+                "updated_at": state.get("updated_at")
+            })
+    return checkpoints
@@ -0,0 +1,204 @@
+from collections import Counter, OrderedDict
+from functools import cached_property
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+
+from chromadb.api.types import EmbeddingFunction
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKEND = "onnx"  # "onnx" = MiniLM-Modell von Chroma, "hashing" = leichtgewichtig und ohne Modell (offline)
+EMBEDDING_THREADS = 2  # CPU-Threads des ONNX-Modells, damit das Embedding die LLM-Aufrufe nicht ausbremst
+EMBEDDING_BATCH_SIZE = 32  # Texte pro Modellaufruf
+EMBEDDING_CACHE_ENTRIES = 2000  # Embeddings im Speicher, Schlüssel ist der Hash des Textes
+HASHING_DIMENSIONS = 384  # Dimensionen des Hashing-Embedders
+COLLECTION_NAME = "conversation_context"
+
+
+class ThreadedONNXEmbedding(ONNXMiniLM_L6_V2):
+    """Chroma's default MiniLM model with a configurable number of CPU threads and batch size."""
+
+    def __init__(self, threads=EMBEDDING_THREADS, batch_size=EMBEDDING_BATCH_SIZE):
+        """
+        Initializes the model; it is downloaded and loaded on first use.
+
+        Args:
+            threads (int, optional): The number of CPU threads, 0 lets ONNX Runtime decide. Defaults to EMBEDDING_THREADS.
+            batch_size (int, optional): The number of texts per model run. Defaults to EMBEDDING_BATCH_SIZE.
+        """
+        super().__init__()
+        self.threads = threads
+        self.batch_size = batch_size
+
+    @cached_property
+    def model(self):
+        options = self.ort.SessionOptions()
+        options.log_severity_level = 3
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        return self.ort.InferenceSession(
+            os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME, "model.onnx"),
+            providers=self.ort.get_available_providers(),
+            sess_options=options
+        )
+
+    def __call__(self, input):
+        self._download_model_if_not_exists()
+        return self._forward(input, batch_size=self.batch_size).tolist()
+
+
+class HashingEmbedding(EmbeddingFunction):
+    """Lightweight embedder without a model: hashed words and word pairs weighted by term frequency."""
+
+    def __init__(self, dimensions=HASHING_DIMENSIONS):
+        """
+        Initializes the embedder.
+
+        Args:
+            dimensions (int, optional): The length of the vectors. Defaults to HASHING_DIMENSIONS.
+        """
+        self.dimensions = dimensions
+
+    def __call__(self, input):
+        return [self.embed(text) for text in input]
+
+    def embed(self, text):
+        """
+        Embeds one text.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            list: The L2-normalised vector.
+        """
+        words = re.findall(r"\w+", text.lower())
+        features = Counter(words)
+        features.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+        vector = [0.0] * self.dimensions
+        for feature, count in features.items():
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+            sign = 1.0 if digest >> 63 else -1.0  # Vorzeichen gleicht Kollisionen im Mittel aus
+            vector[digest % self.dimensions] += sign * (1.0 + math.log(count))
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+
+class CachedEmbedding(EmbeddingFunction):
+    """LRU cache in front of an embedding function, keyed by the hash of the text."""
+
+    def __init__(self, embedding_function, max_entries=EMBEDDING_CACHE_ENTRIES, batch_size=EMBEDDING_BATCH_SIZE):
+        """
+        Initializes an empty cache.
+
+        Args:
+            embedding_function (EmbeddingFunction): The function computing missing embeddings.
+            max_entries (int, optional): The number of embeddings kept. Defaults to EMBEDDING_CACHE_ENTRIES.
+            batch_size (int, optional): The number of missing texts embedded per call. Defaults to EMBEDDING_BATCH_SIZE.
+        """
+        self.embedding_function = embedding_function
+        self.max_entries = max_entries
+        self.batch_size = max(1, batch_size)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "calls": 0}
+
+    def __call__(self, input):
+        keys = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in input]
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key]
+                    self.stats["hits"] += 1
+        # Fehlende Texte nur einmal und gebündelt berechnen
+        missing = {key: text for key, text in zip(keys, input) if key not in found}
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), self.batch_size):
+            batch = missing_keys[start:start + self.batch_size]
+            vectors = self.embedding_function([missing[key] for key in batch])
+            with self.lock:
+                self.stats["calls"] += 1
+                self.stats["misses"] += len(batch)
+                for key, vector in zip(batch, vectors):
+                    found[key] = [float(value) for value in vector]
+                    self.entries[key] = found[key]
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return [found[key] for key in keys]
+
+    def snapshot(self):
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            dict: Hits, misses, calls of the embedding function and the number of cached embeddings.
+        """
+        with self.lock:
+            return {**self.stats, "entries": len(self.entries)}
+
+
+def create_embedding_function(backend=EMBEDDING_BACKEND):
+    """
+    Creates the embedding function of a backend, wrapped in the embedding cache.
+
+    Args:
+        backend (str, optional): "onnx" or "hashing". Defaults to EMBEDDING_BACKEND.
+
+    Returns:
+        CachedEmbedding: The cached embedding function.
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    if backend == "onnx":
+        return CachedEmbedding(ThreadedONNXEmbedding())
+    if backend == "hashing":
+        return CachedEmbedding(HashingEmbedding())
+    raise ValueError(f"Unbekanntes Embedding-Backend: {backend}")
+
+
+_embedding_function = None
+_embedding_function_lock = threading.Lock()
+
+
+def get_embedding_function():
+    """
+    Returns the process-wide embedding function of EMBEDDING_BACKEND, creating it on first use.
+
+    Returns:
+        CachedEmbedding: The shared instance, so all collections share one cache.
+    """
+    global _embedding_function
+    if _embedding_function is None:
+        with _embedding_function_lock:
+            if _embedding_function is None:
+                _embedding_function = create_embedding_function(EMBEDDING_BACKEND)
+                logger.info(f"Embedding-Backend: {EMBEDDING_BACKEND}")
+    return _embedding_function
+
+
+def get_collection(client, name=COLLECTION_NAME):
+    """
+    Opens the context collection with the configured embedding function.
+
+    The vectors of different backends are not comparable, so every backend except "onnx",
+    whose vectors are already stored under the plain name, gets its own collection.
+
+    Args:
+        client: The Chroma client.
+        name (str, optional): The base name of the collection. Defaults to COLLECTION_NAME.
+
+    Returns:
+        Collection: The collection.
+    """
+    if EMBEDDING_BACKEND != "onnx":
+        name = f"{name}_{EMBEDDING_BACKEND}"
+    return client.get_or_create_collection(name=name, embedding_function=get_embedding_function())
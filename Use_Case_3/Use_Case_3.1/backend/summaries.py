@@ -0,0 +1,383 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import copy
+import logging
+import threading
+
+from ollama import MAX_PARALLEL_REQUESTS, OllamaLLM
+
+
+logger = logging.getLogger(__name__)
+
+SUBCHAPTER_SUMMARY_WORDS = 60  # Feste Länge der Zusammenfassung eines Unterkapitels
+CHAPTER_SUMMARY_WORDS = 120  # Feste Länge der laufenden Zusammenfassung eines Kapitels
+GROUP_SUMMARY_WORDS = 250  # Länge der Zusammenfassung einer Kapitelgruppe beim Map-Reduce
+TOKENS_PER_WORD = 2  # Token-Limit der Zusammenfassungen je erlaubtem Wort (deutsche Wörter sind oft mehrere Tokens)
+BOOK_SUMMARY_WORDS = 400  # Länge der abschließenden Zusammenfassung des Buches
+MAP_CHUNK_CHARS = 12000  # Längere Unterkapitel werden abschnittsweise zusammengefasst
+REDUCE_GROUP_SIZE = 8  # Höchstens so viele Zusammenfassungen werden in einem Aufruf zusammengeführt
+SUMMARY_WORKERS = MAX_PARALLEL_REQUESTS  # Gleichzeitige Zusammenfassungen beim Map-Reduce
+DETERMINISTIC_SUMMARIES = False  # True: Zusammenfassungen mit temperature 0, Wiederholungen kommen aus dem Antwort-Cache
+
+
+def limit_words(text, words):
+    """
+    Cuts a text to a maximum number of words.
+
+    Args:
+        text (str): The text to cut.
+        words (int): The maximum number of words.
+
+    Returns:
+        str: The text, shortened with "..." if it was longer.
+    """
+    parts = text.split()
+    if len(parts) <= words:
+        return text.strip()
+    return " ".join(parts[:words]) + " ..."
+
+
+def summarize(llm, prompt, words):
+    """
+    Asks the model for a summary and cuts it to the given number of words.
+
+    The summary is sampled like the other texts unless DETERMINISTIC_SUMMARIES is set.
+
+    Args:
+        llm (OllamaLLM): The model.
+        prompt (str): The summarising prompt.
+        words (int): The maximum number of words, also bounding the completion tokens.
+
+    Returns:
+        str: The summary.
+
+    Raises:
+        RuntimeError: If the model could not be reached.
+    """
+    summary = llm._call(prompt, deterministic=DETERMINISTIC_SUMMARIES, max_tokens=words * TOKENS_PER_WORD).strip()
+    if summary.startswith("Fehler bei der Verbindung"):
+        raise RuntimeError(summary)
+    return limit_words(summary, words)
+
+
+def summarize_subchapter(llm, subchapter, content):
+    """
+    Summarises the text of a subchapter; longer texts are summarised in chunks of MAP_CHUNK_CHARS first.
+
+    Args:
+        llm (OllamaLLM): The model.
+        subchapter (dict): The subchapter ("Number", "Title").
+        content (str): Its text.
+
+    Returns:
+        str: A summary of at most SUBCHAPTER_SUMMARY_WORDS words.
+    """
+    chunks = split_text(content, MAP_CHUNK_CHARS)
+    if len(chunks) > 1:
+        content = "\n\n".join(
+            summarize(llm, f"""
+            Abschnitt {index} von {len(chunks)} aus Unterkapitel {subchapter['Number']} - {subchapter['Title']}:
+            {chunk}
+
+            Aufgabe: Fasse diesen Abschnitt in höchstens {SUBCHAPTER_SUMMARY_WORDS} Wörtern zusammen.
+            Gib nur die Zusammenfassung zurück.
+            """, SUBCHAPTER_SUMMARY_WORDS)
+            for index, chunk in enumerate(chunks, start=1)
+        )
+    return summarize(llm, f"""
+    Unterkapitel {subchapter['Number']} - {subchapter['Title']}:
+    {content}
+
+    Aufgabe: Fasse den Inhalt dieses Unterkapitels in höchstens {SUBCHAPTER_SUMMARY_WORDS} Wörtern zusammen.
+    Gib nur die Zusammenfassung zurück.
+    """, SUBCHAPTER_SUMMARY_WORDS)
+
+
+def split_text(text, max_chars):
+    """
+    Splits a text at paragraph boundaries into chunks of at most max_chars characters.
+
+    Paragraphs longer than max_chars are cut hard.
+
+    Args:
+        text (str): The text to split.
+        max_chars (int): The maximum length of a chunk.
+
+    Returns:
+        list: The chunks, a single one for short texts.
+    """
+    chunks = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        while len(paragraph) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current or not chunks:
+        chunks.append(current)
+    return chunks
+
+
+class RollingSummaries:
+    """
+    Per-chapter summaries of fixed size, built in the order of the subchapters.
+
+    There is no running summary of the whole book: chapters are written in parallel, so a
+    synopsis of the earlier chapters would depend on which of them happen to be finished.
+    Each chapter only sees its own summary; the book-level context comes from the synopsis
+    and the outline (see agent.subchapter_context).
+    """
+
+    def __init__(self, state=None, llm=None):
+        """
+        Initializes the summaries, optionally from a snapshot.
+
+        Args:
+            state (dict, optional): A snapshot returned by snapshot(), e.g. from a checkpoint. It is copied,
+                so the given dictionary is never modified. Defaults to None.
+            llm (OllamaLLM, optional): The model used for summarising. Defaults to a new OllamaLLM.
+
+        Attributes:
+            chapters (dict): Per chapter number (as string) its "title", running "summary", the
+                summaries of its written subchapters ("subchapters", keyed by subchapter number) and
+                the subchapter numbers folded into the running summary ("covered").
+        """
+        state = copy.deepcopy(state or {})  # Eigene Kopie, der Checkpoint wird nur über snapshot() geschrieben
+        self.llm = llm or OllamaLLM()
+        self.chapters = state.get("chapters", {})  # Ältere Snapshots enthalten noch "book", das ignoriert wird
+        self.lock = threading.Lock()  # Schützt chapters
+
+    def update(self, chapter, subchapter, content):
+        """
+        Folds an accepted subchapter into the summary of its chapter.
+
+        writing_agent passes the subchapters of a chapter one after another, including the ones
+        it reuses, so the chapter summary always covers exactly the subchapters before the next
+        one. A subchapter that is already covered is skipped; one whose summary is still stored
+        after discard() is folded in again without summarising its text. Errors are logged; the
+        previous summary is kept, so writing can continue.
+
+        Args:
+            chapter (dict): The chapter containing the subchapter ("Number", "Title").
+            subchapter (dict): The accepted subchapter ("Number", "Title").
+            content (str): The text of the subchapter.
+        """
+        key = str(chapter["Number"])
+        number = str(subchapter["Number"])
+        try:
+            with self.lock:
+                entry = self.chapters.setdefault(key, {"title": chapter["Title"], "summary": "", "subchapters": {}})
+                # Ältere Snapshots kennen "covered" nicht, dort ist jedes gespeicherte Unterkapitel enthalten
+                covered = entry.setdefault("covered", list(entry["subchapters"]))
+                if number in covered:
+                    return
+                subchapter_summary = entry["subchapters"].get(number)
+            if subchapter_summary is None:
+                subchapter_summary = summarize_subchapter(self.llm, subchapter, content)
+
+            with self.lock:
+                previous = entry["summary"] or "Noch keine."
+            chapter_summary = summarize(self.llm, f"""
+            Bisherige Zusammenfassung von Kapitel {chapter['Number']} - {chapter['Title']}:
+            {previous}
+
+            Neues Unterkapitel {subchapter['Number']} - {subchapter['Title']}:
+            {subchapter_summary}
+
+            Aufgabe: Aktualisiere die Zusammenfassung des Kapitels, sodass sie das neue Unterkapitel an der
+            richtigen Stelle der Reihenfolge einschließt. Verwende höchstens {CHAPTER_SUMMARY_WORDS} Wörter.
+            Gib nur die Zusammenfassung zurück.
+            """, CHAPTER_SUMMARY_WORDS)
+
+            with self.lock:
+                entry["subchapters"][number] = subchapter_summary
+                entry["summary"] = chapter_summary
+                covered.append(number)
+        except Exception as e:
+            logger.error(f"Fehler beim Aktualisieren der Zusammenfassung von Kapitel {key}: {e}")
+
+    def context(self, chapter_number):
+        """
+        Returns the compact writing context: the summary of one chapter.
+
+        Its size does not depend on the length of the book.
+
+        Args:
+            chapter_number (int): The chapter whose summary is returned.
+
+        Returns:
+            str: The context, empty as long as no subchapter of the chapter has been summarised.
+        """
+        with self.lock:
+            entry = self.chapters.get(str(chapter_number))
+            if not entry or not entry["summary"]:
+                return ""
+            return f"Bisheriger Inhalt von Kapitel {chapter_number} - {entry['title']}:\n{entry['summary']}"
+
+    def chapter_state(self, chapter_number):
+        """
+        Returns a copy of the stored state of one chapter, e.g. to save it in a checkpoint.
+
+        Args:
+            chapter_number: The number of the chapter.
+
+        Returns:
+            dict: The "title", "summary" and "subchapters" of the chapter, or None if it has no summary yet.
+        """
+        with self.lock:
+            return copy.deepcopy(self.chapters.get(str(chapter_number)))
+
+    def subchapter_summary(self, chapter_number, subchapter_number):
+        """
+        Returns the stored summary of a subchapter.
+
+        Args:
+            chapter_number: The number of the chapter.
+            subchapter_number: The number of the subchapter.
+
+        Returns:
+            str: The summary, or None if the subchapter has not been summarised.
+        """
+        with self.lock:
+            entry = self.chapters.get(str(chapter_number))
+            return entry["subchapters"].get(str(subchapter_number)) if entry else None
+
+    def discard(self, keys):
+        """
+        Removes the summaries of subchapters that are written again.
+
+        The summary of each affected chapter is rebuilt without calling the model from the
+        summaries of the subchapters before the first discarded one, in numeric order and
+        each shortened to an equal share of CHAPTER_SUMMARY_WORDS. A rewritten subchapter
+        thus only sees the subchapters before it. The later subchapters keep their stored
+        summaries and are folded in again by update() together with the rewritten ones.
+
+        Args:
+            keys (list): Keys "<chapter>/<subchapter>" of the discarded subchapters.
+        """
+        with self.lock:
+            first_discarded = {}
+            for key in keys:
+                chapter_key, _, subchapter_key = str(key).partition("/")
+                entry = self.chapters.get(chapter_key)
+                if entry is None or entry["subchapters"].pop(subchapter_key, None) is None:
+                    continue
+                first = first_discarded.get(chapter_key)
+                if first is None or number_sort_key(subchapter_key) < number_sort_key(first):
+                    first_discarded[chapter_key] = subchapter_key
+
+            for chapter_key, first in first_discarded.items():
+                entry = self.chapters[chapter_key]
+                earlier = sorted(
+                    (number for number in entry["subchapters"] if number_sort_key(number) < number_sort_key(first)),
+                    key=number_sort_key
+                )
+                share = max(1, CHAPTER_SUMMARY_WORDS // len(earlier)) if earlier else 0
+                entry["summary"] = "\n".join(limit_words(entry["subchapters"][number], share) for number in earlier)
+                entry["covered"] = earlier
+
+    def snapshot(self):
+        """
+        Returns a copy of the summaries as a JSON-serialisable dictionary.
+
+        Returns:
+            dict: "chapters", accepted by the constructor.
+        """
+        with self.lock:
+            return copy.deepcopy({"chapters": self.chapters})
+
+
+def number_sort_key(number):
+    """Sorts chapter and subchapter numbers such as "1.10" numerically, part by part."""
+    return tuple((0, int(part), "") if part.isdigit() else (1, 0, part) for part in str(number).split("."))
+
+
+def summarize_book(final_text, summaries=None, llm=None, max_workers=SUMMARY_WORKERS):
+    """
+    Summarises a book by map-reduce, so no prompt has to hold the whole book.
+
+    Map: every subchapter is summarised in parallel, reusing the summaries already computed
+    while writing. Reduce: the subchapter summaries are merged per chapter, the chapter
+    summaries in groups of REDUCE_GROUP_SIZE until one prompt covers the whole book.
+    The latency depends on the chunk size and the parallelism instead of the book length.
+
+    Args:
+        final_text (dict): The book with "Chapters", each with "Number", "Title" and "Subchapters"
+            ("Number", "Title", "Content").
+        summaries (RollingSummaries, optional): Summaries computed while writing. Defaults to None.
+        llm (OllamaLLM, optional): The model. Defaults to a new OllamaLLM.
+        max_workers (int, optional): The number of summaries computed at the same time. Defaults to SUMMARY_WORKERS.
+
+    Returns:
+        str: The summary of the book.
+
+    Raises:
+        ValueError: If the book contains no text.
+        RuntimeError: If the model could not be reached.
+    """
+    llm = llm or OllamaLLM()
+    chapters = [chapter for chapter in final_text.get("Chapters", []) if chapter.get("Subchapters")]
+    if not chapters:
+        raise ValueError("Das Buch enthält keinen Text zum Zusammenfassen.")
+
+    def map_subchapter(chapter, subchapter):
+        known = summaries.subchapter_summary(chapter["Number"], subchapter["Number"]) if summaries else None
+        return known or summarize_subchapter(llm, subchapter, subchapter.get("Content", ""))
+
+    def reduce_chapter(chapter, subchapter_summaries):
+        if len(subchapter_summaries) == 1:
+            return subchapter_summaries[0]
+        listing = "\n\n".join(
+            f"Unterkapitel {subchapter['Number']} - {subchapter['Title']}:\n{summary}"
+            for subchapter, summary in zip(chapter["Subchapters"], subchapter_summaries)
+        )
+        return reduce_group(listing, f"Kapitel {chapter['Number']} - {chapter['Title']}", CHAPTER_SUMMARY_WORDS)
+
+    def reduce_group(listing, scope, words):
+        return summarize(llm, f"""
+        Zusammenfassungen aus {scope}:
+        {listing}
+
+        Aufgabe: Führe diese Zusammenfassungen in der angegebenen Reihenfolge zu einer Zusammenfassung
+        in höchstens {words} Wörtern zusammen. Gib nur die Zusammenfassung zurück.
+        """, words)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        def run_all(function, arguments):
+            # Jede Aufgabe erhält eine Kopie des Kontexts, damit der Scheduler den Job zuordnen kann
+            futures = [executor.submit(contextvars.copy_context().run, function, *args) for args in arguments]
+            return [future.result() for future in futures]
+
+        # Map: Unterkapitel
+        flat = [(chapter, subchapter) for chapter in chapters for subchapter in chapter["Subchapters"]]
+        mapped = iter(run_all(map_subchapter, flat))
+        per_chapter = [[next(mapped) for _ in chapter["Subchapters"]] for chapter in chapters]
+        logger.debug(f"{len(flat)} Unterkapitel zusammengefasst.")
+
+        # Reduce: Kapitel, danach Gruppen von Kapiteln, bis alles in einen Prompt passt
+        parts = [
+            f"Kapitel {chapter['Number']} - {chapter['Title']}:\n{summary}"
+            for chapter, summary in zip(chapters, run_all(reduce_chapter, list(zip(chapters, per_chapter))))
+        ]
+        while len(parts) > REDUCE_GROUP_SIZE:
+            groups = [parts[start:start + REDUCE_GROUP_SIZE] for start in range(0, len(parts), REDUCE_GROUP_SIZE)]
+            parts = run_all(reduce_group, [
+                ("\n\n".join(group), f"Teil {index} des Buches", GROUP_SUMMARY_WORDS)
+                for index, group in enumerate(groups, start=1)
+            ])
+
+    listing = "\n\n".join(parts)
+    return summarize(llm, f"""
+    Zusammenfassungen der Kapitel:
+    {listing}
+
+    Aufgabe: Erstelle eine prägnante Zusammenfassung des gesamten Buches.
+    Die Zusammenfassung sollte eine logische Reihenfolge haben und die Hauptpunkte aus jedem Kapitel abdecken, ohne Details auszulassen.
+    Verwende höchstens {BOOK_SUMMARY_WORDS} Wörter und gib nur die Zusammenfassung zurück.
+    """, BOOK_SUMMARY_WORDS)
@@ -0,0 +1,81 @@
+"""
+Benchmark: time to store the documents of a book run in Chroma, before and after the write-behind buffer.
+
+Before, store_context called `add` once per document, so every document paid for its own
+embedding call and its own SQLite commit. Now the documents are buffered and written in bulk
+upserts. The embedding model is replaced by a stub with a fixed cost per call and per document.
+
+Usage (from the repository root):
+    python benchmarks/bench_chroma_writes.py --backend Use_Case_1/Use_Case_1.1/backend --documents 200
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+from chromadb import PersistentClient
+from chromadb.api.types import EmbeddingFunction
+
+
+class StubEmbedding(EmbeddingFunction):
+    """Hash-based embeddings with the call overhead of a local embedding model."""
+
+    def __init__(self, call_delay, document_delay, dimensions=64):
+        self.call_delay = call_delay
+        self.document_delay = document_delay
+        self.dimensions = dimensions
+        self.calls = 0
+
+    def __call__(self, input):
+        self.calls += 1
+        time.sleep(self.call_delay + self.document_delay * len(input))
+        return [
+            [byte / 255 for byte in hashlib.sha512(text.encode("utf-8")).digest()[:self.dimensions]]
+            for text in input
+        ]
+
+
+def run(label, store, collection, embedding, documents):
+    """Stores the documents one by one through `store` and prints time and number of embedding calls."""
+    start = time.monotonic()
+    for index in range(documents):
+        store(
+            documents=[f"Unterkapitel {index}: " + "Text des Unterkapitels. " * 200],
+            ids=[f"doc-{index:05d}"],
+            metadatas=[{"kind": "subchapter", "session_id": "bench"}]
+        )
+    stored = collection.count()  # Lesen schreibt den Rest des Puffers
+    elapsed = time.monotonic() - start
+    print(f"{label:<10} {elapsed:6.2f} s   Dokumente: {stored:4d}   Embedding-Aufrufe: {embedding.calls:4d}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="Use_Case_1/Use_Case_1.1/backend")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--call-delay", type=float, default=0.02, help="Sekunden pro Embedding-Aufruf")
+    parser.add_argument("--document-delay", type=float, default=0.002, help="Sekunden pro Dokument")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.backend))
+    from storage import BufferedCollection
+
+    with tempfile.TemporaryDirectory() as directory:
+        client = PersistentClient(path=directory)
+
+        embedding = StubEmbedding(args.call_delay, args.document_delay)
+        collection = client.create_collection("before", embedding_function=embedding)
+        before = run("vorher", collection.add, collection, embedding, args.documents)
+
+        embedding = StubEmbedding(args.call_delay, args.document_delay)
+        buffered = BufferedCollection(client.create_collection("after", embedding_function=embedding))
+        after = run("nachher", buffered.add, buffered, embedding, args.documents)
+
+    print(f"{before / after:.1f}x schneller")
+
+
+if __name__ == "__main__":
+    main()
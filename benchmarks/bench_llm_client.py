@@ -0,0 +1,61 @@
+"""
+Micro-benchmark: per-call ``requests.post`` versus the pooled ``OllamaLLM`` client.
+
+Usage (from the repository root):
+    python benchmarks/bench_llm_client.py --backend Use_Case_1/Use_Case_1.1/backend --calls 500
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import time
+
+import requests
+
+from stub_llm_server import StubLLMServer
+
+
+def legacy_call(url, prompt):
+    """Reproduces the former ``OllamaLLM._call``: a bare ``requests.post`` per call."""
+    response = requests.post(url, json={
+        "model": "stub",
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": -1,
+        "stream": False
+    }, timeout=900)
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
+
+
+def run(label, call, calls, threads, server):
+    """Runs ``calls`` invocations of ``call`` and prints calls/sec and opened connections."""
+    connections_before = server.stats["connections"]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda i: call(f"Prompt {i}"), range(calls)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {calls / elapsed:10.1f} calls/s   "
+          f"{server.stats['connections'] - connections_before:5d} Verbindungen")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="Use_Case_1/Use_Case_1.1/backend")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.backend))
+    from ollama import OllamaLLM, configure_llm_client
+
+    server = StubLLMServer().start()
+    configure_llm_client(url=server.url, pool_size=max(args.threads, 1))
+
+    print(f"{args.calls} Aufrufe, {args.threads} Thread(s) gegen {server.url}")
+    run("vorher: requests.post", lambda p: legacy_call(server.url, p), args.calls, args.threads, server)
+    run("nachher: OllamaLLM (Pool)", lambda p: OllamaLLM()._call(p), args.calls, args.threads, server)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: prefilled prompt tokens of the seven evaluators, task-first versus book-first layout.
+
+The stub server simulates a prefix cache; with the task line in front of the book every
+evaluator has to prefill the whole book again, with the book in front only the first one does.
+
+Usage (from the repository root):
+    python benchmarks/bench_prefix_cache.py --backend Use_Case_1/Use_Case_1.1/backend --words 20000
+"""
+import argparse
+import os
+import random
+import sys
+
+from stub_llm_server import StubLLMServer
+
+
+# Aufgaben der evaluate_*-Agenten in der Reihenfolge von calculate_final_score
+TASKS = [
+    "Bewerte die Kapitel des Buches basierend auf ihrer Struktur, Konsistenz und den Übergängen.",
+    "Bewerte die Absätze des Buches basierend auf ihrem Lesefluss, Fokus und logischer Verknüpfung.",
+    "Bewerte die Buchart basierend auf ihrer Eignung für Zielgruppe und Thema.",
+    "Bewerte den Inhalt des Buches basierend auf Tiefe, Relevanz und Fokus auf das Thema.",
+    "Bewerte die Grammatik und Rechtschreibung des Buches.",
+    "Bewerte den Schreibstil des Buches basierend auf Abwechslung, Tonalität und Authentizität.",
+    "Bewerte die Spannung des Buches basierend auf Wendepunkten, Aufbau und Charakterentwicklung."
+]
+INSTRUCTION = (
+    "Gib eine Bewertung so streng wie mögliche auf einer Skala von 0 bis 100 ab. Ohne /100 sondern nur deine Bewertung.\n"
+    "Erkläre, warum du diese Bewertung vergeben hast, und schlage Verbesserungen vor."
+)
+
+
+def legacy_prompt(final_text, task):
+    """Reproduces the former evaluator prompts with the task in front of the book."""
+    return f"""
+        Aufgabe: {task}
+        Text:
+        {final_text}
+
+        {INSTRUCTION}
+        """
+
+
+def run(label, build_prompt, final_text, server, call):
+    """Sends the seven evaluator prompts and prints the prefilled tokens per call."""
+    per_call = []
+    for task in TASKS:
+        before = server.stats["prefill_tokens"]
+        call(build_prompt(final_text, task), final_text)
+        per_call.append(server.stats["prefill_tokens"] - before)
+    print(f"{label:<24} {sum(per_call):8d} Prefill-Tokens   pro Aufruf: {per_call}")
+    return sum(per_call)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="Use_Case_1/Use_Case_1.1/backend")
+    parser.add_argument("--words", type=int, default=20000, help="Länge des synthetischen Buches in Wörtern")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.backend))
+    from ollama import OllamaLLM, configure_llm_client
+    from prompts import prefix_cache_key, shared_prefix_prompt
+
+    random.seed(0)
+    vocabulary = ["Drache", "Wald", "Stadt", "Nacht", "Licht", "Reise", "Freund", "Geheimnis", "lief", "sah", "und", "der"]
+    final_text = " ".join(random.choice(vocabulary) for _ in range(args.words))
+
+    def book_first(text, task):
+        return shared_prefix_prompt(text, f"Aufgabe: {task}\n{INSTRUCTION}")
+
+    print(f"Buch mit {args.words} Wörtern, 7 Bewertungen")
+    results = {}
+    for label, build_prompt, use_key in (("vorher: Aufgabe zuerst", legacy_prompt, False),
+                                         ("nachher: Buch zuerst", book_first, True)):
+        server = StubLLMServer(answer="80 Gute Struktur.", prefix_cache_size=8).start()
+        configure_llm_client(url=server.url)
+        llm = OllamaLLM()
+        results[label] = run(label, build_prompt, final_text, server,
+                             lambda prompt, text: llm._call(prompt, cache_key=prefix_cache_key(text) if use_key else None))
+        server.shutdown()
+    before, after = results.values()
+    print(f"Ersparnis: {100 * (1 - after / before):.1f} % weniger Prefill-Tokens")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark: chat latency while book jobs keep the LLM server busy.
+
+The stub server processes a fixed number of requests at the same time. Several book
+jobs send batches of calls; a chat call arrives in between. Without priorities the chat
+call queues behind all batch calls, with the scheduler it gets the next free slot.
+
+Usage (from the repository root):
+    python benchmarks/bench_scheduler.py --backend Use_Case_1/Use_Case_1.1/backend --jobs 3 --calls 8
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import os
+import sys
+import time
+
+from stub_llm_server import StubLLMServer
+
+
+def run(label, client, jobs, calls, chat_delay, batch_context):
+    """Starts the book jobs, sends one chat call after chat_delay seconds and prints the timings."""
+    def book_job(job_id):
+        with batch_context(job_id):
+            with ThreadPoolExecutor(max_workers=calls) as executor:
+                # Wie writing_agent: alle Aufrufe eines Jobs gleichzeitig einreichen
+                futures = [
+                    executor.submit(contextvars.copy_context().run, client.complete, "Schreibe ein Kapitel.")
+                    for _ in range(calls)
+                ]
+                for future in futures:
+                    future.result()
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        jobs_done = [executor.submit(book_job, f"buch-{job}") for job in range(jobs)]
+        time.sleep(chat_delay)
+        chat_start = time.monotonic()
+        client.complete("Hallo, wie geht es dir?")
+        chat_latency = time.monotonic() - chat_start
+        for future in jobs_done:
+            future.result()
+    print(f"{label:<22} Chat-Latenz {chat_latency:6.2f} s   Gesamtdauer {time.monotonic() - start:6.2f} s")
+    return chat_latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="Use_Case_1/Use_Case_1.1/backend")
+    parser.add_argument("--jobs", type=int, default=3, help="Gleichzeitige Buch-Jobs")
+    parser.add_argument("--calls", type=int, default=8, help="Gleichzeitige LLM-Aufrufe pro Job")
+    parser.add_argument("--slots", type=int, default=2, help="Parallele Slots des Stub-Servers")
+    parser.add_argument("--delay", type=float, default=0.2, help="Sekunden pro Anfrage auf dem Stub-Server")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.backend))
+    from contextlib import nullcontext
+    from ollama import LLMClient
+    from scheduler import LLMScheduler, request_context
+
+    print(f"{args.jobs} Buch-Jobs mit je {args.calls} Aufrufen, Server mit {args.slots} Slots und {args.delay} s pro Anfrage")
+    server = StubLLMServer(slots=args.slots, response_delay=args.delay).start()
+    pool_size = args.jobs * args.calls + 1
+    # Vorher: keine Begrenzung im Client, alle Anfragen warten in der Warteschlange des Servers
+    unlimited = LLMClient(url=server.url, pool_size=pool_size, scheduler=LLMScheduler(pool_size))
+    before = run("vorher: ohne Scheduler", unlimited, args.jobs, args.calls, 2 * args.delay, lambda job_id: nullcontext())
+    # Nachher: Scheduler mit so vielen Slots wie der Server, Chat vor Buch-Aufrufen
+    scheduled = LLMClient(url=server.url, pool_size=pool_size, scheduler=LLMScheduler(args.slots))
+    after = run("nachher: mit Scheduler", scheduled, args.jobs, args.calls, 2 * args.delay, request_context)
+    server.shutdown()
+    print(f"Chat-Latenz {before / after:.1f}x kürzer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: search latency for the queries of a book run, before and after the search cache.
+
+Before, every search created a new DDGS session and tried the regions "de-de", "wt-wt"
+and no region one after another. Now sessions are reused, the regions run concurrently
+and queries differing only in case, punctuation or whitespace are answered from the cache. DDGS is replaced by a local stub.
+
+Usage (from the repository root):
+    python benchmarks/bench_search_cache.py --backend Use_Case_1/Use_Case_1.1/backend
+"""
+import argparse
+import os
+import sys
+import time
+
+from stub_ddgs import StubDDGSFactory
+
+
+# Suchanfragen wie sie der SearchQueryAgent pro Unterkapitel erzeugt, mit Wiederholungen in anderer Schreibweise
+QUERIES = [
+    "Geschichte der Dampfmaschine",
+    "Dampfmaschine Geschichte",
+    "geschichte der dampfmaschine",
+    "James Watt Erfindungen",
+    "Erfindungen James Watt",
+    "Industrialisierung England 18. Jahrhundert",
+    "Industrialisierung England 18 Jahrhundert",
+    "Eisenbahn Entwicklung Deutschland",
+    "\"Eisenbahn\" Entwicklung Deutschland",
+    "Textilindustrie Mechanisierung"
+]
+
+
+def legacy_search(factory, query):
+    """Reproduces the former perform_search: a new session per search and sequential regions."""
+    results = factory().text(query, region='de-de', safesearch='Off', max_results=50)
+    if not results:
+        results = factory().text(query, region='wt-wt', safesearch='Off', max_results=50)
+    if not results:
+        results = factory().text(query, safesearch='Off', max_results=50)
+    return results
+
+
+def run(label, search, factory, rounds):
+    """Runs all queries `rounds` times and prints time and number of searches."""
+    start = time.monotonic()
+    for _ in range(rounds):
+        for query in QUERIES:
+            search(query)
+    elapsed = time.monotonic() - start
+    print(f"{label:<22} {elapsed:6.2f} s   Sitzungen: {factory.stats['sessions']:3d}   "
+          f"Suchanfragen: {factory.stats['searches']:3d}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="Use_Case_1/Use_Case_1.1/backend")
+    parser.add_argument("--rounds", type=int, default=2, help="Wiederholungen, z. B. ein erneuter Buchlauf")
+    parser.add_argument("--delay", type=float, default=0.2, help="Sekunden pro Suche im Stub")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.backend))
+    from duckduckgo import DuckDuckGoSearch
+    from llm_cache import ResponseCache
+
+    print(f"{len(QUERIES)} Suchanfragen x {args.rounds}, 'de-de' ohne Treffer, {args.delay} s pro Suche")
+    legacy_factory = StubDDGSFactory(search_delay=args.delay, empty_regions=["de-de"])
+    before = run("vorher", lambda query: legacy_search(legacy_factory, query), legacy_factory, args.rounds)
+
+    factory = StubDDGSFactory(search_delay=args.delay, empty_regions=["de-de"])
+    search = DuckDuckGoSearch(ddgs_factory=factory, cache=ResponseCache(directory=None))
+    after = run("nachher", search.perform_search, factory, args.rounds)
+    print(f"{before / after:.1f}x schneller")
+
+
+if __name__ == "__main__":
+    main()
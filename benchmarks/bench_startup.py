@@ -0,0 +1,113 @@
+"""
+Benchmark: import time of backend.py and time until the backend is ready.
+
+Before, importing the backend loaded chromadb and duckduckgo_search, opened the Chroma storage
+and validated saved data; main.py then waited a fixed 3 seconds before probing. Now heavy
+dependencies are loaded on first use and main.py polls /api/health with backoff.
+Every run uses a fresh working directory, so the repository's storage and caches stay untouched.
+
+Usage (from the repository root):
+    python benchmarks/bench_startup.py --backend Use_Case_1/Use_Case_1.1/backend
+"""
+import argparse
+from contextlib import contextmanager
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+
+HEALTH_URL = "http://127.0.0.1:5000/api/health"
+LEGACY_START_SLEEP = 3  # Feste Wartezeit des bisherigen start_backend
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, {backend!r})
+start = time.perf_counter()
+import backend
+if {eager}:
+    # Was der Import bisher zusätzlich erledigt hat
+    import duckduckgo_search
+    from storage import get_vectorstore
+    get_vectorstore().get(where={{"session_id": backend.AgentSystem().session_id}})
+print(time.perf_counter() - start)
+"""
+
+
+@contextmanager
+def workdir(backend):
+    """Provides a fresh working directory with the relative backend path used for logs and storage."""
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as directory:
+        os.makedirs(os.path.join(directory, backend), exist_ok=True)
+        yield directory
+
+
+def import_time(backend, eager):
+    """Imports backend.py in a fresh interpreter and returns the seconds it took."""
+    script = IMPORT_SCRIPT.format(backend=os.path.abspath(backend), eager=eager)
+    with workdir(backend) as directory:
+        output = subprocess.run(
+            [sys.executable, "-c", script], cwd=directory, capture_output=True, text=True, check=True
+        ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_to_ready(backend, timeout=60):
+    """Starts backend.py, polls /api/health like main.py and returns the seconds until it answers."""
+    with workdir(backend) as directory:
+        start = time.monotonic()
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(os.path.join(backend, "backend.py"))],
+            cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        return poll_until_ready(process, start, timeout)
+
+
+def poll_until_ready(process, start, timeout):
+    """Polls /api/health with backoff and stops the backend afterwards."""
+    try:
+        delay = 0.1
+        while time.monotonic() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("Backend wurde beim Start beendet.")
+            try:
+                if requests.get(HEALTH_URL, timeout=2).ok:
+                    return time.monotonic() - start
+            except requests.RequestException:
+                pass
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+        raise RuntimeError("Backend war nicht rechtzeitig bereit.")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="Use_Case_1/Use_Case_1.1/backend")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    try:
+        requests.get(HEALTH_URL, timeout=1)
+        sys.exit("Port 5000 ist belegt, bitte laufendes Backend beenden.")
+    except requests.RequestException:
+        pass
+
+    eager = min(import_time(args.backend, eager=True) for _ in range(args.runs))
+    lazy = min(import_time(args.backend, eager=False) for _ in range(args.runs))
+    print(f"Import vorher (eager) {eager:6.2f} s")
+    print(f"Import nachher (lazy) {lazy:6.2f} s   {eager / lazy:.1f}x schneller")
+
+    ready = min(time_to_ready(args.backend) for _ in range(args.runs))
+    legacy = LEGACY_START_SLEEP + eager
+    print(f"Bereit vorher         {legacy:6.2f} s   (fest {LEGACY_START_SLEEP} s gewartet, Import vor dem Serverstart)")
+    print(f"Bereit nachher        {ready:6.2f} s   {legacy / ready:.1f}x schneller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Local stand-in for duckduckgo_search.DDGS.
+
+The stub answers text searches with generated results after a fixed delay, so that
+tests and benchmarks of DuckDuckGoSearch need no network. Pass a StubDDGSFactory as
+`ddgs_factory`; it counts the created sessions and the searches per region.
+"""
+import threading
+import time
+
+
+class StubDDGSFactory:
+    """Creates StubDDGS sessions and collects their statistics."""
+
+    def __init__(self, search_delay=0.2, connect_delay=0.1, empty_regions=()):
+        """
+        Args:
+            search_delay (float): Seconds each search takes.
+            connect_delay (float): Seconds the first search of a new session additionally takes (TLS handshake).
+            empty_regions (iterable): Regions for which the stub finds nothing, e.g. ["de-de"].
+        """
+        self.search_delay = search_delay
+        self.connect_delay = connect_delay
+        self.empty_regions = set(empty_regions)
+        self.stats = {"sessions": 0, "searches": 0, "by_region": {}}
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            self.stats["sessions"] += 1
+        return StubDDGS(self)
+
+
+class StubDDGS:
+    """Answers DDGS.text() calls with generated results."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.connected = False
+
+    def text(self, keywords, region="wt-wt", safesearch="moderate", timelimit=None, backend="auto", max_results=None):
+        factory = self.factory
+        with factory.lock:
+            factory.stats["searches"] += 1
+            factory.stats["by_region"][region] = factory.stats["by_region"].get(region, 0) + 1
+        time.sleep(factory.search_delay + (0 if self.connected else factory.connect_delay))
+        self.connected = True
+        if region in factory.empty_regions:
+            return []
+        slug = "-".join(keywords.lower().split())
+        return [
+            {
+                "title": f"{keywords} ({i})",
+                # Jeder dritte Treffer verweist auf dieselbe Seite wie sein Vorgänger
+                "href": f"https://www.example.org/{slug}/{i - (i % 3 == 2)}",
+                "body": f"Ausschnitt {i} zu {keywords}."
+            }
+            for i in range(max_results or 10)
+        ]
@@ -0,0 +1,164 @@
+"""
+Local stand-in for the LM Studio Chat Completions endpoint.
+
+The stub answers every request with a fixed text so that benchmarks measure the
+client side (connection handling, serialisation, early abort) and not inference.
+Streaming requests are answered word by word as server-sent events. Optionally the
+stub simulates a prefix cache and counts how many prompt tokens would be prefilled,
+and a server with a limited number of parallel slots and a fixed generation time.
+"""
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """Handles Chat Completions requests with a fixed answer."""
+
+    protocol_version = "HTTP/1.1"  # Keep-Alive erlauben
+    disable_nagle_algorithm = True  # Header und Body nicht verzögern
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.server.stats["requests"] += 1
+        self.server.count_prefill(payload.get("messages", []))
+        answer = self.server.answer(payload)
+        max_tokens = payload.get("max_tokens", -1)
+        with self.server.slots:
+            self.server.track_active(1)
+            try:
+                time.sleep(self.server.response_delay)
+                if payload.get("stream"):
+                    self.send_stream(answer, max_tokens)
+                else:
+                    self.send_answer(answer, max_tokens)
+            finally:
+                self.server.track_active(-1)
+
+    def send_answer(self, answer, max_tokens):
+        """Sends the whole answer as one JSON response."""
+        if max_tokens is not None and max_tokens > 0:
+            answer = " ".join(answer.split(" ")[:max_tokens])  # Ein Wort entspricht einem Token
+        body = json.dumps({
+            "choices": [{"message": {"role": "assistant", "content": answer}}]
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, answer, max_tokens):
+        """Sends the answer word by word as server-sent events in chunked encoding."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = answer.split(" ")
+        if max_tokens is not None and max_tokens > 0:
+            words = words[:max_tokens]
+        try:
+            for i, word in enumerate(words):
+                time.sleep(self.server.token_delay)
+                delta = {"content": word if i == 0 else " " + word}
+                self.write_chunk(f"data: {json.dumps({'choices': [{'delta': delta}]})}\n\n")
+                self.server.stats["streamed_tokens"] += 1
+            self.write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.stats["aborted_streams"] += 1
+            self.close_connection = True
+
+    def write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass  # Keine Ausgabe pro Anfrage
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """Threaded HTTP server that counts requests, connections and streamed tokens."""
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), answer="Ja, das ist eine Antwort vom Stub-Server.",
+                 token_delay=0.0, prefix_cache_size=0, slots=0, response_delay=0.0):
+        """
+        Args:
+            address (tuple): Host and port to listen on, port 0 picks a free port.
+            answer (str or callable): The fixed answer, or a function mapping the request payload to the answer.
+            token_delay (float): Seconds to wait before each streamed word.
+            prefix_cache_size (int): Number of previous prompts kept for prefix reuse, 0 disables the cache.
+            slots (int): Number of requests processed at the same time, further ones wait; 0 for no limit.
+            response_delay (float): Seconds each request occupies its slot before the answer is sent.
+        """
+        super().__init__(address, StubLLMHandler)
+        self.answer = answer if callable(answer) else (lambda payload: answer)
+        self.token_delay = token_delay
+        self.stats = {"requests": 0, "connections": 0, "streamed_tokens": 0, "aborted_streams": 0,
+                      "prompt_tokens": 0, "prefill_tokens": 0, "max_active": 0}
+        self.prefix_cache_size = prefix_cache_size
+        self.prefix_cache = []  # Zuletzt verarbeitete Prompts als Tokenlisten, neueste zuletzt
+        self.prefix_lock = threading.Lock()
+        self.response_delay = response_delay
+        self.slots = threading.BoundedSemaphore(slots) if slots else nullcontext()
+        self.active = 0
+        self.active_lock = threading.Lock()
+
+    def track_active(self, delta):
+        """Counts the requests currently holding a slot."""
+        with self.active_lock:
+            self.active += delta
+            self.stats["max_active"] = max(self.stats["max_active"], self.active)
+
+    def count_prefill(self, messages):
+        """
+        Counts the prompt tokens of a request that are not covered by a cached prefix.
+
+        Every whitespace-separated word of the messages counts as one token. The longest
+        common prefix with one of the cached prompts is treated as already prefilled.
+
+        Returns:
+            int: The number of tokens that had to be prefilled.
+        """
+        tokens = " ".join(message.get("content", "") for message in messages).split()
+        with self.prefix_lock:
+            reused = 0
+            for cached in self.prefix_cache:
+                common = 0
+                for a, b in zip(tokens, cached):
+                    if a != b:
+                        break
+                    common += 1
+                reused = max(reused, common)
+            if self.prefix_cache_size:
+                self.prefix_cache.append(tokens)
+                del self.prefix_cache[:-self.prefix_cache_size]
+            prefill = len(tokens) - reused
+            self.stats["prompt_tokens"] += len(tokens)
+            self.stats["prefill_tokens"] += prefill
+        return prefill
+
+    def process_request(self, request, client_address):
+        self.stats["connections"] += 1
+        super().process_request(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    server = StubLLMServer(("127.0.0.1", 1234))
+    print(f"Stub-Server läuft auf {server.url}")
+    server.serve_forever()
@@ -0,0 +1,67 @@
+"""
+Shared setup of the backend tests.
+
+The tests import the modules of one backend copy (default: Use_Case_1.1, another one can be
+chosen with the environment variable BOOK_AI_BACKEND) and run offline against the stubs
+in benchmarks/ instead of LM Studio and DuckDuckGo.
+
+Usage (from the repository root):
+    python -m pytest -q
+    BOOK_AI_BACKEND=Use_Case_2/Use_Case_2.1/backend python -m pytest -q
+"""
+import logging
+import os
+import sys
+import uuid
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.environ.get("BOOK_AI_BACKEND", "Use_Case_1/Use_Case_1.1/backend")
+
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, os.path.join(ROOT, BACKEND))
+
+# Ohne eigenen Handler würde logging.basicConfig in agent.py eine backend.log relativ zum Arbeitsverzeichnis anlegen
+logging.getLogger().addHandler(logging.NullHandler())
+
+from stub_llm_server import StubLLMServer  # noqa: E402
+
+
+@pytest.fixture
+def stub_server():
+    """A running StubLLMServer, shut down after the test."""
+    server = StubLLMServer().start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def llm_client(stub_server, monkeypatch):
+    """The process-wide LLM client, pointed at the stub server and without response cache."""
+    import ollama
+
+    client = ollama.LLMClient(url=stub_server.url, cache_responses=False)
+    monkeypatch.setattr(ollama, "_client", client)
+    yield client
+    client.close()
+
+
+
+@pytest.fixture
+def vectorstore(monkeypatch):
+    """A buffered in-memory collection with the hashing embedder, used as the shared collection."""
+    chromadb = pytest.importorskip("chromadb")
+
+    import storage
+    from embeddings import CachedEmbedding, HashingEmbedding
+
+    embedding_function = CachedEmbedding(HashingEmbedding())
+    collection = chromadb.EphemeralClient().create_collection(
+        f"test_{uuid.uuid4().hex}", embedding_function=embedding_function
+    )
+    buffer = storage.BufferedCollection(collection, embedding_function=embedding_function, flush_interval=None)
+    monkeypatch.setattr(storage, "_vectorstore", buffer)
+    return buffer
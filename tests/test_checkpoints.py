@@ -0,0 +1,118 @@
+import json
+
+from checkpoints import CheckpointStore, list_checkpoints, load_checkpoint
+
+
+OUTLINE = {
+    "Chapters": [
+        {"Number": 1, "Title": "Anfang", "Subchapters": [
+            {"Number": "1.1", "Title": "Erster Tag"},
+            {"Number": "1.2", "Title": "Zweiter Tag"}
+        ]},
+        {"Number": 2, "Title": "Ende", "Subchapters": [
+            {"Number": "2.1", "Title": "Letzter Tag"}
+        ]}
+    ]
+}
+
+
+def test_round_trip(tmp_path):
+    checkpoint = CheckpointStore("job-1", directory=str(tmp_path))
+    checkpoint.set_params(user_input="Ein Buch über Dampfmaschinen", min_chapter=2)
+    checkpoint.save("synopsis", {"Synopsis": "Text"})
+    checkpoint.save_item("subchapters", "1/1.1", {"Number": "1.1", "Content": "Äpfel"})
+
+    loaded = load_checkpoint("job-1", directory=str(tmp_path))
+    assert loaded.params == {"user_input": "Ein Buch über Dampfmaschinen", "min_chapter": 2}
+    assert loaded.get("synopsis") == {"Synopsis": "Text"}
+    assert loaded.get_item("subchapters", "1/1.1") == {"Number": "1.1", "Content": "Äpfel"}
+    assert loaded.get_item("subchapters", "1/1.2") is None
+    assert loaded.get("chapters", "fehlt") == "fehlt"
+
+    loaded.clear("synopsis")
+    loaded.complete({"final_text": {}})
+    state = json.loads((tmp_path / "job-1.json").read_text(encoding="utf-8"))
+    assert state["status"] == "completed"
+    assert list(state["phases"]) == ["subchapters"]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_unknown_and_unreadable_checkpoints(tmp_path):
+    assert load_checkpoint("unbekannt", directory=str(tmp_path)) is None
+    assert list_checkpoints(str(tmp_path / "fehlt")) == []
+    (tmp_path / "kaputt.json").write_text("{", encoding="utf-8")
+    CheckpointStore("job-1", directory=str(tmp_path)).save("synopsis", "Text")
+    assert [entry["job_id"] for entry in list_checkpoints(str(tmp_path))] == ["job-1"]
+    assert list_checkpoints(str(tmp_path))[0]["phases"] == ["synopsis"]
+
+
+def test_items_are_appended_without_rewriting_the_checkpoint(tmp_path):
+    checkpoint = CheckpointStore("job-1", directory=str(tmp_path))
+    checkpoint.set_params(user_input="Ein Buch")
+    written = (tmp_path / "job-1.json").read_text(encoding="utf-8")
+    for number in (1, 2, 3):
+        checkpoint.save_items([
+            ("subchapters", f"1/1.{number}", {"Content": f"Text {number}"}),
+            ("chapter_summaries", "1", {"summary": f"Bis {number}"})
+        ])
+
+    assert (tmp_path / "job-1.json").read_text(encoding="utf-8") == written
+    assert len((tmp_path / "job-1.items.jsonl").read_text(encoding="utf-8").splitlines()) == 3
+    loaded = load_checkpoint("job-1", directory=str(tmp_path))
+    assert loaded.get_item("subchapters", "1/1.3") == {"Content": "Text 3"}
+    assert loaded.get("chapter_summaries") == {"1": {"summary": "Bis 3"}}
+    assert list_checkpoints(str(tmp_path))[0]["phases"] == ["subchapters", "chapter_summaries"]
+
+
+def test_item_log_skips_torn_and_compacted_lines(tmp_path):
+    checkpoint = CheckpointStore("job-1", directory=str(tmp_path))
+    checkpoint.save_item("subchapters", "1/1.1", "Alt")
+    stale = (tmp_path / "job-1.items.jsonl").read_text(encoding="utf-8")
+    checkpoint.save_item("subchapters", "1/1.1", "Neu")
+    checkpoint.save("synopsis", "Text")  # Schreibt alle Einträge in die JSON-Datei und leert das Protokoll
+    assert not (tmp_path / "job-1.items.jsonl").exists()
+
+    # Absturz vor dem Leeren des Protokolls, dazu eine halb geschriebene Zeile
+    (tmp_path / "job-1.items.jsonl").write_text(stale + '{"generation": ', encoding="utf-8")
+    loaded = load_checkpoint("job-1", directory=str(tmp_path))
+    assert loaded.get_item("subchapters", "1/1.1") == "Neu"
+    assert loaded.get("synopsis") == "Text"
+
+
+def test_writing_resumes_after_the_saved_subchapters(tmp_path, llm_client, monkeypatch):
+    import agent
+
+    written = []
+    failing = {"2/2.1"}
+
+    def write_subchapter(user_input, chapter, subchapter, summaries=None):
+        key = f"{chapter['Number']}/{subchapter['Number']}"
+        if key in failing:
+            raise RuntimeError("LLM-Server abgestürzt")
+        written.append(key)
+        summaries.update(chapter, subchapter, f"Text von {key}")
+        return {"details": [key], "subchapter": {**subchapter, "Content": f"Text von {key}"}}
+
+    monkeypatch.setattr(agent, "write_subchapter", write_subchapter)
+
+    checkpoint = CheckpointStore("job-1", directory=str(tmp_path))
+    result = agent.writing_agent("Ein Buch", OUTLINE, checkpoint=checkpoint)
+    assert result["log"]["status"] == "failed"
+    assert written == ["1/1.1", "1/1.2"]
+
+    # Neustart: nur das fehlende Unterkapitel wird geschrieben
+    failing.clear()
+    written.clear()
+    resumed = load_checkpoint("job-1", directory=str(tmp_path))
+    assert sorted(resumed.get("subchapters")) == ["1/1.1", "1/1.2"]
+    assert sorted(resumed.get("chapter_summaries")["1"]["subchapters"]) == ["1.1", "1.2"]
+    result = agent.writing_agent("Ein Buch", OUTLINE, checkpoint=resumed)
+    assert result["log"]["status"] == "completed"
+    assert written == ["2/2.1"]
+    contents = [
+        subchapter["Content"]
+        for chapter in result["output"]["Chapters"]
+        for subchapter in chapter["Subchapters"]
+    ]
+    assert contents == ["Text von 1/1.1", "Text von 1/1.2", "Text von 2/2.1"]
+
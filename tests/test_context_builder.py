@@ -0,0 +1,60 @@
+from context_builder import (MIN_TRUNCATED_TOKENS, ContextBuilder, build_context, estimate_tokens,
+                             truncate_to_tokens)
+
+
+def words(count, word="Wort"):
+    """Returns a text of `count` words of one token each."""
+    return " ".join([word] * count)
+
+
+def test_estimate_tokens_splits_words_and_punctuation():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("Hallo, Welt!") == 5  # "Hallo" hat mehr als CHARS_PER_TOKEN Zeichen
+    # Lange Komposita zählen als mehrere Tokens
+    assert estimate_tokens("Donaudampfschifffahrt") == 6
+
+
+def test_truncate_keeps_the_beginning():
+    text = words(100)
+    assert truncate_to_tokens(text, 200) == text
+    truncated = truncate_to_tokens(text, 10)
+    assert truncated.endswith(" [...]")
+    assert text.startswith(truncated[:-len(" [...]")])
+    assert estimate_tokens(truncated[:-len(" [...]")]) <= 10
+
+
+def test_entries_are_selected_by_priority():
+    builder = ContextBuilder(max_tokens=10)
+    builder.add(words(8, "Such"), priority=4)
+    builder.add(words(4, "Plan"), priority=0)
+    builder.add(words(7, "Kap"), priority=1)
+    # Die Synopsis passt, Kapitel und Suche nicht mehr, für das Kürzen bleibt zu wenig Budget
+    assert builder.build() == words(4, "Plan")
+
+
+def test_build_context_stays_within_the_budget():
+    budget = MIN_TRUNCATED_TOKENS + 100
+    documents = [words(100, "Plan"), words(1000, "Such"), words(50, "Rat")]
+    metadatas = [{"kind": "synopsis"}, {"kind": "search"}, {"kind": "feedback"}]
+    context = build_context(documents, metadatas, max_tokens=budget)
+    parts = context.split("\n")
+    assert parts[0] == documents[0]
+    # Die Suchergebnisse werden auf das restliche Budget gekürzt, das Feedback fällt weg
+    assert parts[1].startswith("Such") and parts[1].endswith(" [...]")
+    assert len(parts) == 2
+    assert estimate_tokens(context) <= budget + estimate_tokens(" [...]")
+
+
+def test_build_context_prefers_the_neighbours_of_the_focus():
+    documents = ["1.1", "1.2", "1.3", "2.1", "1.4"]
+    metadatas = [{"kind": "subchapter", "chapter": 1 if number.startswith("1") else 2, "subchapter": number}
+                 for number in documents]
+    context = build_context(documents, metadatas, max_tokens=1000, focus={"chapter": 1, "subchapter": "1.3"})
+    # Das Unterkapitel selbst (beim Überarbeiten), dann vorherige vor folgenden, andere Kapitel zuletzt
+    assert context.split("\n") == ["1.3", "1.2", "1.4", "1.1", "2.1"]
+
+
+def test_newest_entries_first_within_a_kind():
+    documents = ["alt", "mittel", "neu"]
+    assert build_context(documents, [{"kind": "search"}] * 3).split("\n") == ["neu", "mittel", "alt"]
+    assert build_context(documents, [{"kind": "search"}] * 3, relevance_ordered=True).split("\n") == documents
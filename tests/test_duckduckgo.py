@@ -0,0 +1,22 @@
+from duckduckgo import DuckDuckGoSearch, normalize_query
+from llm_cache import ResponseCache
+from stub_ddgs import StubDDGSFactory
+
+
+def test_normalize_query_keeps_word_order_and_repeats():
+    assert normalize_query("  Geschichte der  \"Dampfmaschine\"! ") == "geschichte der dampfmaschine"
+    assert normalize_query("Dampfmaschine Geschichte") != normalize_query("Geschichte Dampfmaschine")
+    assert normalize_query("New York New York") != normalize_query("New York")
+
+
+def test_repeated_searches_are_answered_from_the_cache():
+    factory = StubDDGSFactory(search_delay=0, connect_delay=0, empty_regions=["de-de"])
+    search = DuckDuckGoSearch(ddgs_factory=factory, cache=ResponseCache(directory=None))
+    first = search.perform_search("Geschichte der Dampfmaschine")
+    searches = factory.stats["searches"]
+    second = search.perform_search("geschichte der dampfmaschine?")
+    assert first["results"]
+    assert second == first
+    assert factory.stats["searches"] == searches
+    search.perform_search("Dampfmaschine Geschichte")
+    assert factory.stats["searches"] > searches
@@ -0,0 +1,70 @@
+import math
+
+import pytest
+
+pytest.importorskip("chromadb")
+
+import embeddings  # noqa: E402
+from embeddings import CachedEmbedding, HashingEmbedding, create_embedding_function  # noqa: E402
+
+
+def embed(embedder, texts):
+    """Returns the vectors as lists; Chroma wraps the results of embedding functions in numpy arrays."""
+    return [[float(value) for value in vector] for vector in embedder(texts)]
+
+
+def cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def test_hashing_embedding_is_normalised_and_deterministic():
+    embedder = HashingEmbedding(dimensions=64)
+    first, second = embed(embedder, ["Die Dampfmaschine von James Watt", "Die Dampfmaschine von James Watt"])
+    assert len(first) == 64
+    assert math.isclose(math.sqrt(sum(value * value for value in first)), 1.0, rel_tol=1e-6)  # float32 von Chroma
+    assert first == second
+    assert embed(embedder, ["!"])[0] == [0.0] * 64  # Ohne Wörter bleibt der Vektor leer
+
+
+def test_hashing_embedding_keeps_similar_texts_close():
+    embedder = HashingEmbedding()
+    query, similar, other = embed(embedder, [
+        "Geschichte der Dampfmaschine",
+        "Die Geschichte der Dampfmaschine in England",
+        "Rezept für Apfelkuchen mit Zimt"
+    ])
+    assert cosine(query, similar) > cosine(query, other)
+
+
+def test_cached_embedding_computes_each_text_once():
+    calls = []
+
+    def embedding_function(texts):
+        calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    cache = CachedEmbedding(embedding_function, max_entries=2, batch_size=2)
+    assert cache(["a", "bb", "a", "ccc"]) == [[1.0], [2.0], [1.0], [3.0]]
+    assert calls == [["a", "bb"], ["ccc"]]
+    assert cache(["ccc"]) == [[3.0]]
+    assert cache.snapshot() == {"hits": 1, "misses": 3, "calls": 2, "entries": 2}
+    # "a" wurde verdrängt und wird erneut berechnet
+    cache(["a"])
+    assert calls[-1] == ["a"]
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_embedding_function("unbekannt")
+
+
+def test_hashing_backend_gets_its_own_collection(monkeypatch):
+    from chromadb import EphemeralClient
+
+    monkeypatch.setattr(embeddings, "EMBEDDING_BACKEND", "hashing")
+    monkeypatch.setattr(embeddings, "_embedding_function", None)
+    collection = embeddings.get_collection(EphemeralClient(), name="test_context")
+    assert collection.name == "test_context_hashing"
+    collection.add(ids=["1", "2"], documents=["Dampfmaschine und Eisenbahn", "Apfelkuchen mit Zimt"])
+    result = collection.query(query_texts=["Eisenbahn"], n_results=1)
+    assert result["ids"] == [["1"]]
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def agent(llm_client):
+    import agent
+
+    return agent
+
+
+def test_evaluators_share_the_book_prefix(agent, stub_server):
+    payloads = []
+
+    def answer(payload):
+        payloads.append(payload)
+        return "Note: 120 Gute Übergänge."
+
+    stub_server.answer = answer
+    evaluators = [agent.evaluate_chapters, agent.evaluate_grammar, agent.evaluate_tension]
+    results = [evaluate("Ein kurzes Buch.") for evaluate in evaluators]
+
+    assert [result["output"] for result in results] == [100, 100, 100]  # Auf 0 bis 100 begrenzt
+    assert results[0]["explanation"] == "Gute Übergänge."
+    assert [result["log"]["agent"] for result in results] == [
+        "ChapterEvaluationAgent", "GrammarEvaluationAgent", "TensionEvaluationAgent"
+    ]
+    prompts = [payload["messages"][-1]["content"] for payload in payloads]
+    prefix = os.path.commonprefix(prompts)
+    assert "Ein kurzes Buch." in prefix
+    assert len({payload["prompt_cache_key"] for payload in payloads}) == 1
+
+
+def test_answer_without_score_fails_the_evaluation(agent, stub_server):
+    stub_server.answer = lambda payload: "Keine Bewertung möglich."
+    result = agent.evaluate_style("Ein kurzes Buch.")
+    assert result["output"] == 0
+    assert result["log"]["status"] == "failed"
+    assert result["log"]["error"] == "Keine Zahl in der Antwort gefunden."
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobManager
+from scheduler import PRIORITY_BATCH, get_request
+
+
+def wait_for(manager, job_id, status="completed", timeout=2.0):
+    """Polls a job until it has the given status and returns it."""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = manager.get(job_id)
+        if job["status"] == status:
+            return job
+        assert time.monotonic() < deadline, f"Job hat den Status {job['status']}"
+        time.sleep(0.005)
+
+
+def test_job_runs_in_the_background_and_reports_progress():
+    manager = JobManager(max_workers=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def pipeline(text, job_id=None, progress=None):
+        progress("writing", subchapters_done=1, subchapters_total=3)
+        started.set()
+        release.wait(2)
+        return {"text": text, "job_id": job_id, "request": get_request()}
+
+    job_id = manager.submit(pipeline, "Buch")
+    started.wait(2)
+    running = manager.get(job_id)
+    assert running["status"] == "running"
+    assert running["phase"] == "writing"
+    assert running["progress"] == {"subchapters_done": 1, "subchapters_total": 3}
+    release.set()
+
+    job = wait_for(manager, job_id)
+    # LLM-Aufrufe des Jobs laufen als Batch-Aufrufe unter seiner ID
+    assert job["result"] == {"text": "Buch", "job_id": job_id, "request": (job_id, PRIORITY_BATCH, 1)}
+    assert job["finished_at"]
+    assert manager.list()[0]["job_id"] == job_id
+    assert "result" not in manager.list()[0]
+
+
+def test_failed_job_keeps_the_error():
+    manager = JobManager(max_workers=1)
+
+    def pipeline(job_id=None, progress=None):
+        raise RuntimeError("kaputt")
+
+    job = wait_for(manager, manager.submit(pipeline), status="failed")
+    assert job["error"] == "Fehler: kaputt"
+    assert job["result"] is None
+
+
+def test_running_job_cannot_be_submitted_twice():
+    manager = JobManager(max_workers=1)
+    release = threading.Event()
+    manager.submit(lambda job_id=None, progress=None: release.wait(2), job_id="buch")
+    with pytest.raises(ValueError):
+        manager.submit(lambda job_id=None, progress=None: None, job_id="buch")
+    release.set()
+    wait_for(manager, "buch")
+    # Abgeschlossene Jobs dürfen unter derselben ID erneut laufen, z. B. beim Fortsetzen
+    manager.submit(lambda job_id=None, progress=None: "erneut", job_id="buch")
+    assert wait_for(manager, "buch")["result"] == "erneut"
+
+
+def test_old_finished_jobs_are_dropped():
+    manager = JobManager(max_workers=1, max_finished=2)
+    job_ids = [manager.submit(lambda job_id=None, progress=None: None) for _ in range(4)]
+    wait_for(manager, job_ids[-1])
+    deadline = time.monotonic() + 2
+    while len(manager.list()) > 2:  # Aufgeräumt wird erst nach dem Abschluss
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    assert manager.get(job_ids[0]) is None
+    assert [job["job_id"] for job in manager.list()] == job_ids[2:]
+
+
+def test_generate_endpoint_returns_a_job_to_poll(monkeypatch):
+    pytest.importorskip("flask")
+    import agent
+    import backend
+
+    def run_agents(self, user_input, min_chapter=0, min_subchapter=0, evaluation_mode=None, progress=None,
+                   job_id=None):
+        progress("writing", step=4, total_steps=6)
+        return {"final_grade": 2.0, "input": user_input, "min_chapter": min_chapter}
+
+    monkeypatch.setattr(agent.AgentSystem, "run_agents", run_agents)
+    monkeypatch.setattr(backend, "jobs", JobManager(max_workers=1))
+    client = backend.app.test_client()
+
+    response = client.post("/api/generate", json={"user_input": "Ein Buch", "min_chapter": 3})
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    wait_for(backend.jobs, job_id)
+    job = client.get(f"/api/jobs/{job_id}").get_json()
+    assert job["result"] == {"final_grade": 2.0, "input": "Ein Buch", "min_chapter": 3}
+    assert job["phase"] == "writing"
+    assert [entry["job_id"] for entry in client.get("/api/jobs").get_json()] == [job_id]
+    assert client.get("/api/jobs/unbekannt").status_code == 404
@@ -0,0 +1,70 @@
+import time
+
+from llm_cache import ResponseCache, cache_key
+from ollama import LLMClient
+
+
+def test_cache_key_ignores_transport_fields():
+    payload = {"model": "m", "messages": [{"role": "user", "content": "Hallo"}], "temperature": 0}
+    transport = {"stream": True, "cache_prompt": True, "prompt_cache_key": "buch-1", "id_slot": 3}
+    assert cache_key(payload) == cache_key({**payload, **transport})
+
+
+def test_cache_key_covers_prompt_and_sampling():
+    payload = {"model": "m", "messages": [{"role": "user", "content": "Hallo"}], "temperature": 0}
+    assert cache_key(payload) != cache_key({**payload, "temperature": 0.7})
+    assert cache_key(payload) != cache_key({**payload, "model": "n"})
+    assert cache_key(payload) != cache_key({**payload, "messages": [{"role": "user", "content": "Hallo!"}]})
+    assert cache_key(payload) != cache_key({**payload, "mode": "verdict"})
+
+
+def test_key_order_does_not_matter():
+    assert cache_key({"a": 1, "b": {"c": 2, "d": 3}}) == cache_key({"b": {"d": 3, "c": 2}, "a": 1})
+
+
+def test_deterministic_answers_are_served_from_cache(stub_server):
+    client = LLMClient(url=stub_server.url, response_cache=ResponseCache(directory=None))
+    try:
+        first = client.complete("Fasse zusammen.", temperature=0, **client.prefix_cache_options("buch-1"))
+        # Anderer Prefix-Cache-Hinweis, gleiche Anfrage: kein zweiter Aufruf
+        second = client.complete("Fasse zusammen.", temperature=0, **client.prefix_cache_options("buch-2"))
+        assert first == second
+        assert stub_server.stats["requests"] == 1
+        client.complete("Fasse zusammen.", temperature=0.7)
+        client.complete("Fasse zusammen.", temperature=0.7)
+        assert stub_server.stats["requests"] == 3
+    finally:
+        client.close()
+
+
+def test_disk_cache_survives_a_new_instance(tmp_path):
+    ResponseCache(directory=str(tmp_path)).put("schluessel", "Antwort")
+    cache = ResponseCache(directory=str(tmp_path))
+    assert cache.get("schluessel") == "Antwort"
+    assert cache.stats["disk_hits"] == 1
+
+
+def test_expired_answers_are_not_used():
+    cache = ResponseCache(directory=None, ttl=0.01)
+    cache.put("schluessel", "Antwort")
+    time.sleep(0.02)
+    assert cache.get("schluessel") is None
+
+
+def test_invalid_disk_entries_are_removed(tmp_path):
+    for name, content in (("kaputt", "{"), ("unvollstaendig", '{"value": "Antwort"}'), ("liste", "[]")):
+        (tmp_path / f"{name}.json").write_text(content, encoding="utf-8")
+        assert ResponseCache(directory=str(tmp_path)).get(name) is None
+        assert not (tmp_path / f"{name}.json").exists()
+
+
+def test_entry_removed_while_reading_is_still_served(tmp_path, monkeypatch):
+    import llm_cache
+
+    ResponseCache(directory=str(tmp_path)).put("schluessel", "Antwort")
+
+    def utime(path):
+        raise FileNotFoundError(path)  # Ein anderer Prozess räumt den Cache gerade auf
+
+    monkeypatch.setattr(llm_cache.os, "utime", utime)
+    assert ResponseCache(directory=str(tmp_path)).get("schluessel") == "Antwort"
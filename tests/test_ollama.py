@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+import requests
+
+import ollama
+from ollama import VERDICT_MAX_TOKENS, LLMClient, OllamaLLM, get_llm_client, read_verdict, split_reason
+from scheduler import deadline_context
+
+
+def test_build_payload_contains_system_and_user_prompt():
+    client = LLMClient(url="http://127.0.0.1:9/v1/chat/completions", model="modell", system_prompt="System",
+                       cache_responses=False)
+    payload = client.build_payload("Hallo", max_tokens=5, temperature=None, stop=["\n"])
+    assert payload == {
+        "model": "modell",
+        "messages": [{"role": "system", "content": "System"}, {"role": "user", "content": "Hallo"}],
+        "max_tokens": 5,
+        "stream": False,
+        "stop": ["\n"]
+    }
+    client.close()
+
+
+def test_calls_reuse_one_connection(stub_server, llm_client):
+    for _ in range(20):
+        assert llm_client.complete("Hallo") == "Ja, das ist eine Antwort vom Stub-Server."
+    assert stub_server.stats["requests"] == 20
+    assert stub_server.stats["connections"] == 1
+
+
+def test_concurrent_calls_share_the_pool(stub_server):
+    stub_server.response_delay = 0.02
+    client = LLMClient(url=stub_server.url, pool_size=4, cache_responses=False)
+    try:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            answers = list(executor.map(lambda index: client.complete(f"Frage {index}"), range(64)))
+        assert answers == ["Ja, das ist eine Antwort vom Stub-Server."] * 64
+        # Der Scheduler begrenzt die gleichzeitigen Aufrufe, der Pool hält die Verbindungen offen
+        assert stub_server.stats["max_active"] <= 4
+        assert stub_server.stats["connections"] <= 4
+    finally:
+        client.close()
+
+
+def test_shared_client_is_created_once(monkeypatch):
+    monkeypatch.setattr(ollama, "_client", None)
+    barrier = threading.Barrier(8)
+
+    def get():
+        barrier.wait()
+        return get_llm_client()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: get(), range(8)))
+    assert all(client is clients[0] for client in clients)
+    assert OllamaLLM().client is clients[0]
+    clients[0].close()
+
+
+def test_connection_errors_are_returned_as_text():
+    # Auf Port 9 (discard) lauscht kein Server
+    client = LLMClient(url="http://127.0.0.1:9/v1/chat/completions", connect_timeout=1, cache_responses=False)
+    try:
+        assert OllamaLLM(client)._call("Hallo").startswith("Fehler bei der Verbindung zu LM Studio")
+    finally:
+        client.close()
+
+
+def test_read_verdict_stops_after_ja():
+    consumed = []
+
+    def chunks():
+        for chunk in ["J", "a", ", das", " passt", " sehr", " gut."]:
+            consumed.append(chunk)
+            yield chunk
+
+    assert read_verdict(chunks()) == ("Ja", "Ja, das")
+    assert consumed == ["J", "a", ", das"]
+
+
+def test_read_verdict_reads_the_reason_after_nein():
+    assert read_verdict(["Nein", ". Zu", " kurz."]) == ("Nein", "Nein. Zu kurz.")
+    assert read_verdict(["Nein", ". Zu", " kurz."], read_reason=False) == ("Nein", "Nein. Zu")
+
+
+def test_read_verdict_accepts_markup_and_rejects_other_words():
+    assert read_verdict(['**Antwort:** "Ja"'])[0] == "Ja"
+    assert read_verdict(["1. Nein, weil"])[0] == "Nein"
+    assert read_verdict(["Jahr 1900 war es"])[0] is None
+    assert read_verdict(["Vielleicht"])[0] is None
+
+
+def test_split_reason():
+    assert split_reason("Nein. Der Text ist zu kurz.") == "Der Text ist zu kurz."
+    assert split_reason("Ohne Urteil.") == "Ohne Urteil."
+
+
+def test_verdict_stops_the_stream_after_ja(stub_server):
+    stub_server.answer = lambda payload: "Ja " + " ".join(["Begründung"] * 200)
+    stub_server.token_delay = 0.002
+    client = LLMClient(url=stub_server.url, cache_responses=False)
+    try:
+        result = client.verdict("Ist das richtig?")
+        assert result["approved"] is True
+        assert stub_server.stats["streamed_tokens"] < 50
+    finally:
+        client.close()
+
+
+def test_verdict_without_reason_is_capped(stub_server):
+    payloads = []
+
+    def answer(payload):
+        payloads.append(payload)
+        return "Nein"
+
+    stub_server.answer = answer
+    client = LLMClient(url=stub_server.url, cache_responses=False)
+    try:
+        result = client.verdict("Ist eine Suche nötig?", with_reason=False)
+        assert result == {"approved": False, "verdict": "Nein", "reason": "", "raw": "Nein"}
+        assert payloads[0]["max_tokens"] == VERDICT_MAX_TOKENS
+        assert payloads[0]["temperature"] == 0
+    finally:
+        client.close()
+
+
+def test_deadline_ends_a_slow_request(stub_server):
+    stub_server.response_delay = 1.0
+    client = LLMClient(url=stub_server.url, cache_responses=False)
+    try:
+        start = time.monotonic()
+        with deadline_context(0.2):
+            with pytest.raises(requests.exceptions.Timeout):
+                client.complete("Bewerte das Buch.")
+        assert time.monotonic() - start < 0.8
+        assert client.scheduler.snapshot()["active"] == 0
+    finally:
+        client.close()
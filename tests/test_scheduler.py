@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import (PRIORITY_BATCH, PRIORITY_INTERACTIVE, LLMScheduler, deadline_context, remaining_time,
+                       request_context)
+
+
+def queue_call(scheduler, order, job_id, priority=PRIORITY_BATCH, weight=1):
+    """Starts a thread that waits for a slot, records its job and frees the slot again."""
+    def call():
+        with request_context(job_id, priority, weight):
+            scheduler.acquire()
+            order.append(job_id)
+            scheduler.release()
+
+    waiting = sum(scheduler.snapshot()["waiting"].values())
+    thread = threading.Thread(target=call, daemon=True)
+    thread.start()
+    # Erst weiter, wenn der Aufruf eingereiht ist, damit die Reihenfolge feststeht
+    deadline = time.monotonic() + 2
+    while sum(scheduler.snapshot()["waiting"].values()) == waiting:
+        assert time.monotonic() < deadline, "Aufruf wurde nicht eingereiht"
+        time.sleep(0.001)
+    return thread
+
+
+def run_queued(scheduler, calls):
+    """Queues the calls behind a held slot, frees the slot and returns the order the calls were started in."""
+    order = []
+    scheduler.acquire()
+    threads = [queue_call(scheduler, order, *call) for call in calls]
+    scheduler.release()
+    for thread in threads:
+        thread.join(timeout=2)
+    return order
+
+
+def test_free_slot_is_taken_without_queueing():
+    scheduler = LLMScheduler(max_concurrent=2)
+    scheduler.acquire()
+    scheduler.acquire()
+    assert scheduler.snapshot()["active"] == 2
+    assert scheduler.stats["queued"] == 0
+    scheduler.release()
+    scheduler.release()
+    assert scheduler.snapshot()["active"] == 0
+
+
+def test_jobs_take_turns():
+    scheduler = LLMScheduler(max_concurrent=1)
+    order = run_queued(scheduler, [("a",), ("a",), ("a",), ("b",), ("b",), ("b",)])
+    assert order == ["a", "b", "a", "b", "a", "b"]
+
+
+def test_weight_allows_several_calls_per_turn():
+    scheduler = LLMScheduler(max_concurrent=1)
+    order = run_queued(scheduler, [
+        ("a", PRIORITY_BATCH, 2), ("a", PRIORITY_BATCH, 2), ("a", PRIORITY_BATCH, 2),
+        ("b",), ("b",), ("b",)
+    ])
+    assert order == ["a", "a", "b", "a", "b", "b"]
+
+
+def test_interactive_calls_overtake_queued_batch_calls():
+    scheduler = LLMScheduler(max_concurrent=1)
+    order = run_queued(scheduler, [("a",), ("a",), ("b",), ("chat", PRIORITY_INTERACTIVE)])
+    assert order == ["chat", "a", "b", "a"]
+
+
+def test_expired_deadline_leaves_the_queue():
+    scheduler = LLMScheduler(max_concurrent=1)
+    scheduler.acquire()
+    with deadline_context(0.05):
+        with pytest.raises(TimeoutError):
+            scheduler.acquire()
+    snapshot = scheduler.snapshot()
+    assert snapshot["active"] == 1
+    assert sum(snapshot["waiting"].values()) == 0
+    assert snapshot["timeouts"] == 1
+    scheduler.release()
+    assert scheduler.snapshot()["active"] == 0
+
+
+def test_nested_deadline_keeps_the_earlier_one():
+    assert remaining_time() is None
+    with deadline_context(1):
+        with deadline_context(60):
+            assert remaining_time() <= 1
+    assert remaining_time() is None
@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("chromadb")
+
+
+@pytest.fixture
+def systems(vectorstore, llm_client):
+    from agent import AgentSystem
+
+    first, second = AgentSystem(vectorstore), AgentSystem(vectorstore)
+    for system, topic in ((first, "Dampfmaschine"), (second, "Apfelkuchen")):
+        system.store_context("Synopsis", f"Ein Buch über die {topic}.")
+        system.store_context(f"{topic} 1", f"Text über die {topic}.", kind="subchapter", chapter=1, subchapter="1.1")
+        system.store_context("Failed Summary Validation", f"Rückmeldung zur {topic}.")
+    return first, second
+
+
+def test_reads_only_see_the_own_session(systems):
+    first, second = systems
+    assert "Dampfmaschine" in first.get_context()
+    assert "Apfelkuchen" not in first.get_context()
+    assert "Apfelkuchen" not in first.query_context("Apfelkuchen")
+    assert "Apfelkuchen" in second.query_context("Apfelkuchen")
+    assert len(first.validate_saved_data()) == 3
+
+
+def test_compact_removes_only_the_own_entries(systems, vectorstore):
+    first, second = systems
+    first.compact("feedback")
+    assert "Rückmeldung" not in first.get_context()
+    assert "Rückmeldung zur Apfelkuchen" in second.get_context()
+    assert vectorstore.count() == 5
+
+
+def test_sessions_are_listed_and_deleted(systems):
+    from storage import delete_session, list_sessions
+
+    first, second = systems
+    assert {session["session_id"]: session["documents"] for session in list_sessions()} == {
+        first.session_id: 3, second.session_id: 3
+    }
+    assert delete_session(first.session_id) == 3
+    assert [session["session_id"] for session in list_sessions()] == [second.session_id]
+    assert "Dampfmaschine" not in first.get_context()
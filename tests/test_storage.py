@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import pytest
+
+from storage import WRITE_MAX_RETRIES, BufferedCollection, DocumentIdAllocator, next_document_id
+
+
+class FakeCollection:
+    """Records the upserts of a BufferedCollection; fails while `failing` is set."""
+
+    def __init__(self, failing=0):
+        self.failing = failing  # Anzahl der folgenden upserts, die fehlschlagen
+        self.upserts = []
+        self.attempts = 0
+
+    def upsert(self, **batch):
+        self.attempts += 1
+        if self.failing:
+            self.failing -= 1
+            raise ConnectionError("Chroma nicht erreichbar")
+        self.upserts.append(batch)
+
+    def get(self, **kwargs):
+        return {"ids": [id_ for batch in self.upserts for id_ in batch["ids"]]}
+
+
+def wait_until(condition, timeout=2.0):
+    """Polls until condition() is true or the timeout has passed."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Bedingung nicht erfüllt"
+        time.sleep(0.005)
+
+
+def test_document_ids_are_unique_and_ordered():
+    allocator = DocumentIdAllocator()
+    ids = [allocator.next_id() for _ in range(100)]
+    assert len(set(ids)) == 100
+    assert ids == sorted(ids)
+
+
+def test_document_ids_are_unique_across_threads_and_processes():
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        ids = list(executor.map(lambda _: next_document_id(), range(1000)))
+    assert len(set(ids)) == 1000
+    # Ein zweiter Prozess hat ein anderes Präfix
+    assert DocumentIdAllocator().prefix != DocumentIdAllocator().prefix
+
+
+def test_flush_writes_the_buffer_in_one_upsert():
+    collection = FakeCollection()
+    buffer = BufferedCollection(collection, batch_size=10, flush_interval=None)
+    buffer.add(["a", "b"], ["1", "2"], [{"kind": "synopsis"}, {"kind": "outline"}])
+    buffer.add(["c"], ["3"])
+    assert collection.upserts == []
+    assert buffer.flush() == 3
+    assert collection.upserts == [{
+        "ids": ["1", "2", "3"],
+        "documents": ["a", "b", "c"],
+        "metadatas": [{"kind": "synopsis"}, {"kind": "outline"}, {}]
+    }]
+    assert buffer.flush() == 0
+
+
+def test_full_batch_is_written_immediately():
+    collection = FakeCollection()
+    buffer = BufferedCollection(collection, batch_size=2, flush_interval=None)
+    buffer.add(["a"], ["1"])
+    buffer.add(["b"], ["2"])
+    assert [batch["ids"] for batch in collection.upserts] == [["1", "2"]]
+
+
+def test_flush_interval_writes_in_the_background():
+    collection = FakeCollection()
+    buffer = BufferedCollection(collection, batch_size=10, flush_interval=0.01)
+    buffer.add(["a"], ["1"])
+    wait_until(lambda: collection.upserts)
+    assert collection.upserts[0]["ids"] == ["1"]
+
+
+def test_failed_flush_keeps_the_documents_in_order():
+    collection = FakeCollection(failing=1)
+    buffer = BufferedCollection(collection, batch_size=10, flush_interval=None)
+    buffer.add(["a", "b"], ["1", "2"])
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+    assert buffer.pending["ids"] == ["1", "2"]
+    assert buffer.stats["failed"] == 2
+    buffer.add(["c"], ["3"])
+    assert buffer.flush() == 3
+    assert collection.upserts[0]["ids"] == ["1", "2", "3"]
+    assert buffer.failures == 0
+
+
+def test_background_retries_are_bounded():
+    collection = FakeCollection(failing=WRITE_MAX_RETRIES)
+    buffer = BufferedCollection(collection, batch_size=1, flush_interval=0.01)
+    buffer.add(["a"], ["1"])
+    wait_until(lambda: buffer.failures == WRITE_MAX_RETRIES)
+    time.sleep(0.05)
+    # Nach WRITE_MAX_RETRIES Fehlversuchen wird nicht weiter automatisch geschrieben
+    assert collection.attempts == WRITE_MAX_RETRIES
+    assert buffer.timer is None
+    assert buffer.pending["ids"] == ["1"]
+    # Der nächste Lesezugriff schreibt die gepufferten Dokumente
+    assert buffer.flush() == 1
+    assert collection.upserts[0]["ids"] == ["1"]
+
+
+def test_reads_see_buffered_documents():
+    collection = FakeCollection()
+    buffer = BufferedCollection(collection, batch_size=10, flush_interval=None)
+    buffer.add(["a"], ["1"])
+    assert buffer.get()["ids"] == ["1"]
+
+
+def test_reads_report_a_failed_write():
+    buffer = BufferedCollection(FakeCollection(failing=1), batch_size=10, flush_interval=None)
+    buffer.add(["a"], ["1"])
+    with pytest.raises(ConnectionError):
+        buffer.get()
+    assert buffer.get()["ids"] == ["1"]
+def test_embeddings_are_plain_floats():
+    numpy = pytest.importorskip("numpy")
+
+    def embedding_function(texts):
+        # Wie die Embedding-Funktionen von Chroma: numpy-Arrays
+        return [numpy.array([len(text), 0.5], dtype=numpy.float32) for text in texts]
+
+    collection = FakeCollection()
+    buffer = BufferedCollection(collection, embedding_function=embedding_function, batch_size=10,
+                                flush_interval=None)
+    buffer.add(["abc"], ["1"])
+    buffer.add(["nur Metadaten"], ["2"], embed=False)
+    buffer.flush()
+    embeddings = collection.upserts[0]["embeddings"]
+    assert embeddings == [[3.0, 0.5], [0.0, 0.0]]
+    assert all(type(value) is float for vector in embeddings for value in vector)
+    assert buffer.stats["not_embedded"] == 1
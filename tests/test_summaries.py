@@ -0,0 +1,101 @@
+import pytest
+
+from summaries import RollingSummaries, summarize_book
+
+
+CHAPTERS = [
+    {"Number": number, "Title": f"Kapitel {number}", "Subchapters": [
+        {"Number": f"{number}.{index}", "Title": f"Unterkapitel {number}.{index}", "Content": f"Text {number}.{index}"}
+        for index in (1, 2)
+    ]}
+    for number in (1, 2)
+]
+
+
+@pytest.fixture
+def prompts(stub_server, llm_client):
+    """The prompts sent to the stub server, which numbers its answers."""
+    sent = []
+
+    def answer(payload):
+        sent.append(payload["messages"][-1]["content"])
+        return f"Zusammenfassung {len(sent)}"
+
+    stub_server.answer = answer
+    return sent
+
+
+def test_update_builds_the_summary_of_the_own_chapter(prompts):
+    summaries = RollingSummaries()
+    chapter = CHAPTERS[0]
+    summaries.update(chapter, chapter["Subchapters"][0], "Text 1.1")
+    summaries.update(chapter, chapter["Subchapters"][1], "Text 1.2")
+
+    assert summaries.subchapter_summary(1, "1.1") == "Zusammenfassung 1"
+    assert summaries.subchapter_summary(1, "1.2") == "Zusammenfassung 3"
+    # Die Kapitelzusammenfassung wird fortgeschrieben statt neu berechnet
+    assert "Zusammenfassung 2" in prompts[3]
+    assert summaries.context(1) == "Bisheriger Inhalt von Kapitel 1 - Kapitel 1:\nZusammenfassung 4"
+    # Parallel geschriebene Kapitel sehen nur ihre eigene Zusammenfassung
+    assert summaries.context(2) == ""
+
+
+def test_snapshot_restores_a_copy(prompts):
+    summaries = RollingSummaries()
+    summaries.update(CHAPTERS[0], CHAPTERS[0]["Subchapters"][0], "Text 1.1")
+    state = summaries.snapshot()
+
+    restored = RollingSummaries(state)
+    assert restored.snapshot() == state
+    restored.discard(["1/1.1"])
+    assert "1.1" in state["chapters"]["1"]["subchapters"]
+    # Ältere Snapshots mit laufender Buchzusammenfassung werden weiterhin gelesen
+    assert RollingSummaries({**state, "book": "Alt", "book_chapters": ["1"]}).snapshot() == state
+
+
+def test_book_summary_reuses_the_subchapter_summaries(prompts):
+    summaries = RollingSummaries({"chapters": {
+        str(chapter["Number"]): {"title": chapter["Title"], "summary": "", "subchapters": {
+            subchapter["Number"]: f"Bekannt {subchapter['Number']}" for subchapter in chapter["Subchapters"]
+        }}
+        for chapter in CHAPTERS
+    }})
+
+    assert summarize_book({"Chapters": CHAPTERS}, summaries=summaries, max_workers=2) == "Zusammenfassung 3"
+    # Nur zwei Kapitel und das Buch werden zusammengeführt, kein Unterkapitel erneut zusammengefasst
+    assert len(prompts) == 3
+    assert all("Text 1.1" not in prompt for prompt in prompts)
+    assert any("Bekannt 2.2" in prompt for prompt in prompts)
+
+
+def test_discard_rebuilds_from_the_earlier_subchapters(prompts):
+    numbers = [f"1.{index}" for index in range(1, 12)]
+    summaries = RollingSummaries({"chapters": {"1": {
+        "title": "Kapitel 1",
+        "summary": "Alles bis 1.11",
+        "subchapters": {number: f"Inhalt {number} " + "Wort " * 30 for number in numbers}
+    }}})
+
+    summaries.discard(["1/1.11", "1/1.3", "1/9.9"])
+    state = summaries.chapter_state(1)
+    # Nur 1.1 und 1.2 liegen vor dem ersten verworfenen Unterkapitel, jedes erhält die Hälfte der Wörter
+    assert state["covered"] == ["1.1", "1.2"]
+    assert state["summary"] == "\n".join(f"Inhalt {number} " + " ".join(["Wort"] * 30) for number in ("1.1", "1.2"))
+    assert "1.3" not in state["subchapters"] and "1.11" not in state["subchapters"]
+    assert not prompts
+
+    # Beibehaltene spätere Unterkapitel werden ohne neue Zusammenfassung ihres Textes wieder aufgenommen
+    chapter = {"Number": 1, "Title": "Kapitel 1"}
+    summaries.update(chapter, {"Number": "1.3", "Title": "Neu"}, "Neuer Text 1.3")
+    summaries.update(chapter, {"Number": "1.4", "Title": "Alt"}, "Alter Text 1.4")
+    summaries.update(chapter, {"Number": "1.1", "Title": "Alt"}, "Alter Text 1.1")
+    assert len(prompts) == 3  # 1.3 zusammenfassen und einordnen, 1.4 nur einordnen
+    assert "Neuer Text 1.3" in prompts[0]
+    assert "Inhalt 1.4" in prompts[2]
+    assert summaries.chapter_state(1)["covered"] == ["1.1", "1.2", "1.3", "1.4"]
+
+
+def test_number_sort_key_orders_numerically():
+    from summaries import number_sort_key
+
+    assert sorted(["1.10", "1.2", "2", "1.1", "10.1"], key=number_sort_key) == ["1.1", "1.2", "1.10", "2", "10.1"]
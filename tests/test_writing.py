@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+
+OUTLINE = {
+    "Chapters": [
+        {"Number": number, "Title": f"Kapitel {number}", "Subchapters": [
+            {"Number": f"{number}.{index}", "Title": f"Unterkapitel {number}.{index}"} for index in (1, 2)
+        ]}
+        for number in (1, 2, 3, 4)
+    ]
+}
+
+
+@pytest.fixture
+def agent(llm_client):
+    import agent
+
+    return agent
+
+
+def test_chapters_are_written_concurrently_and_reassembled_in_order(agent, monkeypatch):
+    lock = threading.Lock()
+    active = {"now": 0, "max": 0}
+    order = {}
+
+    def write_subchapter(user_input, chapter, subchapter, summaries=None):
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+            order.setdefault(chapter["Number"], []).append(subchapter["Number"])
+        time.sleep(0.05 / chapter["Number"])  # Spätere Kapitel werden zuerst fertig
+        with lock:
+            active["now"] -= 1
+        return {"details": [subchapter["Number"]], "subchapter": {**subchapter, "Content": subchapter["Number"]}}
+
+    monkeypatch.setattr(agent, "write_subchapter", write_subchapter)
+    progress = []
+    result = agent.writing_agent("Ein Buch", OUTLINE, max_workers=2,
+                                 progress=lambda **details: progress.append(details["subchapters_done"]))
+
+    assert result["log"]["status"] == "completed"
+    assert [chapter["Number"] for chapter in result["output"]["Chapters"]] == [1, 2, 3, 4]
+    assert [
+        subchapter["Content"] for chapter in result["output"]["Chapters"] for subchapter in chapter["Subchapters"]
+    ] == ["1.1", "1.2", "2.1", "2.2", "3.1", "3.2", "4.1", "4.2"]
+    assert result["log"]["details"] == ["1.1", "1.2", "2.1", "2.2", "3.1", "3.2", "4.1", "4.2"]
+    # Kapitel parallel, höchstens max_workers gleichzeitig, Unterkapitel eines Kapitels nacheinander
+    assert active["max"] == 2
+    assert all(numbers == sorted(numbers) for numbers in order.values())
+    assert progress == list(range(9))  # Fortlaufend, obwohl mehrere Kapitel gleichzeitig fertig werden
+
+
+def test_failed_subchapter_is_left_out(agent, monkeypatch):
+    def write_subchapter(user_input, chapter, subchapter, summaries=None):
+        if subchapter["Number"] == "2.1":
+            return {"details": ["Fehler"], "subchapter": None}
+        return {"details": [], "subchapter": {**subchapter, "Content": subchapter["Number"]}}
+
+    monkeypatch.setattr(agent, "write_subchapter", write_subchapter)
+    result = agent.writing_agent("Ein Buch", OUTLINE)
+    assert [subchapter["Number"] for subchapter in result["output"]["Chapters"][1]["Subchapters"]] == ["2.2"]
+
+
+def test_subchapter_context_adds_matching_search_results(agent, vectorstore):
+    from summaries import RollingSummaries
+
+    system = agent.AgentSystem(vectorstore)
+    system.store_context("Synopsis", "Ein Buch über die Dampfmaschine.")
+    system.store_context("Search Results", {"query": "Dampfmaschine Watt", "results": ["James Watt, 1769"]})
+    system.store_context("Kapitel 2", "Text aus Kapitel 2.", kind="subchapter", chapter=2, subchapter="2.1")
+    summaries = RollingSummaries({"chapters": {"1": {
+        "title": "Kapitel 1", "summary": "Bisher ging es um Kohle.", "subchapters": {"1.1": "Kohle."}
+    }}})
+
+    token = agent.active_agent_system.set(system)
+    try:
+        context = agent.subchapter_context(
+            OUTLINE["Chapters"][0], {"Number": "1.2", "Title": "Dampfmaschine von Watt"}, summaries
+        )
+    finally:
+        agent.active_agent_system.reset(token)
+    assert "Ein Buch über die Dampfmaschine." in context
+    assert "James Watt, 1769" in context
+    assert "Bisher ging es um Kohle." in context
+    # Unterkapitel anderer Kapitel entstehen parallel und gehören nicht in den Kontext
+    assert "Text aus Kapitel 2." not in context